@@ -0,0 +1,201 @@
+"""
+Асинхронные представления API.
+
+Работают только под ASGI (config/asgi.py) и не занимают поток на каждое
+подключение.
+"""
+import asyncio
+import json
+
+from django.conf import settings
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import APIException, NotAuthenticated
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from orders.events import hub
+from orders.models import Order
+from .filters import OrderFilter
+from .serializers import OrderReadSerializer
+from .views import OrderViewSet, RevenueReportAPIView
+
+KEEPALIVE_INTERVAL = 15
+
+
+def denied(view, error):
+    response = api_response({'detail': error.detail}, status=error.status_code)
+    authenticate_header = view.get_authenticate_header(view.request)
+    if isinstance(error, NotAuthenticated) and authenticate_header:
+        response['WWW-Authenticate'] = authenticate_header
+    return response
+
+
+def check_access(request, view_class, action=None):
+    """
+    Аутентификация и проверка прав так же, как в синхронном представлении
+    view_class (для ViewSet — в его действии action). Возвращает
+    (представление, None) или (представление, ответ с ошибкой).
+    """
+    view = view_class()
+    view.action = action
+    view.action_map = {request.method.lower(): action}
+    view.args, view.kwargs = (), {}
+    view.format_kwarg = None
+    view.request = view.initialize_request(request)
+    try:
+        view.check_permissions(view.request)
+    except APIException as error:
+        return view, denied(view, error)
+    return view, None
+
+
+async def authorize(request, view_class, action=None):
+    return await sync_to_async(check_access)(request, view_class, action)
+
+
+def api_response(data, status=200):
+    """JSON-ответ с теми же правилами кодирования, что и у DRF."""
+    return JsonResponse(
+        data, status=status, encoder=JSONEncoder, safe=False,
+        json_dumps_params={'ensure_ascii': False}
+    )
+
+
+def page_link(request, number):
+    url = request.build_absolute_uri()
+    if number == 1:
+        return remove_query_param(url, 'page')
+    return replace_query_param(url, 'page', number)
+
+
+def format_event(event):
+    return (
+        f'id: {event.get("change_seq", "")}\n'
+        f'event: {event["event"]}\n'
+        f'data: {json.dumps(event, ensure_ascii=False)}\n\n'
+    )
+
+
+async def event_stream(table_number=None, location=None):
+    subscription = hub.subscribe(location)
+    try:
+        yield 'retry: 3000\n\n'
+        while True:
+            if subscription.overflowed:
+                subscription.drain()
+                yield 'event: resync\ndata: {}\n\n'
+                continue
+            try:
+                event = await subscription.get(KEEPALIVE_INTERVAL)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            if table_number and event.get('table_number') != table_number:
+                continue
+            yield format_event(event)
+    finally:
+        hub.unsubscribe(subscription)
+
+
+@require_GET
+async def order_events(request):
+    """
+    Поток Server-Sent Events об изменениях заказов для кухни и официантов.
+
+    События: order_created, status_changed, lines_changed, order_deleted.
+    Поток содержит события только кафе запроса (LocationMiddleware).
+    Параметр table_number ограничивает поток одним столом. Событие resync
+    означает, что клиент отстал и должен догнать состояние через
+    /api/v1/orders/changes/.
+    """
+    _, error = await authorize(request, OrderViewSet, 'list')
+    if error is not None:
+        return error
+    try:
+        table_number = int(request.GET.get('table_number') or 0)
+    except ValueError:
+        return JsonResponse(
+            {'error': 'Неверный номер стола'}, status=400
+        )
+    response = StreamingHttpResponse(
+        event_stream(table_number, getattr(request, 'location', None)),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@require_GET
+async def order_list(request):
+    """
+    Асинхронный аналог GET /api/v1/orders/.
+
+    Поддерживает те же фильтры, сортировку по id и постраничный вывод.
+    """
+    _, error = await authorize(request, OrderViewSet, 'list')
+    if error is not None:
+        return error
+    filterset = OrderFilter(
+        request.GET,
+        queryset=Order.objects.prefetch_related('order_items__dish')
+    )
+    if not filterset.is_valid():
+        return api_response(filterset.errors, status=400)
+    queryset = filterset.qs
+    if request.GET.get('ordering') in ('id', '-id'):
+        queryset = queryset.order_by(request.GET['ordering'])
+    try:
+        number = int(request.GET.get('page', 1))
+    except ValueError:
+        number = 0
+    page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+    count = await queryset.acount()
+    if number < 1 or (number - 1) * page_size >= max(count, 1):
+        return api_response({'detail': 'Неправильная страница'}, status=404)
+    offset = (number - 1) * page_size
+    orders = [
+        order async for order in queryset[offset:offset + page_size]
+        .aiterator(chunk_size=page_size)
+    ]
+    return api_response({
+        'count': count,
+        'next': (
+            page_link(request, number + 1)
+            if offset + page_size < count else None
+        ),
+        'previous': page_link(request, number - 1) if number > 1 else None,
+        'results': OrderReadSerializer(orders, many=True).data,
+    })
+
+
+@require_GET
+async def order_detail(request, pk):
+    """Асинхронный аналог GET /api/v1/orders/{id}/."""
+    view, error = await authorize(request, OrderViewSet, 'retrieve')
+    if error is not None:
+        return error
+    try:
+        order = await Order.objects.prefetch_related(
+            'order_items__dish'
+        ).aget(pk=pk)
+    except Order.DoesNotExist:
+        return api_response(
+            {'detail': 'No Order matches the given query.'}, status=404
+        )
+    try:
+        view.check_object_permissions(view.request, order)
+    except APIException as error:
+        return denied(view, error)
+    return api_response(OrderReadSerializer(order).data)
+
+
+@require_GET
+async def revenue_report(request):
+    """Асинхронный аналог GET /api/v1/revenue/."""
+    _, error = await authorize(request, RevenueReportAPIView)
+    if error is not None:
+        return error
+    return api_response({'total_revenue': await Order.objects.arevenue()})
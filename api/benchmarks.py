@@ -0,0 +1,230 @@
+"""
+Микробенчмарки горячих участков: сериализаторы, пересчёт суммы заказа,
+фильтр и проверка прав.
+
+Каждый бенчмарк — функция, которая готовит данные и возвращает
+вызываемый объект для замера. Данные создаются в транзакции, которая
+откатывается после прогона.
+
+Время запуска воркера замеряется отдельно, в новых процессах
+(measure_startup).
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from decimal import Decimal
+
+from django.db import transaction
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from orders.models import CustomUser, Dish, Order, OrderItem
+from .filters import OrderFilter
+from .permissions import CustomOrderPermission
+from .serializers import OrderReadSerializer, OrderWriteSerializer
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def decorator(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return decorator
+
+
+def create_menu(size):
+    return Dish.objects.bulk_create([
+        Dish(name=f'Бенчмарк {number}', price=Decimal('150.00'))
+        for number in range(size)
+    ])
+
+
+def create_orders(count, lines):
+    dishes = create_menu(lines)
+    orders = Order.objects.bulk_create([
+        Order(table_number=number % 50 + 1) for number in range(count)
+    ])
+    OrderItem.objects.bulk_create([
+        OrderItem(
+            order=order, dish=dish, quantity=2,
+            unit_price=dish.price, line_total=dish.price * 2,
+        )
+        for order in orders for dish in dishes
+    ])
+    return orders
+
+
+@benchmark('serializer.order_read')
+def order_read_serializer(size):
+    orders = list(Order.objects.filter(
+        pk__in=[order.pk for order in create_orders(size, 5)]
+    ).prefetch_related('order_items__dish'))
+    return lambda: OrderReadSerializer(orders, many=True).data
+
+
+@benchmark('serializer.order_write_is_valid')
+def order_write_is_valid(size):
+    data = {
+        'table_number': 7,
+        'order_items': [
+            {'dish_id': dish.pk, 'quantity': 1}
+            for dish in create_menu(size)
+        ],
+    }
+    return lambda: OrderWriteSerializer(data=data).is_valid(
+        raise_exception=True
+    )
+
+
+@benchmark('serializer.order_write_save')
+def order_write_save(size):
+    data = {
+        'table_number': 7,
+        'order_items': [
+            {'dish_id': dish.pk, 'quantity': 1}
+            for dish in create_menu(size)
+        ],
+    }
+
+    def run():
+        serializer = OrderWriteSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+    return run
+
+
+@benchmark('model.recalc_total')
+def recalc_total(size):
+    order = create_orders(1, size)[0]
+    return order.recalc_total
+
+
+@benchmark('filter.order_queryset')
+def order_filter(size):
+    queryset = Order.objects.all()
+    params = {'table_number': '7', 'status': Order.PENDING}
+    return lambda: str(OrderFilter(params, queryset=queryset).qs.query)
+
+
+@benchmark('permission.has_permission')
+def has_permission(size):
+    factory = APIRequestFactory()
+    user = CustomUser(username='benchmark', role=CustomUser.WAITER)
+    permission = CustomOrderPermission()
+    view = type('View', (), {'action': 'change_status'})()
+    requests = []
+    for method in ('get', 'post', 'patch', 'delete'):
+        request = Request(getattr(factory, method)('/api/v1/orders/'))
+        request.user = user
+        requests.append(request)
+
+    def run():
+        for request in requests:
+            permission.has_permission(request, view)
+    return run
+
+
+def measure(func, iterations, warmup):
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return summarize(timings)
+
+
+def summarize(timings):
+    timings = sorted(timings)
+    return {
+        'iterations': len(timings),
+        'median_ms': statistics.median(timings) * 1000,
+        'mean_ms': statistics.fmean(timings) * 1000,
+        'p95_ms': timings[int(0.95 * (len(timings) - 1))] * 1000,
+        'min_ms': timings[0] * 1000,
+    }
+
+
+STARTUP_SCRIPT = """
+import json
+import sys
+import time
+
+started = time.perf_counter()
+from config.wsgi import application
+timings = {'import': time.perf_counter() - started}
+from wsgiref.util import setup_testing_defaults
+
+for number, path in enumerate(sys.argv[1:]):
+    for attempt in ('first', 'second'):
+        environ = {'PATH_INFO': path}
+        setup_testing_defaults(environ)
+        begun = time.perf_counter()
+        response = application(environ, lambda status, headers: None)
+        b''.join(response)
+        response.close()
+        timings[f'{path} {attempt}'] = time.perf_counter() - begun
+        if not number and attempt == 'first':
+            timings['first_response'] = time.perf_counter() - started
+print(json.dumps(timings))
+"""
+
+
+def measure_startup(paths, runs, warmup, directory):
+    """
+    Запускает runs новых процессов, импортирующих config.wsgi, и замеряет
+    время запуска интерпретатора, импорта приложения, первого ответа и
+    первого и повторного запроса к каждому пути.
+    """
+    env = {
+        **os.environ, 'DJANGO_SETTINGS_MODULE': 'config.settings',
+        'WARMUP_ON_STARTUP': str(warmup),
+    }
+    timings = {}
+    for _ in range(runs):
+        started = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, '-c', STARTUP_SCRIPT, *paths], cwd=directory,
+            env=env, capture_output=True, text=True, check=True
+        ).stdout
+        timings.setdefault('process', []).append(
+            time.perf_counter() - started
+        )
+        for name, elapsed in json.loads(output.splitlines()[-1]).items():
+            timings.setdefault(name, []).append(elapsed)
+    return {
+        f'startup.{name}': summarize(values)
+        for name, values in timings.items()
+    }
+
+
+def run_benchmarks(names, iterations, warmup, size):
+    """Прогоняет бенчмарки, не оставляя данных в базе."""
+    results = {}
+    for name in names:
+        with transaction.atomic():
+            func = BENCHMARKS[name](size)
+            results[name] = measure(func, iterations, warmup)
+            transaction.set_rollback(True)
+    return results
+
+
+def compare(baseline, current, threshold):
+    """
+    Сравнивает медианы; возвращает строки (имя, было, стало, изменение %,
+    регрессия ли).
+    """
+    rows = []
+    for name, result in sorted(current.items()):
+        if name not in baseline:
+            continue
+        before = baseline[name]['median_ms']
+        after = result['median_ms']
+        change = (after / before - 1) * 100 if before else 0.0
+        rows.append((name, before, after, change, change > threshold))
+    return rows
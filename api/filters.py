@@ -1,6 +1,6 @@
 from django_filters import rest_framework as filters
 
-from orders.models import Order
+from orders.models import ArchivedOrder, Order
 
 
 class OrderFilter(filters.FilterSet):
@@ -15,3 +15,19 @@ class OrderFilter(filters.FilterSet):
     class Meta:
         model = Order
         fields = ['table_number', 'status']
+
+
+class ArchivedOrderFilter(filters.FilterSet):
+    """Фильтр для архива заказов."""
+
+    table_number = filters.NumberFilter(field_name='table_number')
+    created_after = filters.IsoDateTimeFilter(
+        field_name='created_at', lookup_expr='gte'
+    )
+    created_before = filters.IsoDateTimeFilter(
+        field_name='created_at', lookup_expr='lt'
+    )
+
+    class Meta:
+        model = ArchivedOrder
+        fields = ['table_number', 'created_after', 'created_before']
@@ -0,0 +1,151 @@
+"""
+Поддержка заголовка Idempotency-Key для небезопасных действий API.
+
+Первый запрос с ключом занимает его и выполняется; ответ сохраняется и
+отдаётся на повторы без повторного выполнения. Ключ привязан к
+пользователю и кафе, хранится IDEMPOTENCY_KEY_TTL секунд, а всего
+хранится не более IDEMPOTENCY_MAX_KEYS ключей.
+
+Ключи лежат в БД кафе рядом с заказами, и ответ сохраняется в одной
+транзакции с изменениями запроса: сбой между ними не оставит выполненный
+запрос без сохранённого ответа.
+"""
+import hashlib
+import json
+import random
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, router, transaction
+from django.utils import timezone
+from rest_framework.response import Response
+from rest_framework.status import (
+    HTTP_400_BAD_REQUEST,
+    HTTP_409_CONFLICT,
+    HTTP_422_UNPROCESSABLE_ENTITY,
+)
+
+from orders.locations import get_location
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+PURGE_PROBABILITY = 0.01
+
+
+def fingerprint(request):
+    payload = json.dumps(
+        [request.method, request.path, request.data],
+        sort_keys=True, cls=DjangoJSONEncoder
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def purge():
+    """Удаляет просроченные ключи и самые старые сверх лимита."""
+    IdempotencyKey.objects.filter(
+        created_at__lt=timezone.now() - timedelta(
+            seconds=settings.IDEMPOTENCY_KEY_TTL
+        )
+    ).delete()
+    boundary = IdempotencyKey.objects.order_by('-pk').values_list(
+        'pk', flat=True
+    )[settings.IDEMPOTENCY_MAX_KEYS:].first()
+    if boundary is not None:
+        IdempotencyKey.objects.filter(pk__lte=boundary).delete()
+
+
+def claim(scope, key, request_fingerprint):
+    """
+    Занимает ключ. Возвращает (запись, True) для нового запроса или
+    (запись, False), если ключ уже занят живой записью.
+    """
+    now = timezone.now()
+    expired = now - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+    abandoned = now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT)
+    while True:
+        try:
+            with transaction.atomic(
+                using=router.db_for_write(IdempotencyKey)
+            ):
+                record = IdempotencyKey.objects.create(
+                    scope=scope, key=key, fingerprint=request_fingerprint
+                )
+            return record, True
+        except IntegrityError:
+            record = IdempotencyKey.objects.filter(
+                scope=scope, key=key
+            ).first()
+        if record is None:
+            continue
+        stale = record.created_at < expired or (
+            record.status_code is None and record.created_at < abandoned
+        )
+        if not stale:
+            return record, False
+        # Запись просрочена или её владелец не завершил запрос: удаляем,
+        # только если её никто не успел забрать раньше.
+        IdempotencyKey.objects.filter(
+            pk=record.pk, created_at=record.created_at
+        ).delete()
+
+
+def idempotent(handler):
+    """Декоратор метода ViewSet, обрабатывающий Idempotency-Key."""
+
+    @wraps(handler)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return handler(self, request, *args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {'error': f'Некорректный заголовок {HEADER}'},
+                status=HTTP_400_BAD_REQUEST
+            )
+        if random.random() < PURGE_PROBABILITY:
+            purge()
+        request_fingerprint = fingerprint(request)
+        record, created = claim(
+            f'{request.user.pk}:{get_location() or ""}', key,
+            request_fingerprint
+        )
+        if not created:
+            return replay(record, request_fingerprint)
+        try:
+            with transaction.atomic(
+                using=router.db_for_write(IdempotencyKey)
+            ):
+                response = handler(self, request, *args, **kwargs)
+                if response.status_code < 500:
+                    record.status_code = response.status_code
+                    record.response = response.data
+                    record.save(update_fields=['status_code', 'response'])
+        except BaseException:
+            record.delete()
+            raise
+        if response.status_code >= 500:
+            # Ошибку сервера клиент вправе повторить с тем же ключом.
+            record.delete()
+        return response
+
+    return wrapper
+
+
+def replay(record, request_fingerprint):
+    if record.fingerprint != request_fingerprint:
+        return Response(
+            {'error': f'{HEADER} уже использован с другим запросом'},
+            status=HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    if record.status_code is None:
+        return Response(
+            {'error': 'Запрос с этим ключом ещё выполняется'},
+            status=HTTP_409_CONFLICT, headers={'Retry-After': '1'}
+        )
+    return Response(
+        record.response, status=record.status_code,
+        headers={'Idempotent-Replayed': 'true'}
+    )
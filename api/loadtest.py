@@ -0,0 +1,232 @@
+"""
+Инструменты нагрузочного тестирования приложения внутри процесса.
+
+ASGIClient и WSGIClient вызывают приложение напрямую, без сети, поэтому
+замеры показывают стоимость самого Django и кода проекта.
+"""
+import asyncio
+import io
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def percentile(values, pct):
+    """Перцентиль по методу ближайшего ранга."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def summarize(latencies):
+    """Сводка задержек в миллисекундах."""
+    return {
+        'count': len(latencies),
+        'p50': round(percentile(latencies, 50) * 1000, 3),
+        'p95': round(percentile(latencies, 95) * 1000, 3),
+        'p99': round(percentile(latencies, 99) * 1000, 3),
+        'max': round(max(latencies, default=0.0) * 1000, 3),
+    }
+
+
+def build_scope(method, path, headers=None, query_string=''):
+    raw_headers = [(b'host', b'localhost')]
+    for name, value in (headers or {}).items():
+        raw_headers.append((name.lower().encode(), value.encode()))
+    return {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': method.upper(),
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': query_string.encode(),
+        'root_path': '',
+        'headers': raw_headers,
+        'client': ('127.0.0.1', 0),
+        'server': ('localhost', 80),
+    }
+
+
+class ASGIStream:
+    """Открытое HTTP-соединение с ASGI-приложением."""
+
+    def __init__(self, app, scope, body=b''):
+        self.app = app
+        self.scope = scope
+        self.body = body
+        self.status = None
+        self.chunks = asyncio.Queue()
+        self._disconnected = asyncio.Event()
+        self._request_sent = False
+        self._task = None
+
+    async def _receive(self):
+        if not self._request_sent:
+            self._request_sent = True
+            return {
+                'type': 'http.request', 'body': self.body,
+                'more_body': False,
+            }
+        await self._disconnected.wait()
+        return {'type': 'http.disconnect'}
+
+    async def _send(self, message):
+        if message['type'] == 'http.response.start':
+            self.status = message['status']
+        elif message['type'] == 'http.response.body':
+            if message.get('body'):
+                await self.chunks.put(message['body'])
+            if not message.get('more_body'):
+                await self.chunks.put(None)
+
+    def start(self):
+        self._task = asyncio.ensure_future(
+            self.app(self.scope, self._receive, self._send)
+        )
+        return self
+
+    async def read(self):
+        """Читает ответ целиком."""
+        parts = []
+        while (chunk := await self.chunks.get()) is not None:
+            parts.append(chunk)
+        await self._task
+        return b''.join(parts)
+
+    async def close(self):
+        self._disconnected.set()
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._task, 5)
+            except asyncio.TimeoutError:
+                self._task.cancel()
+
+
+class ASGIClient:
+    """Клиент, обращающийся к ASGI-приложению внутри процесса."""
+
+    def __init__(self, app, headers=None):
+        self.app = app
+        self.headers = headers or {}
+
+    def stream(self, method, path, query_string='', body=b'', headers=None):
+        headers = {**self.headers, **(headers or {})}
+        if body:
+            headers['Content-Length'] = str(len(body))
+        scope = build_scope(method, path, headers, query_string)
+        return ASGIStream(self.app, scope, body).start()
+
+    async def request(self, method, path, query_string='', body=b'',
+                      headers=None):
+        stream = self.stream(method, path, query_string, body, headers)
+        content = await stream.read()
+        return stream.status, content
+
+
+async def run_load(client, requests, concurrency, rate=None):
+    """
+    Выполняет запросы с ограничением параллелизма и, при rate,
+    темпом (запросов в секунду).
+
+    requests — последовательность кортежей (method, path, query_string,
+    body, headers). Возвращает список (запрос, статус, задержка, время
+    старта) и общее время в секундах.
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    results = []
+    started = loop.time()
+
+    async def one(index, request):
+        if rate:
+            delay = started + index / rate - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        async with semaphore:
+            begin = loop.time()
+            try:
+                status, _ = await client.request(*request)
+            except Exception:
+                status = None
+            results.append((request, status, loop.time() - begin, begin))
+
+    await asyncio.gather(
+        *(one(index, request) for index, request in enumerate(requests))
+    )
+    return results, loop.time() - started
+
+
+class WSGIClient:
+    """Клиент, обращающийся к WSGI-приложению внутри процесса."""
+
+    def __init__(self, app, headers=None):
+        self.app = app
+        self.headers = headers or {}
+
+    def request(self, method, path, query_string='', body=b'',
+                headers=None):
+        environ = {
+            'REQUEST_METHOD': method.upper(),
+            'PATH_INFO': path,
+            'QUERY_STRING': query_string,
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'REMOTE_ADDR': '127.0.0.1',
+            'HTTP_HOST': 'localhost',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': io.StringIO(),
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in {**self.headers, **(headers or {})}.items():
+            key = name.upper().replace('-', '_')
+            if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                key = f'HTTP_{key}'
+            environ[key] = value
+        response_status = []
+
+        def start_response(status, response_headers, exc_info=None):
+            response_status.append(int(status.split()[0]))
+
+        result = self.app(environ, start_response)
+        try:
+            content = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return response_status[0], content
+
+
+def run_threaded_load(client, requests, concurrency, rate=None):
+    """Аналог run_load для WSGIClient на пуле потоков."""
+    results = []
+    lock = threading.Lock()
+    started = time.monotonic()
+
+    def one(request):
+        begin = time.monotonic()
+        try:
+            status, _ = client.request(*request)
+        except Exception:
+            status = None
+        with lock:
+            results.append((request, status, time.monotonic() - begin, begin))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for index, request in enumerate(requests):
+            if rate:
+                delay = started + index / rate - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            executor.submit(one, request)
+    return results, time.monotonic() - started
@@ -0,0 +1,62 @@
+import asyncio
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from api.loadtest import ASGIClient, run_load, summarize
+from orders.models import Order
+
+ENDPOINTS = {
+    'order_list': ('/api/v1/orders/', '/api/v1/async/orders/'),
+    'order_detail': (
+        '/api/v1/orders/{pk}/', '/api/v1/async/orders/{pk}/'
+    ),
+    'revenue': ('/api/v1/revenue/', '/api/v1/async/revenue/'),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность и задержки синхронных и '
+        'асинхронных представлений чтения под ASGI.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', required=True)
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=100)
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options['username'])
+        except get_user_model().DoesNotExist:
+            raise CommandError('Пользователь не найден')
+        order = Order.objects.order_by('-id').first()
+        if order is None:
+            raise CommandError('В базе нет заказов, запустите seed_load_data')
+        token, _ = Token.objects.get_or_create(user=user)
+        client = ASGIClient(
+            get_asgi_application(), {'Authorization': f'Token {token.key}'}
+        )
+        report = {}
+        for name, paths in ENDPOINTS.items():
+            for kind, path in zip(('sync', 'async'), paths):
+                report[f'{name}.{kind}'] = asyncio.run(self.measure(
+                    client, path.format(pk=order.pk), options
+                ))
+        self.stdout.write(json.dumps(report, indent=2))
+
+    @staticmethod
+    async def measure(client, path, options):
+        requests = [('GET', path)] * options['requests']
+        results, elapsed = await run_load(
+            client, requests, options['concurrency']
+        )
+        return {
+            'rps': round(len(results) / elapsed, 1),
+            'errors': sum(1 for result in results if result[1] != 200),
+            'latency_ms': summarize([result[2] for result in results]),
+        }
@@ -0,0 +1,63 @@
+import json
+import platform
+import subprocess
+import time
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmarks import measure_startup
+
+PATHS = ('/api/v1/orders/', '/accounts/login/')
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет холодный запуск воркера: импорт config.wsgi и время до '
+        'первого ответа, с прогревом и без. Результаты сравниваются '
+        'командой compare_benchmarks.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', type=Path, default=None)
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument(
+            '--path', action='append', dest='paths',
+            help='Запрашиваемый путь (по умолчанию список заказов API и '
+                 'страница входа).'
+        )
+
+    def handle(self, *args, **options):
+        if options['runs'] < 1:
+            raise CommandError('Число запусков должно быть больше нуля')
+        paths = options['paths'] or PATHS
+        results = {}
+        for warmup in (False, True):
+            try:
+                measured = measure_startup(
+                    paths, options['runs'], warmup, settings.BASE_DIR
+                )
+            except subprocess.CalledProcessError as error:
+                raise CommandError(f'Процесс завершился с ошибкой:\n'
+                                   f'{error.stderr}')
+            suffix = 'warm' if warmup else 'cold'
+            for name, result in measured.items():
+                results[f'{name}.{suffix}'] = result
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<48}{result["median_ms"]:>10.1f} мс '
+                f'(p95 {result["p95_ms"]:.1f} мс)'
+            )
+        if options['output']:
+            options['output'].write_text(json.dumps({
+                'meta': {
+                    'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                    'app_version': settings.APP_VERSION,
+                    'python': platform.python_version(),
+                    'django': django.get_version(),
+                    'runs': options['runs'],
+                },
+                'results': results,
+            }, indent=2))
@@ -0,0 +1,22 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.schema import generate_schema
+
+
+class Command(BaseCommand):
+    help = 'Генерирует схему OpenAPI в файл API_SCHEMA_FILE.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file', type=Path, default=None,
+            help='Путь к файлу схемы (по умолчанию API_SCHEMA_FILE).'
+        )
+
+    def handle(self, *args, **options):
+        path = options['file'] or settings.API_SCHEMA_FILE
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(generate_schema())
+        self.stdout.write(self.style.SUCCESS(f'Схема API записана в {path}'))
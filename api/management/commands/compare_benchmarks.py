@@ -0,0 +1,44 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmarks import compare
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает два файла run_benchmarks и завершается с ошибкой, если '
+        'медиана выросла больше порога.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('baseline', type=Path)
+        parser.add_argument('current', type=Path)
+        parser.add_argument(
+            '--threshold', type=float, default=10.0,
+            help='Допустимый рост медианы, %%.'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            baseline, current = (
+                json.loads(options[name].read_text())['results']
+                for name in ('baseline', 'current')
+            )
+        except (OSError, ValueError, KeyError) as error:
+            raise CommandError(f'Не удалось прочитать результаты: {error}')
+        rows = compare(baseline, current, options['threshold'])
+        for name, before, after, change, regressed in rows:
+            line = (
+                f'{name:<36}{before:>10.3f}{after:>10.3f} мс'
+                f'{change:>+9.1f}%'
+            )
+            self.stdout.write(
+                self.style.ERROR(line) if regressed else line
+            )
+        regressions = [row[0] for row in rows if row[4]]
+        if regressions:
+            raise CommandError(
+                'Регрессия производительности: ' + ', '.join(regressions)
+            )
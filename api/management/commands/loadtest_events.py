@@ -0,0 +1,85 @@
+import asyncio
+import json
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from api.loadtest import ASGIClient, summarize
+from orders.events import hub
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест SSE-потока /api/v1/orders/events/: открывает '
+        'множество соединений через ASGI и измеряет задержку рассылки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', required=True)
+        parser.add_argument('--clients', type=int, default=200)
+        parser.add_argument('--events', type=int, default=50)
+        parser.add_argument('--interval', type=float, default=0.05)
+        parser.add_argument('--timeout', type=float, default=30.0)
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options['username'])
+        except get_user_model().DoesNotExist:
+            raise CommandError('Пользователь не найден')
+        token, _ = Token.objects.get_or_create(user=user)
+        report = asyncio.run(self.run(token.key, options))
+        self.stdout.write(json.dumps(report, indent=2))
+
+    async def run(self, token, options):
+        client = ASGIClient(
+            get_asgi_application(), {'Authorization': f'Token {token}'}
+        )
+        latencies = []
+        streams = [
+            client.stream('GET', '/api/v1/orders/events/')
+            for _ in range(options['clients'])
+        ]
+        readers = [
+            asyncio.ensure_future(self.consume(stream, latencies))
+            for stream in streams
+        ]
+        started = time.perf_counter()
+        while len(hub) < len(streams):
+            if time.perf_counter() - started > options['timeout']:
+                raise CommandError('Клиенты не успели подключиться')
+            await asyncio.sleep(0.01)
+        connect_time = time.perf_counter() - started
+
+        for number in range(options['events']):
+            hub.publish({
+                'event': 'loadtest', 'number': number,
+                'sent_at': time.perf_counter(),
+            })
+            await asyncio.sleep(options['interval'])
+
+        expected = len(streams) * options['events']
+        deadline = time.perf_counter() + options['timeout']
+        while len(latencies) < expected and time.perf_counter() < deadline:
+            await asyncio.sleep(0.01)
+        for stream in streams:
+            await stream.close()
+        for reader in readers:
+            reader.cancel()
+        return {
+            'clients': len(streams),
+            'connect_seconds': round(connect_time, 3),
+            'delivered': len(latencies),
+            'expected': expected,
+            'fanout_latency_ms': summarize(latencies),
+        }
+
+    @staticmethod
+    async def consume(stream, latencies):
+        while (chunk := await stream.chunks.get()) is not None:
+            for line in chunk.decode().splitlines():
+                if line.startswith('data: ') and 'sent_at' in line:
+                    event = json.loads(line[len('data: '):])
+                    latencies.append(time.perf_counter() - event['sent_at'])
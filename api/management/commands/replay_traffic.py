@@ -0,0 +1,180 @@
+import asyncio
+import json
+import secrets
+from collections import defaultdict
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from django.contrib.auth import get_user_model
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.urls import Resolver404, resolve
+from rest_framework.authtoken.models import Token
+
+from api.loadtest import (
+    ASGIClient,
+    WSGIClient,
+    run_load,
+    run_threaded_load,
+    summarize,
+)
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Воспроизводит журнал запросов (JSONL) через WSGI- или '
+        'ASGI-приложение и выводит пропускную способность, перцентили '
+        'задержки и ошибки по маршрутам. Строка журнала: {"method": "GET", '
+        '"path": "/api/v1/orders/?status=pending", "role": "waiter", '
+        '"body": {...}}; role — waiter, chef, admin или null. Для ролей '
+        'нужен флаг --create-users: команда заводит временных '
+        'пользователей и удаляет их после прогона.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('log', type=Path)
+        parser.add_argument(
+            '--interface', choices=('wsgi', 'asgi'), default='wsgi'
+        )
+        parser.add_argument('--concurrency', type=int, default=10)
+        parser.add_argument(
+            '--rate', type=float, default=None,
+            help='Темп запросов в секунду (по умолчанию без ограничения).'
+        )
+        parser.add_argument('--repeat', type=int, default=1)
+        parser.add_argument('--output', type=Path, default=None)
+        parser.add_argument(
+            '--create-users', action='store_true',
+            help='Создать временных пользователей и токены для ролей '
+                 'из журнала; после прогона они удаляются.'
+        )
+
+    def handle(self, *args, **options):
+        entries = self.read_log(options['log'])
+        roles = {entry.get('role') for entry in entries} - {None}
+        if roles and not options['create_users']:
+            raise CommandError(
+                'В журнале есть запросы от ролей '
+                f'{", ".join(sorted(roles))}; запустите команду с '
+                '--create-users, чтобы создать временных пользователей.'
+            )
+        users = {role: self.create_user(role) for role in roles}
+        try:
+            tokens = {
+                role: Token.objects.create(user=user).key
+                for role, user in users.items()
+            }
+            requests = [
+                self.build_request(entry, tokens) for entry in entries
+            ] * options['repeat']
+            results, elapsed = self.run(requests, options)
+        finally:
+            User.objects.filter(
+                pk__in=[user.pk for user in users.values()]
+            ).delete()
+        report = self.build_report(results, elapsed)
+        self.print_report(report)
+        if options['output']:
+            options['output'].write_text(json.dumps(report, indent=2))
+
+    @staticmethod
+    def read_log(path):
+        try:
+            lines = path.read_text(encoding='utf-8').splitlines()
+        except OSError as error:
+            raise CommandError(f'Не удалось прочитать журнал: {error}')
+        try:
+            entries = [json.loads(line) for line in lines if line.strip()]
+        except json.JSONDecodeError as error:
+            raise CommandError(f'Неверная строка журнала: {error}')
+        roles = dict(User.ROLE_CHOICES)
+        for entry in entries:
+            if 'method' not in entry or 'path' not in entry:
+                raise CommandError(f'В записи нет method/path: {entry}')
+            if entry.get('role') not in (None, *roles):
+                raise CommandError(f'Неизвестная роль: {entry["role"]}')
+        return entries
+
+    @staticmethod
+    def create_user(role):
+        user = User(
+            username=f'loadtest_{role}_{secrets.token_hex(4)}', role=role
+        )
+        user.set_unusable_password()
+        user.save()
+        return user
+
+    @staticmethod
+    def run(requests, options):
+        if options['interface'] == 'asgi':
+            return asyncio.run(run_load(
+                ASGIClient(get_asgi_application()), requests,
+                options['concurrency'], options['rate']
+            ))
+        return run_threaded_load(
+            WSGIClient(get_wsgi_application()), requests,
+            options['concurrency'], options['rate']
+        )
+
+    @staticmethod
+    def build_request(entry, tokens):
+        url = urlsplit(entry['path'])
+        headers = {}
+        if entry.get('role'):
+            headers['Authorization'] = f'Token {tokens[entry["role"]]}'
+        body = b''
+        if entry.get('body') is not None:
+            body = json.dumps(entry['body']).encode()
+            headers['Content-Type'] = 'application/json'
+        return entry['method'].upper(), url.path, url.query, body, headers
+
+    @staticmethod
+    def route_name(method, path):
+        try:
+            return f'{method} {resolve(path).view_name}'
+        except Resolver404:
+            return f'{method} <unresolved>'
+
+    def build_report(self, results, elapsed):
+        routes = defaultdict(list)
+        for (method, path, *_), status, latency, _ in results:
+            routes[self.route_name(method, path)].append((status, latency))
+        return {
+            'requests': len(results),
+            'seconds': round(elapsed, 3),
+            'throughput_rps': round(len(results) / elapsed, 1),
+            'errors': sum(
+                1 for result in results
+                if result[1] is None or result[1] >= 400
+            ),
+            'routes': {
+                route: {
+                    'errors': sum(
+                        1 for status, _ in samples
+                        if status is None or status >= 400
+                    ),
+                    **summarize([latency for _, latency in samples]),
+                }
+                for route, samples in sorted(routes.items())
+            },
+        }
+
+    def print_report(self, report):
+        self.stdout.write(
+            f'Запросов: {report["requests"]} за {report["seconds"]} с, '
+            f'{report["throughput_rps"]} запросов/с, '
+            f'ошибок: {report["errors"]}'
+        )
+        self.stdout.write(
+            f'{"маршрут":<40}{"кол-во":>8}{"ошибки":>8}'
+            f'{"p50 мс":>10}{"p95 мс":>10}{"p99 мс":>10}'
+        )
+        for route, stats in report['routes'].items():
+            self.stdout.write(
+                f'{route:<40}{stats["count"]:>8}{stats["errors"]:>8}'
+                f'{stats["p50"]:>10.1f}{stats["p95"]:>10.1f}'
+                f'{stats["p99"]:>10.1f}'
+            )
@@ -0,0 +1,54 @@
+import json
+import platform
+import time
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmarks import BENCHMARKS, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        'Запускает микробенчмарки сериализаторов, recalc_total, фильтра '
+        'и прав доступа и сохраняет результаты в JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', type=Path, default=None)
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument(
+            '--size', type=int, default=50,
+            help='Размер данных: число заказов или позиций в заказе.'
+        )
+        parser.add_argument(
+            '--only', nargs='*', default=None, choices=sorted(BENCHMARKS)
+        )
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('Число итераций должно быть больше нуля')
+        names = options['only'] or sorted(BENCHMARKS)
+        results = run_benchmarks(
+            names, options['iterations'], options['warmup'], options['size']
+        )
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<36}{result["median_ms"]:>10.3f} мс '
+                f'(p95 {result["p95_ms"]:.3f} мс)'
+            )
+        if options['output']:
+            options['output'].write_text(json.dumps({
+                'meta': {
+                    'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                    'app_version': settings.APP_VERSION,
+                    'python': platform.python_version(),
+                    'django': django.get_version(),
+                    'iterations': options['iterations'],
+                    'size': options['size'],
+                },
+                'results': results,
+            }, indent=2))
@@ -31,3 +31,10 @@ class CustomOrderPermission(BasePermission):
         if view.action in ['update', 'partial_update', 'destroy']:
             return request.user.is_admin
         return True
+
+
+class IsAdminRole(BasePermission):
+    """Доступ только для пользователей с ролью администратора."""
+
+    def has_permission(self, request, view):
+        return request.user.is_authenticated and request.user.is_admin
@@ -0,0 +1,137 @@
+"""
+Отдача заранее сгенерированной схемы OpenAPI.
+
+Схема строится один раз командой build_api_schema (или, если разрешено
+API_SCHEMA_GENERATE_ON_REQUEST, при первом запросе) и хранится в памяти
+с ключом по версии кода APP_VERSION. Ответ отдаётся с ETag.
+
+Как и SpectacularAPIView, по умолчанию отдаётся YAML, а JSON — по
+?format=json (или openapi-json) либо по заголовку Accept с json. YAML
+строится из собранного JSON один раз на версию схемы.
+
+drf_spectacular импортируется только при генерации схемы и первом
+открытии документации, чтобы не замедлять запуск воркеров.
+"""
+import hashlib
+import json
+import threading
+
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.http import condition, require_GET
+
+YAML = 'yaml'
+JSON = 'json'
+CONTENT_TYPES = {
+    YAML: 'application/vnd.oai.openapi',
+    JSON: 'application/vnd.oai.openapi+json',
+}
+# Форматы рендереров drf_spectacular.
+FORMATS = {'yaml': YAML, 'openapi': YAML, 'json': JSON, 'openapi-json': JSON}
+
+_cache = {}
+_lock = threading.Lock()
+_yaml = {}
+_docs_view = None
+
+
+def generate_schema():
+    """Строит схему API и возвращает её в виде JSON (bytes)."""
+    from drf_spectacular.generators import SchemaGenerator
+
+    schema = SchemaGenerator().get_schema(request=None, public=True)
+    return json.dumps(schema, ensure_ascii=False, indent=2).encode()
+
+
+def _cache_key():
+    path = settings.API_SCHEMA_FILE
+    mtime = path.stat().st_mtime if path.exists() else None
+    return settings.APP_VERSION, str(path), mtime
+
+
+def get_schema_document():
+    """Возвращает (тело, etag) или None, если схему строить нельзя."""
+    key = _cache_key()
+    document = _cache.get(key)
+    if document is not None:
+        return document
+    with _lock:
+        if key in _cache:
+            return _cache[key]
+        if key[2] is not None:
+            body = settings.API_SCHEMA_FILE.read_bytes()
+        elif settings.API_SCHEMA_GENERATE_ON_REQUEST:
+            body = generate_schema()
+        else:
+            return None
+        etag = hashlib.sha256(
+            settings.APP_VERSION.encode() + body
+        ).hexdigest()[:32]
+        _cache.clear()
+        _cache[key] = body, etag
+        return _cache[key]
+
+
+def negotiate(request):
+    """Формат ответа или None для неизвестного ?format=."""
+    requested = request.GET.get('format')
+    if requested:
+        return FORMATS.get(requested)
+    accept = request.headers.get('Accept', '')
+    if 'json' in accept and 'yaml' not in accept:
+        return JSON
+    return YAML
+
+
+def render(document, fmt):
+    body, etag = document
+    if fmt == JSON:
+        return body
+    if etag not in _yaml:
+        from drf_spectacular.renderers import OpenApiYamlRenderer
+
+        _yaml.clear()
+        _yaml[etag] = OpenApiYamlRenderer().render(json.loads(body))
+    return _yaml[etag]
+
+
+def schema_etag(request):
+    document = get_schema_document()
+    fmt = negotiate(request)
+    if document is None or fmt is None:
+        return None
+    return f'{document[1]}-{fmt}'
+
+
+@require_GET
+@condition(etag_func=schema_etag)
+def schema_view(request):
+    """Схема OpenAPI для /api/v1/docs/."""
+    fmt = negotiate(request)
+    if fmt is None:
+        return JsonResponse(
+            {'detail': 'Неизвестный формат схемы'}, status=404
+        )
+    document = get_schema_document()
+    if document is None:
+        return JsonResponse(
+            {'detail': 'Схема API не собрана: выполните '
+                       'manage.py build_api_schema'},
+            status=503
+        )
+    response = HttpResponse(
+        render(document, fmt), content_type=CONTENT_TYPES[fmt]
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['Vary'] = 'Accept'
+    return response
+
+
+def docs_view(request, *args, **kwargs):
+    """Swagger UI для /api/v1/docs/."""
+    global _docs_view
+    if _docs_view is None:
+        from drf_spectacular.views import SpectacularSwaggerView
+
+        _docs_view = SpectacularSwaggerView.as_view(url_name='schema')
+    return _docs_view(request, *args, **kwargs)
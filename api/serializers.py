@@ -1,7 +1,15 @@
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
 
-from orders.models import Dish, Order, OrderItem
+from orders import signals
+from orders.models import (
+    ArchivedOrder,
+    ArchivedOrderItem,
+    Dish,
+    Order,
+    OrderItem,
+    TableState,
+)
 
 User = get_user_model()
 
@@ -18,13 +26,14 @@ class CustomUserSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = User
-        fields = ['id', 'username', 'role', 'password']
+        fields = ['id', 'username', 'role', 'location', 'password']
         extra_kwargs = {'password': {'write_only': True}}
 
     def create(self, validated_data):
         user = User(
             username=validated_data['username'],
-            role=validated_data['role']
+            role=validated_data['role'],
+            location=validated_data.get('location', '')
         )
         user.set_password(validated_data['password'])
         user.save()
@@ -36,6 +45,8 @@ class DishSerializer(serializers.ModelSerializer):
     Сериализатор для модели блюда.
     """
 
+    price = serializers.DecimalField(max_digits=8, decimal_places=2)
+
     class Meta:
         model = Dish
         fields = ['id', 'name', 'price']
@@ -49,20 +60,34 @@ class OrderItemSerializer(serializers.ModelSerializer):
     dish = DishSerializer(read_only=True)
     dish_id = serializers.PrimaryKeyRelatedField(
         queryset=Dish.objects.all(), source='dish', write_only=True)
+    unit_price = serializers.DecimalField(
+        max_digits=8, decimal_places=2, read_only=True
+    )
+    line_total = serializers.DecimalField(
+        max_digits=10, decimal_places=2, read_only=True
+    )
 
     class Meta:
         model = OrderItem
-        fields = ['id', 'dish', 'dish_id', 'quantity']
+        fields = [
+            'id', 'dish', 'dish_id', 'quantity', 'unit_price', 'line_total'
+        ]
 
 
 class OrderReadSerializer(serializers.ModelSerializer):
     """Сериализатор для чтения заказа"""
 
     order_items = OrderItemSerializer(many=True, read_only=True)
+    total_price = serializers.DecimalField(
+        max_digits=10, decimal_places=2, read_only=True
+    )
 
     class Meta:
         model = Order
-        fields = ['id', 'table_number', 'status', 'total_price', 'order_items']
+        fields = [
+            'id', 'table_number', 'status', 'total_price', 'order_items',
+            'change_seq'
+        ]
 
 
 class OrderWriteSerializer(serializers.ModelSerializer):
@@ -91,10 +116,10 @@ class OrderWriteSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         order_items_data = validated_data.pop('order_items')
-        order = Order.objects.create(**validated_data)
-        for item in order_items_data:
-            OrderItem.objects.create(order=order, **item)
-        order.recalc_total()
+        with signals.batched():
+            order = Order.objects.create(**validated_data)
+            for item in order_items_data:
+                OrderItem.objects.create(order=order, **item)
         return order
 
     def update(self, instance, validated_data):
@@ -102,12 +127,12 @@ class OrderWriteSerializer(serializers.ModelSerializer):
         instance.table_number = validated_data.get(
             'table_number', instance.table_number
         )
-        instance.save()
-        if order_items_data is not None:
-            instance.order_items.all().delete()
-            for item in order_items_data:
-                OrderItem.objects.create(order=instance, **item)
-            instance.recalc_total()
+        with signals.batched():
+            instance.save()
+            if order_items_data is not None:
+                instance.order_items.all().delete()
+                for item in order_items_data:
+                    OrderItem.objects.create(order=instance, **item)
         return instance
 
 
@@ -119,3 +144,60 @@ class OrderStatusSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = ['status']
+
+
+class TableStateSerializer(serializers.ModelSerializer):
+    """Сериализатор сводки открытых заказов по столу."""
+
+    bill = serializers.DecimalField(max_digits=12, decimal_places=2)
+    occupied = serializers.SerializerMethodField()
+
+    class Meta:
+        model = TableState
+        fields = ['table_number', 'open_orders', 'bill', 'occupied']
+
+    def get_occupied(self, obj):
+        return obj.open_orders > 0
+
+
+class BillLineSerializer(serializers.Serializer):
+    """Строка общего счёта стола: блюдо по всем заказам."""
+
+    dish_id = serializers.IntegerField()
+    name = serializers.CharField()
+    price = serializers.DecimalField(max_digits=8, decimal_places=2)
+    quantity = serializers.IntegerField()
+    amount = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+
+class TableBillSerializer(serializers.Serializer):
+    """Общий счёт закрытого стола."""
+
+    table_number = serializers.IntegerField()
+    orders = serializers.ListField(child=serializers.IntegerField())
+    lines = BillLineSerializer(many=True)
+    total = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+
+class ArchivedOrderItemSerializer(serializers.ModelSerializer):
+    """Сериализатор позиции архивного заказа."""
+
+    price = serializers.DecimalField(max_digits=8, decimal_places=2)
+
+    class Meta:
+        model = ArchivedOrderItem
+        fields = ['dish_id', 'dish_name', 'price', 'quantity']
+
+
+class ArchivedOrderSerializer(serializers.ModelSerializer):
+    """Сериализатор архивного заказа."""
+
+    items = ArchivedOrderItemSerializer(many=True, read_only=True)
+    total_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        model = ArchivedOrder
+        fields = [
+            'id', 'table_number', 'status', 'total_price', 'created_at',
+            'archived_at', 'items'
+        ]
@@ -1,10 +1,44 @@
+import asyncio
+import json
+from datetime import timedelta
 from decimal import Decimal
+from importlib import import_module
+from io import StringIO
 
 import pytest
+from django.apps import apps
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory
+from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
+from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient
 
-from orders.models import CustomUser, Dish, Order, OrderItem
+from api.benchmarks import BENCHMARKS
+from api.idempotency import purge
+from api.models import IdempotencyKey
+from api.serializers import OrderWriteSerializer
+from api.views import OrderViewSet, TableViewSet
+from orders.middleware import ProfilingMiddleware
+from orders.models import (
+    CustomUser,
+    Dish,
+    Order,
+    OrderChange,
+    OrderItem,
+    TableState,
+)
+
+
+# Кеш плана зала общий для процесса: каждый тест начинает с пустого
+@pytest.fixture(autouse=True)
+def floor_plan_cache():
+    TableViewSet.floor_plan_cache.invalidate()
+    yield TableViewSet.floor_plan_cache
+    TableViewSet.floor_plan_cache.invalidate()
 
 
 # Фикстура для API-клиента
@@ -97,6 +131,52 @@ def test_order_create(api_client, waiter_user, dish):
         'Ошибка: создание заказа не прошло'
     created_order = response.json()
     assert created_order['table_number'] == 2, 'Ошибка: неверный номер стола'
+    assert created_order['order_items'][0]['line_total'] == '200.00', \
+        'Ошибка: неверная сумма позиции'
+
+
+# Тест однократного пересчёта сводки и журнала при записи заказа
+def test_order_write_refreshes_once(api_client, waiter_user, admin_user,
+                                    monkeypatch):
+    dishes = [
+        Dish.objects.create(name=f'Блюдо {n}', price=Decimal('100.00'))
+        for n in range(1, 4)
+    ]
+    refreshed = []
+    refresh = TableState.refresh
+    monkeypatch.setattr(TableState, 'refresh', lambda *tables: (
+        refreshed.append(set(tables)), refresh(*tables)
+    ))
+    api_client.force_authenticate(user=waiter_user)
+    response = api_client.post('/api/v1/orders/', {
+        'table_number': 2,
+        'order_items': [
+            {'dish_id': dish.id, 'quantity': 1} for dish in dishes
+        ],
+    }, format='json')
+    assert response.status_code == status.HTTP_201_CREATED
+    order = Order.objects.get()
+    # Ошибка: сводка пересчитывается при каждом сохранении позиции.
+    assert refreshed == [{2}]
+    assert list(OrderChange.objects.values_list('pk', flat=True)) == [
+        order.change_seq
+    ]
+    assert order.total_price == Decimal('300.00')
+    assert TableState.objects.get(table_number=2).bill == Decimal('300.00')
+
+    refreshed.clear()
+    api_client.force_authenticate(user=admin_user)
+    response = api_client.patch(f'/api/v1/orders/{order.id}/', {
+        'table_number': 3,
+        'order_items': [{'dish_id': dishes[0].id, 'quantity': 2}],
+    }, format='json')
+    assert response.status_code == status.HTTP_200_OK
+    order.refresh_from_db()
+    assert refreshed == [{2, 3}]
+    assert OrderChange.objects.get().pk == order.change_seq
+    assert order.total_price == Decimal('200.00')
+    assert TableState.objects.get(table_number=2).open_orders == 0
+    assert TableState.objects.get(table_number=3).bill == Decimal('200.00')
 
 
 # Тест для изменения статуса заказа через action change_status.
@@ -170,3 +250,547 @@ def test_revenue_report(api_client, admin_user, order, dish):
     total_revenue = response.json().get('total_revenue')
     expected_total = float(dish.price * 3)
     assert total_revenue == expected_total, 'Ошибка: неверная выручка'
+
+
+# Тест дельта-синхронизации заказов
+def test_order_changes_since_cursor(api_client, waiter_user, order, dish):
+    api_client.force_authenticate(user=waiter_user)
+    url = '/api/v1/orders/changes/'
+    response = api_client.get(url)
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    assert [o['id'] for o in data['upserted']] == [order.id], \
+        'Ошибка: полная синхронизация не вернула заказ'
+    cursor = data['cursor']
+
+    response = api_client.get(url, {'since': cursor})
+    data = response.json()
+    assert data['upserted'] == [] and data['deleted'] == [], \
+        'Ошибка: без изменений ответ должен быть пустым'
+
+    OrderItem.objects.create(order=order, dish=dish, quantity=2)
+    other = Order.objects.create(table_number=5)
+    other_id = other.id
+    other.delete()
+    data = api_client.get(url, {'since': cursor}).json()
+    assert [o['id'] for o in data['upserted']] == [order.id]
+    assert data['upserted'][0]['total_price'] == '200.00'
+    assert data['deleted'] == [other_id], \
+        'Ошибка: удалённый заказ не попал в deleted'
+    assert data['cursor'] > cursor
+
+    order.status = Order.READY
+    order.save()
+    data = api_client.get(
+        url, {'since': data['cursor'], 'status': Order.PENDING}).json()
+    assert data['deleted'] == [order.id], \
+        'Ошибка: заказ, вышедший из фильтра, не попал в deleted'
+
+
+# Тест постраничной синхронизации заказов без номера изменения
+def test_order_changes_paging_legacy_orders(api_client, waiter_user,
+                                            monkeypatch):
+    api_client.force_authenticate(user=waiter_user)
+    monkeypatch.setattr(OrderViewSet, 'changes_limit', 2)
+    # Заказы до миграции 0006 и массовой загрузки: change_seq=0.
+    legacy = Order.objects.bulk_create(
+        [Order(table_number=number) for number in range(1, 6)]
+    )
+    fresh = [Order.objects.create(table_number=7) for _ in range(3)]
+    expected = {order.pk for order in legacy + fresh}
+
+    def sync():
+        cursor, received, pages = 0, set(), 0
+        while True:
+            pages += 1
+            # Ошибка: курсор не сдвигается, клиент зациклился.
+            assert pages < 10
+            data = api_client.get(
+                '/api/v1/orders/changes/', {'since': cursor}
+            ).json()
+            received.update(order['id'] for order in data['upserted'])
+            assert data['cursor'] > cursor or not data['has_more']
+            cursor = data['cursor']
+            if not data['has_more']:
+                return received, pages
+
+    assert sync()[0] == expected
+
+    class SchemaEditor:
+        connection = connection
+
+    import_module(
+        'orders.migrations.0006_order_change_seq'
+    ).backfill_change_seq(apps, SchemaEditor)
+    sequences = list(Order.objects.values_list('change_seq', flat=True))
+    # Ошибка: миграция не выдала заказам собственные номера изменений.
+    assert 0 not in sequences and len(set(sequences)) == len(sequences)
+    assert OrderChange.objects.filter(
+        order_id__in=[order.pk for order in legacy]
+    ).count() == len(legacy)
+    received, pages = sync()
+    assert received == expected and pages == 4
+
+
+# Тест безопасного курсора вне SQLite
+def test_order_changes_safe_cursor(
+    api_client, waiter_user, order, settings, monkeypatch
+):
+    settings.ORDERS_CHANGES_SAFETY_WINDOW = 60
+    api_client.force_authenticate(user=waiter_user)
+    monkeypatch.setattr(connection, 'vendor', 'postgresql')
+    url = '/api/v1/orders/changes/'
+    data = api_client.get(url).json()
+    # Ошибка: курсор не должен заходить в свежие изменения.
+    assert data['cursor'] == 0
+    assert [o['id'] for o in data['upserted']] == [order.id]
+    OrderChange.objects.update(
+        created_at=timezone.now() - timedelta(minutes=5)
+    )
+    assert api_client.get(url).json()['cursor'] == order.change_seq
+
+
+def test_order_changes_invalid_cursor(api_client, waiter_user):
+    api_client.force_authenticate(user=waiter_user)
+    response = api_client.get('/api/v1/orders/changes/', {'since': 'abc'})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+# Тест совпадения ответов асинхронных и синхронных представлений
+@pytest.mark.django_db(transaction=True)
+def test_async_read_endpoints_match_sync(api_client, waiter_user, dish):
+    order = Order.objects.create(table_number=4)
+    OrderItem.objects.create(order=order, dish=dish, quantity=2)
+    token = Token.objects.create(user=waiter_user)
+    api_client.force_authenticate(user=waiter_user)
+    async_client = AsyncClient()
+    headers = {'Authorization': f'Token {token.key}'}
+    pairs = [
+        ('/api/v1/orders/', '/api/v1/async/orders/'),
+        (f'/api/v1/orders/{order.id}/', f'/api/v1/async/orders/{order.id}/'),
+        ('/api/v1/revenue/', '/api/v1/async/revenue/'),
+    ]
+    for sync_url, async_url in pairs:
+        expected = api_client.get(sync_url, {'status': Order.PENDING})
+        response = asyncio.run(
+            async_client.get(
+                async_url, {'status': Order.PENDING}, headers=headers
+            )
+        )
+        assert response.status_code == expected.status_code
+        # Ошибка: асинхронный ответ отличается от синхронного.
+        assert response.json() == expected.json()
+    response = asyncio.run(async_client.get('/api/v1/async/orders/'))
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    assert response['WWW-Authenticate'] == 'Token'
+    # Ошибка: как и синхронный API, асинхронный не принимает сессию.
+    async_client.force_login(waiter_user)
+    for _, async_url in pairs:
+        response = asyncio.run(async_client.get(async_url))
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+# Тест отдачи заранее собранной схемы API с ETag
+def test_prebuilt_schema(client, db, settings, tmp_path):
+    settings.API_SCHEMA_FILE = tmp_path / 'openapi.json'
+    settings.API_SCHEMA_GENERATE_ON_REQUEST = False
+    url = '/api/v1/schema/'
+    # Ошибка: в продакшене схема не должна строиться на запросе.
+    assert client.get(url).status_code == 503
+
+    call_command('build_api_schema')
+    response = client.get(url, {'format': 'json'})
+    assert response.status_code == status.HTTP_200_OK
+    assert '/api/v1/orders/' in response.json()['paths']
+    etag = response['ETag']
+    response = client.get(
+        url, {'format': 'json'}, HTTP_IF_NONE_MATCH=etag
+    )
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED, \
+        'Ошибка: повторный запрос с ETag должен вернуть 304'
+    # Ошибка: по умолчанию схема, как и раньше, отдаётся в YAML.
+    response = client.get(url)
+    assert response['Content-Type'] == 'application/vnd.oai.openapi'
+    assert response.content.startswith(b'openapi: ')
+    assert response['ETag'] != etag
+    response = client.get(url, HTTP_ACCEPT='application/json')
+    assert response.json()['openapi']
+    assert client.get(url, {'format': 'xml'}).status_code == 404
+
+
+# Тест прогрева и замера холодного запуска
+def test_warmup_and_startup_benchmark(client, db, tmp_path, monkeypatch):
+    out = StringIO()
+    call_command('warmup', stdout=out)
+    assert 'templates' in out.getvalue()
+    # Ошибка: документация должна открываться при ленивой загрузке.
+    assert client.get('/api/v1/docs/').status_code == status.HTTP_200_OK
+
+    # Процессы замера не должны трогать файлы проекта и запускать
+    # чтение шины инвалидации.
+    monkeypatch.setenv('DATABASE_NAME', str(tmp_path / 'db.sqlite3'))
+    monkeypatch.setenv('METRICS_DB', str(tmp_path / 'metrics.sqlite3'))
+    monkeypatch.setenv(
+        'INVALIDATION_DB', str(tmp_path / 'invalidation.sqlite3')
+    )
+    monkeypatch.setenv('INVALIDATION_POLL_INTERVAL', '0')
+    output = tmp_path / 'startup.json'
+    call_command(
+        'bench_startup', runs=1, paths=['/api/v1/orders/'], output=output,
+        stdout=StringIO()
+    )
+    results = json.loads(output.read_text())['results']
+    for suffix in ('cold', 'warm'):
+        assert f'startup.first_response.{suffix}' in results
+        assert f'startup.import.{suffix}' in results
+
+
+# Тест воспроизведения журнала запросов
+@pytest.mark.django_db(transaction=True)
+def test_replay_traffic(tmp_path, dish):
+    log = tmp_path / 'traffic.jsonl'
+    log.write_text('\n'.join(json.dumps(entry) for entry in [
+        {'method': 'GET', 'path': '/api/v1/orders/?status=pending',
+         'role': 'waiter'},
+        {'method': 'POST', 'path': '/api/v1/orders/', 'role': 'waiter',
+         'body': {'table_number': 3,
+                  'order_items': [{'dish_id': dish.id, 'quantity': 1}]}},
+        {'method': 'GET', 'path': '/api/v1/revenue/', 'role': None},
+    ]))
+    output = tmp_path / 'report.json'
+    # Ошибка: пользователи создаются только по явному флагу.
+    with pytest.raises(CommandError):
+        call_command('replay_traffic', str(log), stdout=StringIO())
+    assert not CustomUser.objects.exists()
+    call_command(
+        'replay_traffic', str(log), concurrency=2, output=output,
+        create_users=True, stdout=StringIO()
+    )
+    # Ошибка: временные пользователи и токены остались после прогона.
+    assert not CustomUser.objects.exists()
+    assert not Token.objects.exists()
+    report = json.loads(output.read_text())
+    assert report['requests'] == 3
+    routes = report['routes']
+    assert routes['POST order-list']['errors'] == 0
+    # Ошибка: анонимный запрос должен считаться ошибкой.
+    assert routes['GET revenue_report']['errors'] == 1
+    assert Order.objects.filter(table_number=3).exists()
+
+
+# Тест профилирования запроса по заголовку
+def test_request_profiling(api_client, admin_user, waiter_user, order,
+                           settings, tmp_path):
+    settings.PROFILING_DIR = tmp_path
+    settings.PROFILING_KEEP = 2
+    token = Token.objects.create(user=waiter_user)
+    api_client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    response = api_client.get('/api/v1/orders/', HTTP_X_PROFILE='1')
+    # Ошибка: профилировать запросы может только администратор.
+    assert 'X-Profile-Id' not in response
+    assert not list(tmp_path.iterdir())
+
+    token = Token.objects.create(user=admin_user)
+    api_client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    for _ in range(3):
+        response = api_client.get('/api/v1/orders/', {'_profile': '1'})
+        assert response.status_code == status.HTTP_200_OK
+    name = response['X-Profile-Id']
+    assert (tmp_path / f'{name}.prof').exists()
+    assert 'GET /api/v1/orders/' in (tmp_path / f'{name}.txt').read_text()
+    assert len(list(tmp_path.glob('*.prof'))) == 2
+
+    settings.PROFILING_SAMPLE_RATE = 1
+    api_client.credentials()
+    response = api_client.get('/api/v1/orders/')
+    # Ошибка: id профиля из выборки не должен уходить клиенту.
+    assert 'X-Profile-Id' not in response
+    assert len(list(tmp_path.glob('*.prof'))) == 2
+
+
+# Тест асинхронного профилирования одновременных запросов
+def test_async_profiling_one_at_a_time(settings, tmp_path):
+    settings.PROFILING_DIR = tmp_path
+    settings.PROFILING_SAMPLE_RATE = 1
+
+    async def view(request):
+        await asyncio.sleep(0.05)
+        return HttpResponse('ok')
+
+    async def run():
+        middleware = ProfilingMiddleware(view)
+        return await asyncio.gather(*[
+            middleware(RequestFactory().get('/api/v1/async/orders/'))
+            for _ in range(3)
+        ])
+
+    responses = asyncio.run(run())
+    assert all(response.status_code == 200 for response in responses)
+    # Ошибка: одновременные асинхронные профили мешают друг другу.
+    assert len(list(tmp_path.glob('*.prof'))) == 1
+    assert not ProfilingMiddleware.async_profile_lock.locked()
+
+
+# Тест микробенчмарков и сравнения результатов
+def test_benchmarks_run_and_compare(db, tmp_path):
+    baseline = tmp_path / 'baseline.json'
+    call_command(
+        'run_benchmarks', iterations=2, warmup=0, size=3, output=baseline,
+        stdout=StringIO()
+    )
+    results = json.loads(baseline.read_text())['results']
+    assert set(results) == set(BENCHMARKS)
+    # Ошибка: бенчмарки не должны оставлять данных в базе.
+    assert not Order.objects.exists()
+
+    slower = {
+        name: {**result, 'median_ms': result['median_ms'] * 2}
+        for name, result in results.items()
+    }
+    current = tmp_path / 'current.json'
+    current.write_text(json.dumps({'results': slower}))
+    call_command(
+        'compare_benchmarks', str(current), str(baseline), stdout=StringIO()
+    )
+    with pytest.raises(CommandError, match='Регрессия'):
+        call_command(
+            'compare_benchmarks', str(baseline), str(current),
+            threshold=50, stdout=StringIO()
+        )
+
+
+# Тест очереди кухни
+def test_kitchen_queue(api_client, chef_user, order, dish,
+                       django_assert_max_num_queries):
+    soup = Dish.objects.create(name='Суп', price=Decimal('50.00'))
+    OrderItem.objects.create(order=order, dish=dish, quantity=2)
+    later = Order.objects.create(table_number=2)
+    OrderItem.objects.create(order=later, dish=dish, quantity=3)
+    OrderItem.objects.create(order=later, dish=soup, quantity=1)
+    paid = Order.objects.create(table_number=3, status=Order.PAID)
+    OrderItem.objects.create(order=paid, dish=soup, quantity=5)
+    api_client.force_authenticate(user=chef_user)
+    with django_assert_max_num_queries(1):
+        response = api_client.get('/api/v1/kitchen/queue/')
+    assert response.status_code == status.HTTP_200_OK
+    dishes = {row['name']: row for row in response.json()['dishes']}
+    # Ошибка: оплаченные заказы не должны попадать в очередь кухни.
+    assert dishes['Суп']['quantity'] == 1
+    assert dishes[dish.name]['quantity'] == 5
+    assert dishes[dish.name]['orders'] == 2
+    assert dishes[dish.name]['max_wait_seconds'] >= 0
+
+
+# Тест плана зала по сводке открытых заказов
+def test_tables_floor(api_client, waiter_user, order, dish,
+                      django_assert_num_queries,
+                      django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        OrderItem.objects.create(order=order, dish=dish, quantity=2)
+        second = Order.objects.create(table_number=1)
+        OrderItem.objects.create(order=second, dish=dish, quantity=1)
+        moved = Order.objects.create(table_number=7)
+        OrderItem.objects.create(order=moved, dish=dish, quantity=1)
+        moved = Order.objects.get(pk=moved.pk)
+        moved.table_number = 9
+        moved.save()
+        second = Order.objects.get(pk=second.pk)
+        second.status = Order.PAID
+        second.save()
+    api_client.force_authenticate(user=waiter_user)
+    # Ошибка: план зала не должен обходить таблицу заказов.
+    with django_assert_num_queries(1):
+        response = api_client.get('/api/v1/tables/')
+    tables = {row['table_number']: row for row in response.json()}
+    assert len(tables) == 50
+    assert tables[1]['open_orders'] == 1
+    assert tables[1]['bill'] == '200.00'
+    assert not tables[7]['occupied']
+    assert tables[9]['bill'] == '100.00'
+    # Повторный запрос берётся из кеша процесса.
+    with django_assert_num_queries(0):
+        api_client.get('/api/v1/tables/')
+
+    with django_capture_on_commit_callbacks(execute=True):
+        order.delete()
+    tables = {
+        row['table_number']: row
+        for row in api_client.get('/api/v1/tables/').json()
+    }
+    assert tables[1] == {
+        'table_number': 1, 'open_orders': 0, 'bill': '0.00',
+        'occupied': False
+    }
+
+
+# Тест закрытия счёта стола
+def test_table_settle(api_client, admin_user, waiter_user, order, dish):
+    soup = Dish.objects.create(name='Суп', price=Decimal('50.00'))
+    OrderItem.objects.create(order=order, dish=dish, quantity=2)
+    second = Order.objects.create(table_number=1)
+    OrderItem.objects.create(order=second, dish=dish, quantity=1)
+    OrderItem.objects.create(order=second, dish=soup, quantity=2)
+    other = Order.objects.create(table_number=2)
+    url = '/api/v1/tables/1/settle/'
+
+    api_client.force_authenticate(user=waiter_user)
+    assert api_client.post(url).status_code == status.HTTP_403_FORBIDDEN
+
+    api_client.force_authenticate(user=admin_user)
+    response = api_client.post(url)
+    assert response.status_code == status.HTTP_200_OK
+    bill = response.json()
+    assert bill['orders'] == [order.id, second.id]
+    assert bill['total'] == '400.00'
+    assert {line['name']: line['quantity'] for line in bill['lines']} == {
+        dish.name: 3, 'Суп': 2
+    }
+    # Ошибка: все заказы стола должны стать оплаченными.
+    assert set(Order.objects.filter(table_number=1).values_list(
+        'status', flat=True)) == {Order.PAID}
+    assert Order.objects.get(pk=other.pk).status == Order.PENDING
+    assert TableState.objects.get(table_number=1).open_orders == 0
+    revenue = api_client.get('/api/v1/revenue/').json()['total_revenue']
+    assert revenue == 400.0
+    changes = api_client.get(
+        '/api/v1/orders/changes/', {'since': order.change_seq}
+    ).json()
+    assert {o['id'] for o in changes['upserted']} >= {order.id, second.id}
+
+    assert api_client.post(url).status_code == status.HTTP_404_NOT_FOUND
+
+
+# Тест архивации оплаченных заказов и чтения архива
+def test_archive_paid_orders(api_client, client, admin_user, waiter_user,
+                             dish):
+    old = timezone.now() - timedelta(days=40)
+    archived = Order.objects.create(
+        table_number=1, status=Order.PAID, created_at=old
+    )
+    OrderItem.objects.create(order=archived, dish=dish, quantity=2)
+    fresh = Order.objects.create(table_number=2, status=Order.PAID)
+    pending = Order.objects.create(
+        table_number=3, status=Order.PENDING, created_at=old
+    )
+    OrderItem.objects.create(order=fresh, dish=dish, quantity=1)
+    cursor = OrderChange.objects.latest('pk').pk
+    api_client.force_authenticate(user=admin_user)
+    revenue = api_client.get('/api/v1/revenue/').json()
+    assert revenue == {'total_revenue': 300.0}
+
+    call_command('archive_orders', days=30, stdout=StringIO())
+    # Ошибка: в рабочей таблице должны остаться только свежие и открытые.
+    assert set(Order.objects.values_list('pk', flat=True)) == {
+        fresh.pk, pending.pk
+    }
+    assert not OrderItem.objects.filter(order_id=archived.pk).exists()
+    # Ошибка: архивация не должна менять выручку.
+    assert api_client.get('/api/v1/revenue/').json() == revenue
+    client.force_login(admin_user)
+    response = client.get(reverse('orders:revenue'))
+    assert response.context['total_revenue'] == Decimal('300.00')
+
+    api_client.force_authenticate(user=waiter_user)
+    url = '/api/v1/archive/orders/'
+    assert api_client.get(url).status_code == status.HTTP_403_FORBIDDEN
+    api_client.force_authenticate(user=admin_user)
+    data = api_client.get(url, {'table_number': 1}).json()
+    assert data['count'] == 1
+    result = data['results'][0]
+    assert result['id'] == archived.pk
+    assert result['total_price'] == '200.00'
+    assert result['items'] == [{
+        'dish_id': dish.pk, 'dish_name': dish.name, 'price': '100.00',
+        'quantity': 2
+    }]
+    changes = api_client.get(
+        '/api/v1/orders/changes/', {'since': cursor}
+    ).json()
+    assert changes['deleted'] == [archived.pk]
+
+
+# Тест повторов запросов с Idempotency-Key
+def test_idempotent_order_create(api_client, waiter_user, admin_user, dish,
+                                 monkeypatch):
+    api_client.force_authenticate(user=waiter_user)
+    url = '/api/v1/orders/'
+    data = {'table_number': 3, 'order_items': [
+        {'dish_id': dish.id, 'quantity': 1}
+    ]}
+    first = api_client.post(url, data, format='json',
+                            HTTP_IDEMPOTENCY_KEY='tablet-1')
+    retry = api_client.post(url, data, format='json',
+                            HTTP_IDEMPOTENCY_KEY='tablet-1')
+    assert first.status_code == retry.status_code == status.HTTP_201_CREATED
+    assert retry.json() == first.json()
+    assert retry['Idempotent-Replayed'] == 'true'
+    # Ошибка: повтор не должен создавать второй заказ.
+    assert Order.objects.filter(table_number=3).count() == 1
+    data['table_number'] = 4
+    response = api_client.post(url, data, format='json',
+                               HTTP_IDEMPOTENCY_KEY='tablet-1')
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    # Дубль, пришедший во время выполнения первого запроса, не выполняется.
+    create = OrderWriteSerializer.create
+    duplicates = []
+
+    def create_with_duplicate(serializer, validated_data):
+        duplicates.append(api_client.post(
+            url, data, format='json', HTTP_IDEMPOTENCY_KEY='tablet-2'
+        ))
+        return create(serializer, validated_data)
+
+    monkeypatch.setattr(OrderWriteSerializer, 'create', create_with_duplicate)
+    response = api_client.post(url, data, format='json',
+                               HTTP_IDEMPOTENCY_KEY='tablet-2')
+    assert response.status_code == status.HTTP_201_CREATED
+    assert duplicates[0].status_code == status.HTTP_409_CONFLICT
+    assert Order.objects.filter(table_number=4).count() == 1
+    monkeypatch.undo()
+
+    order = Order.objects.get(table_number=4)
+    api_client.force_authenticate(user=admin_user)
+    status_url = f'/api/v1/orders/{order.id}/change-status/'
+    for _ in range(2):
+        response = api_client.patch(status_url, {'status': Order.READY},
+                                    format='json',
+                                    HTTP_IDEMPOTENCY_KEY='status-1')
+        assert response.status_code == status.HTTP_200_OK
+    assert OrderChange.objects.filter(order_id=order.id).count() == 1
+
+    # Ответ не сохранился — заказ тоже не должен остаться в БД.
+    save = IdempotencyKey.save
+
+    def failing_save(record, *args, **kwargs):
+        if kwargs.get('update_fields'):
+            raise DatabaseError('сбой записи ключа')
+        return save(record, *args, **kwargs)
+
+    monkeypatch.setattr(IdempotencyKey, 'save', failing_save)
+    api_client.force_authenticate(user=waiter_user)
+    data['table_number'] = 5
+    with pytest.raises(DatabaseError):
+        api_client.post(url, data, format='json',
+                        HTTP_IDEMPOTENCY_KEY='tablet-3')
+    # Ошибка: изменения запроса зафиксированы без сохранённого ответа.
+    assert not Order.objects.filter(table_number=5).exists()
+    assert not IdempotencyKey.objects.filter(key='tablet-3').exists()
+
+
+# Тест вытеснения старых ключей идемпотентности
+def test_idempotency_keys_purged(db, settings):
+    settings.IDEMPOTENCY_MAX_KEYS = 2
+    old = IdempotencyKey.objects.create(
+        scope='1:', key='old', fingerprint='x',
+        created_at=timezone.now() - timedelta(days=2)
+    )
+    keys = [
+        IdempotencyKey.objects.create(scope='1:', key=str(n), fingerprint='x')
+        for n in range(3)
+    ]
+    purge()
+    assert set(IdempotencyKey.objects.values_list('pk', flat=True)) == {
+        keys[1].pk, keys[2].pk
+    }
+    assert not IdempotencyKey.objects.filter(pk=old.pk).exists()
@@ -1,12 +1,24 @@
 from django.urls import include, path
-from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 from rest_framework.authtoken.views import obtain_auth_token
 from rest_framework.routers import DefaultRouter
 
-from .views import AdminUserCreateAPIView, OrderViewSet, RevenueReportAPIView
+from . import async_views
+from .schema import docs_view, schema_view
+from .views import (
+    AdminUserCreateAPIView,
+    ArchivedOrderViewSet,
+    KitchenQueueAPIView,
+    OrderViewSet,
+    RevenueReportAPIView,
+    TableViewSet,
+)
 
 router_v1 = DefaultRouter()
 router_v1.register(r'orders', OrderViewSet, basename='order')
+router_v1.register(r'tables', TableViewSet, basename='table')
+router_v1.register(
+    r'archive/orders', ArchivedOrderViewSet, basename='archived-order'
+)
 
 urlpatterns = [
     path('login/', obtain_auth_token, name='api_token_auth'),
@@ -19,12 +31,32 @@ urlpatterns = [
         name='revenue_report'
     ),
     path(
-        'schema/', SpectacularAPIView.as_view(),
+        'kitchen/queue/', KitchenQueueAPIView.as_view(),
+        name='kitchen_queue'
+    ),
+    path(
+        'schema/', schema_view,
         name='schema'
     ),
     path(
-        'docs/', SpectacularSwaggerView.as_view(url_name='schema'),
+        'docs/', docs_view,
         name='swagger-ui'
     ),
+    path(
+        'orders/events/', async_views.order_events,
+        name='order_events'
+    ),
+    path(
+        'async/orders/', async_views.order_list,
+        name='async_order_list'
+    ),
+    path(
+        'async/orders/<int:pk>/', async_views.order_detail,
+        name='async_order_detail'
+    ),
+    path(
+        'async/revenue/', async_views.revenue_report,
+        name='async_revenue_report'
+    ),
     path('', include(router_v1.urls)),
 ]
@@ -1,22 +1,42 @@
-from django.db.models import Sum
+from django.db import router, transaction
+from django.db.models import Count, Min, Sum
+from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.decorators import action
 from rest_framework.filters import OrderingFilter
 from rest_framework.generics import CreateAPIView
 from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
-from rest_framework.status import HTTP_400_BAD_REQUEST, HTTP_403_FORBIDDEN
+from rest_framework.status import (
+    HTTP_400_BAD_REQUEST,
+    HTTP_403_FORBIDDEN,
+    HTTP_404_NOT_FOUND,
+)
 from rest_framework.views import APIView
-from rest_framework.viewsets import ModelViewSet
+from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet, ViewSet
 
-from orders.models import Order
-from .filters import OrderFilter
-from .permissions import CustomOrderPermission
+from orders.models import (
+    ArchivedOrder,
+    Order,
+    OrderChange,
+    OrderItem,
+    TableState,
+)
+from orders.invalidation import LocalCache
+from orders.locations import current_database
+from orders.replicas import replica_reads
+from orders.signals import orders_bulk_updated
+from .filters import ArchivedOrderFilter, OrderFilter
+from .idempotency import idempotent
+from .permissions import CustomOrderPermission, IsAdminRole
 from .serializers import (
+    ArchivedOrderSerializer,
     CustomUserSerializer,
     OrderReadSerializer,
     OrderStatusSerializer,
     OrderWriteSerializer,
+    TableBillSerializer,
+    TableStateSerializer,
 )
 
 
@@ -35,6 +55,7 @@ class OrderViewSet(ModelViewSet):
     API для CRUD операций с заказами.
     Поддерживается фильтрация по номеру стола и статусу,
     сортировка по id заказа, а также частичное обновление статуса заказа.
+    Создание и смена статуса принимают заголовок Idempotency-Key.
     """
 
     queryset = Order.objects.all().prefetch_related('order_items__dish')
@@ -44,6 +65,7 @@ class OrderViewSet(ModelViewSet):
     http_method_names = ['get', 'post', 'patch', 'delete']
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     ordering_fields = ['id']
+    changes_limit = 500
 
     def get_serializer_class(self):
         if self.action == 'change_status':
@@ -52,7 +74,12 @@ class OrderViewSet(ModelViewSet):
             return OrderWriteSerializer
         return super().get_serializer_class()
 
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
     @action(detail=True, methods=['patch'], url_path='change-status')
+    @idempotent
     def change_status(self, request, pk=None):
 
         order = self.get_object()
@@ -72,13 +99,219 @@ class OrderViewSet(ModelViewSet):
         order.save(update_fields=['status', 'total_price'])
         return Response({'status': order.get_status_display()})
 
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        """
+        Дельта-синхронизация: заказы, изменённые после курсора since.
+
+        Возвращает новый курсор, изменённые заказы (upserted) и id заказов,
+        которые клиент должен убрать у себя (deleted): удалённые и
+        переставшие подходить под фильтр. При has_more клиент повторяет
+        запрос с полученным курсором.
+        """
+        try:
+            since = int(request.query_params.get('since', 0))
+        except ValueError:
+            since = -1
+        if since < 0:
+            return Response(
+                {'error': 'Параметр since должен быть целым числом >= 0'},
+                status=HTTP_400_BAD_REQUEST
+            )
+        cursor = OrderChange.last_seq()
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            change_seq__lte=cursor
+        )
+        if since:
+            queryset = queryset.filter(change_seq__gt=since)
+        # Страница заканчивается на границе номера изменения, большего
+        # since: иначе заказы с тем же номером потерялись бы, а курсор мог
+        # бы не сдвинуться.
+        upserted = []
+        has_more = False
+        for order in queryset.order_by('change_seq', 'pk').iterator(
+            chunk_size=self.changes_limit + 1
+        ):
+            last = upserted[-1].change_seq if upserted else None
+            if (
+                len(upserted) >= self.changes_limit
+                and last > since and order.change_seq != last
+            ):
+                has_more = True
+                break
+            upserted.append(order)
+        if has_more:
+            cursor = upserted[-1].change_seq
+        deleted = set(OrderChange.objects.filter(
+            pk__gt=since, pk__lte=cursor, deleted=True
+        ).values_list('order_id', flat=True))
+        if since:
+            deleted.update(
+                Order.objects.filter(
+                    change_seq__gt=since, change_seq__lte=cursor
+                ).exclude(
+                    pk__in=[order.pk for order in upserted]
+                ).exclude(
+                    pk__in=queryset.values('pk')
+                ).values_list('pk', flat=True)
+            )
+        # Изменения новее безопасного курсора клиент получит ещё раз: среди
+        # них могут зафиксироваться транзакции с меньшими номерами. Страницу
+        # при has_more курсор должен пройти в любом случае.
+        safe = OrderChange.safe_cursor()
+        if safe > since or not has_more:
+            cursor = max(since, min(cursor, safe))
+        return Response({
+            'cursor': cursor,
+            'has_more': has_more,
+            'upserted': OrderReadSerializer(upserted, many=True).data,
+            'deleted': sorted(deleted),
+        })
+
 
 class RevenueReportAPIView(APIView):
     """
-    API для расчета выручки за смену (сумма заказов со статусом "Оплачено").
+    API для расчета выручки за смену (сумма заказов со статусом "Оплачено",
+    включая архивные).
     """
 
     def get(self, request):
-        total = Order.objects.filter(
-            status=Order.PAID).aggregate(total=Sum('total_price'))
-        return Response({'total_revenue': total['total'] or 0})
+        return Response({'total_revenue': Order.objects.revenue()})
+
+
+class KitchenQueueAPIView(APIView):
+    """
+    API очереди кухни: сколько каждого блюда нужно приготовить по всем
+    заказам в ожидании и сколько ждёт самый старый из них.
+    """
+
+    def get(self, request):
+        now = timezone.now()
+        rows = OrderItem.objects.filter(
+            order__status=Order.PENDING
+        ).values('dish_id', 'dish__name').annotate(
+            quantity=Sum('quantity'),
+            orders=Count('order_id'),
+            oldest=Min('order__created_at'),
+        ).order_by('oldest', 'dish__name')
+        return Response({
+            'generated_at': now,
+            'dishes': [
+                {
+                    'dish_id': row['dish_id'],
+                    'name': row['dish__name'],
+                    'quantity': row['quantity'],
+                    'orders': row['orders'],
+                    'oldest_order_at': row['oldest'],
+                    'max_wait_seconds': int(
+                        (now - row['oldest']).total_seconds()
+                    ),
+                }
+                for row in rows
+            ],
+        })
+
+
+class TableViewSet(ViewSet):
+    """
+    API плана зала: по каждому столу число открытых заказов и текущий счёт.
+    Данные берутся из сводки TableState, без обхода таблицы заказов, и
+    кешируются в процессе до сообщения шины инвалидации.
+    Администратор может закрыть счёт стола целиком (settle).
+    """
+
+    floor_plan_cache = LocalCache('tables')
+
+    def list(self, request):
+        return Response(self.floor_plan_cache.get_or_set(
+            current_database(), self.floor_plan
+        ))
+
+    @staticmethod
+    def floor_plan():
+        # Кешируется надолго, поэтому читается из основной БД, а не с
+        # отстающей реплики.
+        with replica_reads(False):
+            states = {
+                state.table_number: state
+                for state in TableState.objects.all()
+            }
+        tables = [
+            states.get(number, TableState(table_number=number))
+            for number in range(1, TableState.TABLE_COUNT + 1)
+        ]
+        return TableStateSerializer(tables, many=True).data
+
+    @action(detail=True, methods=['post'])
+    def settle(self, request, pk=None):
+        """
+        Отмечает все открытые заказы стола оплаченными одним UPDATE и
+        возвращает общий счёт с позициями, сгруппированными по блюдам.
+        """
+        if not request.user.is_admin:
+            return Response(
+                {'error': 'Закрыть счёт стола может только администратор.'},
+                status=HTTP_403_FORBIDDEN
+            )
+        try:
+            table_number = int(pk)
+        except ValueError:
+            table_number = 0
+        if not 1 <= table_number <= TableState.TABLE_COUNT:
+            return Response(
+                {'error': 'Неверный номер стола'},
+                status=HTTP_400_BAD_REQUEST
+            )
+        with transaction.atomic(using=router.db_for_write(Order)):
+            orders = list(
+                Order.objects.select_for_update().filter(
+                    table_number=table_number
+                ).exclude(status=Order.PAID).only(
+                    'pk', 'table_number', 'status', 'change_seq'
+                ).order_by('pk')
+            )
+            if not orders:
+                return Response(
+                    {'error': 'У стола нет открытых заказов'},
+                    status=HTTP_404_NOT_FOUND
+                )
+            order_ids = [order.pk for order in orders]
+            Order.objects.filter(pk__in=order_ids).recalc_totals(
+                status=Order.PAID
+            )
+            lines = [
+                {
+                    'dish_id': row['dish_id'],
+                    'name': row['dish__name'],
+                    'price': row['unit_price'],
+                    'quantity': row['dish_quantity'],
+                    'amount': row['amount'],
+                }
+                for row in OrderItem.objects.filter(
+                    order_id__in=order_ids
+                ).values('dish_id', 'dish__name', 'unit_price').annotate(
+                    dish_quantity=Sum('quantity'),
+                    amount=Sum('line_total'),
+                ).order_by('dish__name', 'unit_price')
+            ]
+            for order in orders:
+                order.status = Order.PAID
+            orders_bulk_updated.send(sender=Order, orders=orders)
+        return Response(TableBillSerializer({
+            'table_number': table_number,
+            'orders': order_ids,
+            'lines': lines,
+            'total': sum(line['amount'] for line in lines),
+        }).data)
+
+
+class ArchivedOrderViewSet(ReadOnlyModelViewSet):
+    """
+    API только для чтения архива оплаченных заказов.
+    Фильтрация по номеру стола и периоду создания, доступ — администратору.
+    """
+
+    queryset = ArchivedOrder.objects.prefetch_related('items')
+    serializer_class = ArchivedOrderSerializer
+    filterset_class = ArchivedOrderFilter
+    permission_classes = [IsAdminRole]
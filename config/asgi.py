@@ -5,3 +5,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_asgi_application()
+
+# Импорт после настройки Django: модуль использует модели и URLconf.
+from orders.warmup import warmup_on_startup  # noqa: E402
+
+warmup_on_startup()
@@ -1,13 +1,15 @@
 import os
 from pathlib import Path
 
-from dotenv import find_dotenv, load_dotenv
-
-load_dotenv(find_dotenv())
-
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# .env читается из корня проекта без поиска по дереву каталогов.
+if (BASE_DIR / '.env').exists():
+    from dotenv import load_dotenv
+
+    load_dotenv(BASE_DIR / '.env')
+
 # Настройки для продакшен.
 # SECRET_KEY = os.environ.get('SECRET_KEY')
 
@@ -23,6 +25,9 @@ DEBUG = os.environ.get('DEBUG', 'False') == 'True'
 
 ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', 'localhost,127.0.0.1').split(',')
 
+# Версия кода: ключ для кэшей, зависящих от кода (например, схемы API).
+APP_VERSION = os.getenv('APP_VERSION', 'dev')
+
 
 # Application definition
 
@@ -44,11 +49,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'orders.middleware.MetricsMiddleware',
+    'orders.middleware.AdmissionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'orders.middleware.LocationMiddleware',
+    'orders.middleware.ReplicaMiddleware',
+    'orders.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -80,10 +90,51 @@ WSGI_APPLICATION = 'config.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': BASE_DIR / os.getenv('DATABASE_NAME', 'db.sqlite3'),
     }
 }
 
+# Кафе сети: у каждого своя БД с заказами и меню (псевдоним cafe_<кафе>).
+# Пользователи и токены остаются в default. Кафе запроса определяется по
+# заголовку X-Location, хосту (LOCATION_HOSTS) или пользователю.
+CAFE_LOCATIONS = [
+    location.strip()
+    for location in os.getenv('CAFE_LOCATIONS', '').split(',')
+    if location.strip()
+]
+for location in CAFE_LOCATIONS:
+    DATABASES[f'cafe_{location}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / f'db_{location}.sqlite3',
+    }
+LOCATION_HOSTS = dict(
+    pair.split('=', 1)
+    for pair in os.getenv('LOCATION_HOSTS', '').split(',')
+    if '=' in pair
+)
+
+# Реплики для чтения: DATABASE_REPLICAS="default=db_replica.sqlite3,..."
+# добавляет псевдоним <основная>_replica. SQLite-реплику обновляет команда
+# sync_replica. После записи клиент ещё REPLICA_READ_YOUR_WRITES_SECONDS
+# секунд читает из основной БД.
+DATABASE_REPLICAS = {}
+for pair in os.getenv('DATABASE_REPLICAS', '').split(','):
+    primary, _, name = pair.partition('=')
+    if primary in DATABASES and name:
+        DATABASES[f'{primary}_replica'] = {
+            **DATABASES[primary],
+            'NAME': BASE_DIR / name,
+            'TEST': {'MIRROR': primary},
+        }
+        DATABASE_REPLICAS[primary] = f'{primary}_replica'
+REPLICA_READ_YOUR_WRITES_SECONDS = float(
+    os.getenv('REPLICA_READ_YOUR_WRITES_SECONDS', '5')
+)
+REPLICA_HEALTH_CHECK_INTERVAL = float(
+    os.getenv('REPLICA_HEALTH_CHECK_INTERVAL', '10')
+)
+DATABASE_ROUTERS = ['orders.replicas.ReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -143,3 +194,118 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
 }
+
+# Профилирование запросов (см. orders.middleware.ProfilingMiddleware).
+PROFILING_DIR = BASE_DIR / os.getenv('PROFILING_DIR', 'profiles')
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_KEEP = int(os.getenv('PROFILING_KEEP', '50'))
+PROFILING_TOP = int(os.getenv('PROFILING_TOP', '30'))
+
+# Метрики Prometheus (/metrics). Процессы сбрасывают их в общий SQLite-файл.
+METRICS_DB = BASE_DIR / os.getenv('METRICS_DB', 'metrics.sqlite3')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '1'))
+# Токен для сборщика (Authorization: Bearer <токен>). Без токена метрики
+# доступны только администраторам.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Архивация оплаченных заказов (команда archive_orders). При ненулевом
+# интервале (в секундах) исполнитель run_worker ставит архивацию в очередь.
+ORDERS_ARCHIVE_AFTER_DAYS = int(os.getenv('ORDERS_ARCHIVE_AFTER_DAYS', '30'))
+ORDERS_ARCHIVE_CHUNK_SIZE = int(os.getenv('ORDERS_ARCHIVE_CHUNK_SIZE', '1000'))
+ORDERS_ARCHIVE_INTERVAL = int(os.getenv('ORDERS_ARCHIVE_INTERVAL', '0'))
+
+# Шина инвалидации локальных кешей между воркерами: сообщения хранятся в
+# общем SQLite-файле, каждый воркер читает их раз в
+# INVALIDATION_POLL_INTERVAL секунд (0 — при каждом чтении локального кеша).
+INVALIDATION_DB = BASE_DIR / os.getenv(
+    'INVALIDATION_DB', 'invalidation.sqlite3'
+)
+INVALIDATION_POLL_INTERVAL = float(
+    os.getenv('INVALIDATION_POLL_INTERVAL', '1')
+)
+INVALIDATION_RETENTION = int(os.getenv('INVALIDATION_RETENTION', '10000'))
+
+# Ответы на запросы с Idempotency-Key хранятся IDEMPOTENCY_KEY_TTL секунд,
+# не более IDEMPOTENCY_MAX_KEYS штук. Незавершённый запрос старше
+# IDEMPOTENCY_LOCK_TIMEOUT секунд считается брошенным.
+IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', '86400'))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv('IDEMPOTENCY_MAX_KEYS', '100000'))
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.getenv('IDEMPOTENCY_LOCK_TIMEOUT', '60'))
+
+# Хранить денежные суммы целым числом копеек (orders.fields.MoneyField).
+# Значение должно совпадать со схемой БД: оно учитывается миграцией
+# orders 0011, поэтому выбирается до неё.
+MONEY_MINOR_UNITS = os.getenv('MONEY_MINOR_UNITS', 'False') == 'True'
+
+# При изменении цены блюда открытые заказы пересчитываются сразу, если их не
+# больше порога, иначе — в фоне.
+ORDERS_PRICE_PROPAGATION_BACKGROUND_THRESHOLD = int(
+    os.getenv('ORDERS_PRICE_PROPAGATION_BACKGROUND_THRESHOLD', '500')
+)
+
+# Очередь фоновых задач (команда run_worker). Задача удерживается
+# исполнителем JOBS_LEASE_SECONDS секунд с продлением; неудачные попытки
+# повторяются с задержкой от JOBS_RETRY_BASE_DELAY до JOBS_RETRY_MAX_DELAY
+# секунд, всего не более JOBS_MAX_ATTEMPTS раз.
+JOBS_LEASE_SECONDS = int(os.getenv('JOBS_LEASE_SECONDS', '60'))
+JOBS_MAX_ATTEMPTS = int(os.getenv('JOBS_MAX_ATTEMPTS', '5'))
+JOBS_RETRY_BASE_DELAY = int(os.getenv('JOBS_RETRY_BASE_DELAY', '5'))
+JOBS_RETRY_MAX_DELAY = int(os.getenv('JOBS_RETRY_MAX_DELAY', '600'))
+JOBS_CONCURRENCY = int(os.getenv('JOBS_CONCURRENCY', '4'))
+JOBS_POLL_INTERVAL = float(os.getenv('JOBS_POLL_INTERVAL', '1'))
+
+# Курсор дельта-синхронизации (/api/v1/orders/changes/, /rows/changes/) не
+# заходит в изменения моложе ORDERS_CHANGES_SAFETY_WINDOW секунд: их клиент
+# получит повторно. Окно должно быть больше самой долгой транзакции,
+# меняющей заказы. В SQLite не используется: записи там идут по одной.
+ORDERS_CHANGES_SAFETY_WINDOW = int(
+    os.getenv('ORDERS_CHANGES_SAFETY_WINDOW', '5')
+)
+
+# Ограничение одновременных запросов в процессе по классам: limit — сколько
+# запросов класса обрабатывается одновременно, max_wait — сколько секунд
+# запрос может ждать места, прежде чем получить 503. Записи (создание и
+# изменение заказов) ждут дольше, отчёты не ждут вовсе.
+# Лимиты по умолчанию считаются от SERVER_THREADS — числа потоков воркера,
+# обрабатывающих запросы (gunicorn --threads; под ASGI — ASGI_THREADS,
+# размер пула sync_to_async): чтения занимают не больше половины потоков,
+# отчёты — шестнадцатой части, остальное всегда доступно записям.
+ADMISSION_CONTROL_ENABLED = os.getenv(
+    'ADMISSION_CONTROL_ENABLED', 'True'
+) == 'True'
+SERVER_THREADS = int(
+    os.getenv('SERVER_THREADS') or os.getenv('ASGI_THREADS') or '32'
+)
+ADMISSION_CONTROL = {
+    'writes': {
+        'limit': int(os.getenv('ADMISSION_WRITES_LIMIT', SERVER_THREADS)),
+        'max_wait': float(os.getenv('ADMISSION_WRITES_MAX_WAIT', '5')),
+    },
+    'reads': {
+        'limit': int(os.getenv(
+            'ADMISSION_READS_LIMIT', max(1, SERVER_THREADS // 2)
+        )),
+        'max_wait': float(os.getenv('ADMISSION_READS_MAX_WAIT', '0.5')),
+    },
+    'reports': {
+        'limit': int(os.getenv(
+            'ADMISSION_REPORTS_LIMIT', max(1, SERVER_THREADS // 16)
+        )),
+        'max_wait': float(os.getenv('ADMISSION_REPORTS_MAX_WAIT', '0')),
+    },
+}
+ADMISSION_REPORT_ROUTES = (
+    'orders:revenue', 'revenue_report', 'async_revenue_report',
+)
+ADMISSION_EXEMPT_ROUTES = ('metrics', 'order_events')
+
+# Прогрев URL, сериализаторов и шаблонов при загрузке config.wsgi/config.asgi,
+# до приёма запросов воркером (см. orders.warmup).
+WARMUP_ON_STARTUP = os.getenv('WARMUP_ON_STARTUP', 'True') == 'True'
+
+# Схема OpenAPI собирается командой build_api_schema. Генерация при первом
+# запросе допустима только для разработки.
+API_SCHEMA_FILE = BASE_DIR / os.getenv('API_SCHEMA_FILE', 'openapi.json')
+API_SCHEMA_GENERATE_ON_REQUEST = os.getenv(
+    'API_SCHEMA_GENERATE_ON_REQUEST', str(DEBUG)
+) == 'True'
@@ -1,12 +1,15 @@
 from django.contrib import admin
 from django.urls import include, path
 
+from orders.metrics import metrics_view
+
 handler404 = 'orders.views.page_not_found'
 handler500 = 'orders.views.server_error'
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('accounts/', include('django.contrib.auth.urls')),
     path('api/v1/', include('api.urls')),
     path('', include('orders.urls', namespace='orders')),
@@ -5,3 +5,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+
+# Импорт после настройки Django: модуль использует модели и URLconf.
+from orders.warmup import warmup_on_startup  # noqa: E402
+
+warmup_on_startup()
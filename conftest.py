@@ -0,0 +1,10 @@
+import pytest
+
+
+# Метрики и шина инвалидации пишут во временные файлы, а не в файлы
+# проекта
+@pytest.fixture(autouse=True)
+def local_files(settings, tmp_path_factory):
+    path = tmp_path_factory.mktemp('local')
+    settings.METRICS_DB = path / 'metrics.sqlite3'
+    settings.INVALIDATION_DB = path / 'invalidation.sqlite3'
@@ -1,12 +1,56 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils import timezone
+from django.utils.functional import cached_property
 
-from .models import CustomUser, Dish, Order, OrderItem
+from . import signals
+from .models import CustomUser, Dish, Job, Order, OrderItem
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор для больших таблиц.
+
+    Для списка без фильтров вместо полного COUNT(*) в PostgreSQL берётся
+    оценка из статистики планировщика; если она меньше порога, выполняется
+    точный подсчёт. В остальных СУБД строки считаются не дальше
+    count_limit: для больших таблиц доступны первые count_limit строк, а
+    пустых страниц в конце списка не бывает.
+    """
+
+    exact_count_threshold = 10000
+    count_limit = 100000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if queryset.query.where:
+            return super().count
+        if connections[queryset.db].vendor != 'postgresql':
+            return queryset.order_by().values('pk')[:self.count_limit].count()
+        estimate = self._estimate(queryset)
+        if estimate < self.exact_count_threshold:
+            return super().count
+        return estimate
+
+    @staticmethod
+    def _estimate(queryset):
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+                [queryset.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+        # -1 — таблица ещё не анализировалась.
+        return row[0] if row else -1
 
 
 @admin.register(CustomUser)
 class UserAdmin(admin.ModelAdmin):
-    list_display = ('id', 'username', 'role', 'email', 'password',)
-    list_filter = ('role',)
+    list_display = ('id', 'username', 'role', 'location', 'email',
+                    'password',)
+    list_filter = ('role', 'location')
     search_fields = ('username',)
     ordering = ('username',)
     list_per_page = 10
@@ -20,6 +64,12 @@ class DishAdmin(admin.ModelAdmin):
     list_per_page = 10
 
 
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    autocomplete_fields = ('dish',)
+    extra = 0
+
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = (
@@ -29,6 +79,16 @@ class OrderAdmin(admin.ModelAdmin):
     list_filter = ('status', )
     search_fields = ('id', 'table_number',)
     list_per_page = 10
+    inlines = (OrderItemInline,)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('dishes')
+
+    def changeform_view(self, *args, **kwargs):
+        with signals.batched():
+            return super().changeform_view(*args, **kwargs)
 
     @admin.display(description='Блюда')
     def get_dishes(self, obj):
@@ -38,5 +98,32 @@ class OrderAdmin(admin.ModelAdmin):
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
     list_display = ('id', 'order', 'dish', 'quantity')
+    list_select_related = ('order', 'dish')
     search_fields = ('order__id', 'dish__name')
     list_filter = ('dish',)
+    autocomplete_fields = ('order', 'dish')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = (
+        'id', 'name', 'status', 'attempts', 'run_at', 'locked_by',
+        'finished_at'
+    )
+    list_filter = ('status', 'name')
+    readonly_fields = (
+        'attempts', 'locked_by', 'lease_expires', 'last_error',
+        'created_at', 'finished_at'
+    )
+    actions = ('retry',)
+    list_per_page = 20
+
+    @admin.action(description='Повторить сейчас')
+    def retry(self, request, queryset):
+        updated = queryset.exclude(status=Job.RUNNING).update(
+            status=Job.QUEUED, attempts=0, run_at=timezone.now(),
+            locked_by='', lease_expires=None, finished_at=None
+        )
+        self.message_user(request, f'Поставлено в очередь задач: {updated}')
@@ -0,0 +1,185 @@
+"""
+Ограничение числа одновременно обрабатываемых запросов.
+
+Запросы делятся на классы (ADMISSION_CONTROL): записи, чтения и отчёты. У
+каждого класса свой лимит одновременных запросов и допустимое время
+ожидания в очереди, поэтому опрос списков и тяжёлые отчёты не занимают
+потоки, нужные для создания заказов. Если по измеренному времени
+обработки очередь класса не успеет освободиться за допустимое время,
+запрос сразу отклоняется с 503 и Retry-After. Лимиты действуют в пределах
+процесса.
+
+Под WSGI запрос ждёт места в потоке (threading.BoundedSemaphore), под
+ASGI — в цикле событий (asyncio.Semaphore), не занимая поток пула.
+"""
+import asyncio
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.urls import Resolver404, resolve
+
+from . import metrics
+
+WRITES = 'writes'
+READS = 'reads'
+REPORTS = 'reports'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# Вес нового замера в скользящем среднем времени обработки.
+SMOOTHING = 0.2
+
+
+class Gate:
+    """Семафор класса запросов с оценкой времени ожидания."""
+
+    def __init__(self, name, limit, max_wait):
+        self.name = name
+        self.limit = limit
+        self.max_wait = max_wait
+        self.service_time = 0.0
+        self.waiting = 0
+        self._semaphore = threading.BoundedSemaphore(limit)
+        self._async_semaphore = None
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def expected_wait(self):
+        """Сколько ждать следующему запросу, если все места заняты."""
+        return self.service_time * (self.waiting + 1) / self.limit
+
+    def _start_waiting(self):
+        """Встаёт в очередь или возвращает паузу, если ждать слишком долго."""
+        with self._lock:
+            expected = self.expected_wait()
+            if expected > self.max_wait:
+                return expected
+            self.waiting += 1
+        return None
+
+    def _stop_waiting(self):
+        with self._lock:
+            self.waiting -= 1
+
+    def _waited(self, admitted, started):
+        waited = time.perf_counter() - started
+        if not admitted:
+            return False, max(self.expected_wait(), waited)
+        return True, waited
+
+    def enter(self):
+        """
+        Занимает место. Возвращает (True, время ожидания) или
+        (False, рекомендуемую паузу до повтора).
+        """
+        if self._semaphore.acquire(blocking=False):
+            return True, 0.0
+        expected = self._start_waiting()
+        if expected is not None:
+            return False, expected
+        started = time.perf_counter()
+        try:
+            admitted = self._semaphore.acquire(timeout=self.max_wait)
+        finally:
+            self._stop_waiting()
+        return self._waited(admitted, started)
+
+    def _record(self, elapsed):
+        with self._lock:
+            self.service_time += SMOOTHING * (elapsed - self.service_time)
+
+    def leave(self, elapsed):
+        self._record(elapsed)
+        self._semaphore.release()
+
+    def async_semaphore(self):
+        """Семафор класса для текущего цикла событий."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._async_semaphore = asyncio.BoundedSemaphore(self.limit)
+        return self._async_semaphore
+
+    async def aenter(self):
+        """Асинхронный аналог enter() для ASGI."""
+        semaphore = self.async_semaphore()
+        if not semaphore.locked():
+            await semaphore.acquire()
+            return True, 0.0
+        expected = self._start_waiting()
+        if expected is not None:
+            return False, expected
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self.max_wait)
+            admitted = True
+        except asyncio.TimeoutError:
+            admitted = False
+        finally:
+            self._stop_waiting()
+        return self._waited(admitted, started)
+
+    def aleave(self, elapsed):
+        self._record(elapsed)
+        self.async_semaphore().release()
+
+    @staticmethod
+    def retry_after(seconds):
+        return str(max(1, math.ceil(seconds)))
+
+
+_gates = None
+_gates_lock = threading.Lock()
+
+
+def get_gates():
+    global _gates
+    if _gates is None:
+        with _gates_lock:
+            if _gates is None:
+                _gates = {
+                    name: Gate(name, limits['limit'], limits['max_wait'])
+                    for name, limits in settings.ADMISSION_CONTROL.items()
+                }
+    return _gates
+
+
+@receiver(setting_changed)
+def reset_gates(setting, **kwargs):
+    global _gates
+    if setting == 'ADMISSION_CONTROL':
+        _gates = None
+
+
+def classify(request):
+    """
+    Класс запроса по маршруту и методу; None для маршрутов без
+    ограничений (долгие потоки событий, метрики).
+    """
+    try:
+        match = resolve(request.path_info)
+    except Resolver404:
+        pass
+    else:
+        request.resolver_match = match
+        if match.view_name in settings.ADMISSION_EXEMPT_ROUTES:
+            return None
+        if match.view_name in settings.ADMISSION_REPORT_ROUTES:
+            return REPORTS
+    return READS if request.method in SAFE_METHODS else WRITES
+
+
+def gate_for(request):
+    name = classify(request)
+    return None if name is None else get_gates().get(name)
+
+
+def observe(gate, admitted, waited):
+    labels = {'class': gate.name}
+    if admitted:
+        metrics.observe('admission_queue_seconds', waited, labels)
+    else:
+        metrics.inc('admission_rejected_total', labels)
@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.core.signals import request_started
 
 
 class OrdersConfig(AppConfig):
@@ -7,3 +8,11 @@ class OrdersConfig(AppConfig):
 
     def ready(self):
         import orders.signals  # noqa: F401
+        # Модули с задачами регистрируют их в очереди при импорте.
+        import orders.archive  # noqa: F401
+        import orders.pricing  # noqa: F401
+        from orders.invalidation import start_poller
+
+        request_started.connect(
+            start_poller, dispatch_uid='orders-invalidation'
+        )
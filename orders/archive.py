@@ -0,0 +1,104 @@
+"""
+Перенос старых оплаченных заказов в архивные таблицы.
+
+Рабочие таблицы Order и OrderItem остаются небольшими: списки, фильтры и
+админка не обходят историю. Архив читается через отдельный API.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from . import metrics
+from .jobs import task
+from .models import (
+    ArchivedOrder,
+    ArchivedOrderItem,
+    Order,
+    OrderChange,
+    OrderItem,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _delete_live_rows(using, order_ids):
+    # Удаляем напрямую, без сигналов: обработчики удаления OrderItem
+    # пересчитывали бы сумму каждого удаляемого заказа. signals.disabled()
+    # не подходит — он отключает обработчики во всём процессе, в том числе
+    # для параллельных задач исполнителя.
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    placeholders = ', '.join(['%s'] * len(order_ids))
+    with connection.cursor() as cursor:
+        for field in (OrderItem._meta.get_field('order'), Order._meta.pk):
+            cursor.execute(
+                f'DELETE FROM {quote(field.model._meta.db_table)} '
+                f'WHERE {quote(field.column)} IN ({placeholders})',
+                order_ids
+            )
+
+
+def archive_chunk(cutoff, chunk_size):
+    """Архивирует одну порцию заказов; возвращает их количество."""
+    using = router.db_for_write(Order)
+    with transaction.atomic(using=using):
+        orders = list(
+            Order.objects.using(using).select_for_update(
+                skip_locked=True
+            ).filter(
+                status=Order.PAID, created_at__lt=cutoff
+            ).order_by('pk')[:chunk_size]
+        )
+        if not orders:
+            return 0
+        order_ids = [order.pk for order in orders]
+        ArchivedOrder.objects.using(using).bulk_create([
+            ArchivedOrder(
+                id=order.pk, table_number=order.table_number,
+                status=order.status, total_price=order.total_price,
+                created_at=order.created_at,
+            )
+            for order in orders
+        ])
+        ArchivedOrderItem.objects.using(using).bulk_create([
+            ArchivedOrderItem(
+                order_id=item['order_id'], dish_id=item['dish_id'],
+                dish_name=item['dish__name'], price=item['unit_price'],
+                quantity=item['quantity'],
+            )
+            for item in OrderItem.objects.using(using).filter(
+                order_id__in=order_ids
+            ).values(
+                'order_id', 'dish_id', 'dish__name', 'unit_price',
+                'quantity'
+            )
+        ])
+        _delete_live_rows(using, order_ids)
+        OrderChange.record_many(order_ids, deleted=True)
+    metrics.inc('orders_archived_total', value=len(order_ids))
+    return len(order_ids)
+
+
+def archive_paid_orders(older_than=None, chunk_size=None):
+    """
+    Переносит в архив оплаченные заказы старше older_than порциями по
+    chunk_size, каждая в своей транзакции. Возвращает число заказов.
+    """
+    if older_than is None:
+        older_than = timedelta(days=settings.ORDERS_ARCHIVE_AFTER_DAYS)
+    chunk_size = chunk_size or settings.ORDERS_ARCHIVE_CHUNK_SIZE
+    cutoff = timezone.now() - older_than
+    total = 0
+    while archived := archive_chunk(cutoff, chunk_size):
+        total += archived
+    return total
+
+
+@task('archive_paid_orders')
+def archive_paid_orders_task():
+    archived = archive_paid_orders()
+    if archived:
+        logger.info('В архив перенесено заказов: %s', archived)
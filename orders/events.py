@@ -0,0 +1,102 @@
+"""
+Внутрипроцессная шина событий заказов для push-уведомлений (SSE).
+
+Публиковать события можно из любого потока: каждый подписчик получает их
+через asyncio.Queue в своём event loop. Событие получают только подписчики
+того же кафе, что и заказ.
+"""
+import asyncio
+import threading
+import time
+
+from django.db import transaction
+
+from .locations import location_for
+
+ORDER_CREATED = 'order_created'
+ORDER_DELETED = 'order_deleted'
+STATUS_CHANGED = 'status_changed'
+LINES_CHANGED = 'lines_changed'
+
+
+class Subscription:
+    """Очередь событий одного подключённого клиента."""
+
+    def __init__(self, loop, maxsize, location=None):
+        self.loop = loop
+        self.location = location
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Клиент не успевает читать: дальше он должен
+            # пересинхронизироваться через /api/v1/orders/changes/.
+            self.overflowed = True
+
+    async def get(self, timeout):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def drain(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.overflowed = False
+
+
+class EventHub:
+    """Рассылает события подписчикам процесса из того же кафе."""
+
+    def __init__(self, maxsize=100):
+        self.maxsize = maxsize
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+    def subscribe(self, location=None):
+        subscription = Subscription(
+            asyncio.get_running_loop(), self.maxsize, location
+        )
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, event, location=None):
+        with self._lock:
+            subscriptions = [
+                subscription for subscription in self._subscriptions
+                if subscription.location == location
+            ]
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(
+                    subscription.put, event
+                )
+            except RuntimeError:
+                self.unsubscribe(subscription)
+
+
+hub = EventHub()
+
+
+def publish_order_event(event, order):
+    """Публикует событие заказа после фиксации транзакции."""
+    payload = {
+        'event': event,
+        'order_id': order.pk,
+        'table_number': order.table_number,
+        'status': order.status,
+        'change_seq': order.change_seq,
+        'ts': time.time(),
+    }
+    location = location_for(order._state.db)
+    transaction.on_commit(
+        lambda: hub.publish(payload, location), using=order._state.db
+    )
@@ -0,0 +1,68 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.db import models
+
+
+class MoneyField(models.DecimalField):
+    """
+    Денежная сумма с двумя знаками после запятой.
+
+    По умолчанию хранится как обычный DecimalField. При MONEY_MINOR_UNITS
+    колонка становится целым числом копеек: суммирование в БД идёт по целым
+    числам, а в Python значение остаётся Decimal, поэтому формы и
+    сериализаторы работают с ним как с обычной десятичной суммой.
+    Настройка должна совпадать со схемой БД, см. миграцию orders 0011.
+    """
+
+    SUBUNITS = 100
+
+    description = 'Денежная сумма'
+
+    def __init__(self, *args, max_digits=None, **kwargs):
+        kwargs.setdefault('decimal_places', 2)
+        super().__init__(*args, max_digits=max_digits, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs.pop('decimal_places', None)
+        return name, path, args, kwargs
+
+    @property
+    def minor_units(self):
+        return settings.MONEY_MINOR_UNITS
+
+    @classmethod
+    def to_minor(cls, value):
+        """Переводит сумму в целое число копеек."""
+        return int((Decimal(str(value)) * cls.SUBUNITS).to_integral_value(
+            ROUND_HALF_UP
+        ))
+
+    @classmethod
+    def from_minor(cls, value):
+        return Decimal(value).scaleb(-2)
+
+    def from_db_value(self, value, expression, connection):
+        if value is None or not self.minor_units:
+            return value
+        return self.from_minor(value)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if not self.minor_units:
+            return super().get_db_prep_value(value, connection, prepared)
+        if hasattr(value, 'as_sql'):
+            return value
+        if not prepared:
+            value = self.get_prep_value(value)
+        if value is None:
+            return value
+        return self.to_minor(value)
+
+    def get_db_prep_save(self, value, connection):
+        if not self.minor_units:
+            return super().get_db_prep_save(value, connection)
+        return self.get_db_prep_value(value, connection)
+
+    def get_internal_type(self):
+        return 'BigIntegerField' if self.minor_units else 'DecimalField'
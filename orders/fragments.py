@@ -0,0 +1,87 @@
+"""
+HTML-фрагменты строк списка заказов.
+
+Строка заказа зависит только от заказа, его позиций, названий блюд и
+прав пользователя, поэтому отрендеренная строка кешируется по версии
+заказа (change_seq) и флагам is_admin и is_chef, которые проверяет
+шаблон; роль для этого не подходит: суперпользователь с ролью официанта
+видит кнопки администратора. Изменение меню меняет версию меню в ключе.
+CSRF-токен в кеш не попадает: вместо него сохраняется заглушка, которая
+подменяется токеном запроса.
+"""
+import time
+
+from django.core.cache import cache
+from django.db.models import prefetch_related_objects
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from . import invalidation
+from .models import OrderChange
+
+ROW_TEMPLATE = 'includes/order_row.html'
+CSRF_PLACEHOLDER = 'csrf-token-placeholder'
+MENU_VERSION_KEY = 'order-rows:menu-version'
+ROW_TIMEOUT = 60 * 60
+
+
+def current_version():
+    """
+    Версия списка — безопасный курсор журнала изменений: изменения новее
+    него страница получит ещё раз (см. OrderChange.safe_cursor).
+    """
+    return OrderChange.safe_cursor()
+
+
+def menu_version():
+    return cache.get_or_set(MENU_VERSION_KEY, time.time_ns, None)
+
+
+def reset_menu_version(key=None):
+    cache.delete(MENU_VERSION_KEY)
+
+
+invalidation.subscribe('menu', reset_menu_version)
+
+
+def permissions_key(user):
+    """Флаги пользователя, от которых зависит шаблон строки."""
+    return f'a{int(user.is_admin)}c{int(user.is_chef)}'
+
+
+def row_key(order, permissions, version):
+    return (
+        f'order-row:{order._state.db}:{order.pk}:{order.change_seq}:'
+        f'{permissions}:{version}'
+    )
+
+
+def render_rows(request, orders):
+    """
+    Возвращает HTML строк заказов в исходном порядке. Позиции заказов
+    загружаются только для строк, которых нет в кеше.
+    """
+    permissions = permissions_key(request.user)
+    version = menu_version()
+    keys = {
+        order.pk: row_key(order, permissions, version) for order in orders
+    }
+    rows = cache.get_many(keys.values())
+    missing = [order for order in orders if keys[order.pk] not in rows]
+    if missing:
+        prefetch_related_objects(missing, 'order_items__dish')
+        rendered = {
+            keys[order.pk]: render_to_string(ROW_TEMPLATE, {
+                'order': order, 'user': request.user,
+                'csrf_token': CSRF_PLACEHOLDER,
+            })
+            for order in missing
+        }
+        cache.set_many(rendered, ROW_TIMEOUT)
+        rows.update(rendered)
+    token = get_token(request)
+    return [
+        mark_safe(rows[keys[order.pk]].replace(CSRF_PLACEHOLDER, token))
+        for order in orders
+    ]
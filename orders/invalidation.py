@@ -0,0 +1,255 @@
+"""
+Шина инвалидации локальных кешей между процессами.
+
+Сообщение — тема (menu — меню, tables — план зала) и ключ, обычно
+псевдоним БД; None в качестве ключа сбрасывает всю тему. Сообщения
+пишутся в общий транспорт (по умолчанию SQLite-файл INVALIDATION_DB) с
+возрастающей версией, а
+каждый процесс читает новые версии в фоне не реже раза в
+INVALIDATION_POLL_INTERVAL секунд и вызывает подписчиков темы. Если фоновый
+поток не запущен (INVALIDATION_POLL_INTERVAL=0 или процесс не обслуживает
+запросы), шина читается при каждом обращении к LocalCache. Процесс,
+отставший дальше хранимого окна сообщений, сбрасывает все темы целиком.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+
+
+def subscribe(topic, handler):
+    """Подписывает handler(key) на сообщения темы."""
+    _handlers.setdefault(topic, []).append(handler)
+
+
+def dispatch(topic, key):
+    for handler in _handlers.get(topic, ()):
+        try:
+            handler(key)
+        except Exception:
+            logger.exception('Ошибка обработчика инвалидации %s', topic)
+
+
+class SQLiteTransport:
+    """Транспорт на общей SQLite-таблице; rowid служит версией."""
+
+    def __init__(self, path, retention=10000):
+        self.path = str(path)
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+
+    def _connect(self):
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(
+                self.path, timeout=10, check_same_thread=False,
+                isolation_level=None
+            )
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS invalidations ('
+                'version INTEGER PRIMARY KEY AUTOINCREMENT, '
+                'origin INTEGER NOT NULL, topic TEXT NOT NULL, key TEXT)'
+            )
+            self._pid = os.getpid()
+        return self._connection
+
+    def publish(self, topic, key):
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                version = connection.execute(
+                    'INSERT INTO invalidations (origin, topic, key) '
+                    'VALUES (?, ?, ?)', (os.getpid(), topic, key)
+                ).lastrowid
+                connection.execute(
+                    'DELETE FROM invalidations WHERE version <= ?',
+                    (version - self.retention,)
+                )
+        return version
+
+    def read(self, after):
+        """Сообщения новее after и наименьшая хранимая версия."""
+        with self._lock:
+            connection = self._connect()
+            rows = connection.execute(
+                'SELECT version, origin, topic, key FROM invalidations '
+                'WHERE version > ? ORDER BY version', (after,)
+            ).fetchall()
+            oldest = connection.execute(
+                'SELECT MIN(version) FROM invalidations'
+            ).fetchone()[0]
+        return rows, oldest
+
+    def latest(self):
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT seq FROM sqlite_sequence WHERE name = 'invalidations'"
+            ).fetchone()
+        return row[0] if row else 0
+
+
+class InvalidationBus:
+    """Публикация сообщений и их применение в текущем процессе."""
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.version = None
+        self._lock = threading.Lock()
+
+    def publish(self, topic, key=None):
+        """Сбрасывает кеш у себя сразу, у остальных — при чтении шины."""
+        key = None if key is None else str(key)
+        dispatch(topic, key)
+        return self.transport.publish(topic, key)
+
+    def poll(self):
+        """Применяет новые сообщения; возвращает их число."""
+        with self._lock:
+            return self._poll()
+
+    def _poll(self):
+        if self.version is None:
+            # Кеши нового процесса пусты: старые сообщения не нужны.
+            self.version = self.transport.latest()
+            return 0
+        rows, oldest = self.transport.read(self.version)
+        if oldest is not None and oldest > self.version + 1:
+            for topic in list(_handlers):
+                dispatch(topic, None)
+        pid = os.getpid()
+        for version, origin, topic, key in rows:
+            if origin != pid:
+                dispatch(topic, key)
+            self.version = version
+        return len(rows)
+
+
+class LocalCache:
+    """
+    Кеш процесса, очищаемый сообщениями шины по своей теме.
+
+    Каждый сброс увеличивает поколение ключа, и значение, вычисленное до
+    сброса, в кеш не попадает: иначе сообщение, пришедшее во время
+    compute(), потерялось бы.
+    """
+
+    def __init__(self, topic):
+        self.topic = topic
+        self._data = {}
+        self._generations = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+        subscribe(topic, self.invalidate)
+
+    def _generation(self, key):
+        return self._epoch, self._generations.get(key, 0)
+
+    def get_or_set(self, key, compute):
+        poll_if_idle()
+        with self._lock:
+            try:
+                return self._data[key]
+            except KeyError:
+                generation = self._generation(key)
+        value = compute()
+        with self._lock:
+            if self._generation(key) == generation:
+                self._data[key] = value
+        return value
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._epoch += 1
+                self._generations.clear()
+                self._data.clear()
+            else:
+                self._generations[key] = self._generations.get(key, 0) + 1
+                self._data.pop(key, None)
+
+
+_bus = None
+_bus_lock = threading.Lock()
+_poller = None
+_poller_lock = threading.Lock()
+
+
+def get_bus():
+    global _bus
+    if _bus is None:
+        with _bus_lock:
+            if _bus is None:
+                _bus = InvalidationBus(SQLiteTransport(
+                    settings.INVALIDATION_DB, settings.INVALIDATION_RETENTION
+                ))
+    return _bus
+
+
+@receiver(setting_changed)
+def reset_bus(setting, **kwargs):
+    global _bus
+    if setting in ('INVALIDATION_DB', 'INVALIDATION_RETENTION'):
+        _bus = None
+
+
+def publish(topic, key=None):
+    get_bus().publish(topic, key)
+
+
+def publish_on_commit(topic, key, using):
+    """Публикует сообщение после фиксации транзакции в БД using."""
+    transaction.on_commit(lambda: publish(topic, key), using=using)
+
+
+class Poller(threading.Thread):
+    """Фоновый поток, читающий шину каждые interval секунд."""
+
+    def __init__(self, interval):
+        super().__init__(name='orders-invalidation', daemon=True)
+        self.interval = interval
+
+    def run(self):
+        while True:
+            try:
+                get_bus().poll()
+            except Exception:
+                logger.exception('Ошибка чтения шины инвалидации')
+            time.sleep(self.interval)
+
+
+def poll_if_idle():
+    """Читает шину на месте, если фоновый поток не запущен."""
+    if _poller is not None:
+        return
+    try:
+        get_bus().poll()
+    except Exception:
+        logger.exception('Ошибка чтения шины инвалидации')
+
+
+def start_poller(**kwargs):
+    """
+    Запускает чтение шины в процессе, обслуживающем запросы, если задан
+    INVALIDATION_POLL_INTERVAL. При нулевом интервале шину читает сам
+    LocalCache при каждом обращении.
+    """
+    global _poller
+    if _poller is not None or not settings.INVALIDATION_POLL_INTERVAL:
+        return
+    with _poller_lock:
+        if _poller is None:
+            get_bus().poll()
+            _poller = Poller(settings.INVALIDATION_POLL_INTERVAL)
+            _poller.start()
@@ -0,0 +1,253 @@
+"""
+Очередь фоновых задач на таблице Job без внешнего брокера.
+
+Задача регистрируется декоратором task и ставится в очередь через
+enqueue (в той же транзакции, что и изменения, которые её породили).
+Исполнитель (команда run_worker) забирает задачи с арендой: пока задача
+выполняется, аренда продлевается, а задача упавшего исполнителя после
+окончания аренды достаётся другому. Неудачные попытки повторяются с
+экспоненциальной задержкой до max_attempts раз.
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import timedelta
+from multiprocessing import get_context
+
+import django
+from django.conf import settings
+from django.db import close_old_connections, router, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .locations import use_location
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+
+def task(name):
+    """Регистрирует функцию как задачу очереди."""
+    def decorator(func):
+        TASKS[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, run_at=None, max_attempts=None):
+    if name not in TASKS:
+        raise KeyError(f'Неизвестная задача: {name}')
+    return Job.objects.create(
+        name=name, payload=payload or {},
+        run_at=run_at or timezone.now(),
+        max_attempts=max_attempts or settings.JOBS_MAX_ATTEMPTS,
+    )
+
+
+def backoff(attempts):
+    """Задержка перед повтором: экспонента со случайной добавкой."""
+    delay = min(
+        settings.JOBS_RETRY_BASE_DELAY * 2 ** (attempts - 1),
+        settings.JOBS_RETRY_MAX_DELAY
+    )
+    return timedelta(seconds=delay * random.uniform(1, 1.25))
+
+
+def claim(worker_id, limit=1, lease=None):
+    """
+    Забирает до limit готовых задач. Захват — условный UPDATE по прежнему
+    состоянию задачи, поэтому одну задачу не получат два исполнителя
+    и на SQLite, где нет SELECT ... FOR UPDATE SKIP LOCKED.
+
+    Задача с истёкшей арендой, исчерпавшая max_attempts (её исполнитель
+    остановился на последней попытке), помечается неудачной.
+    """
+    lease = lease or settings.JOBS_LEASE_SECONDS
+    now = timezone.now()
+    claimed = []
+    with transaction.atomic(using=router.db_for_write(Job)):
+        candidates = list(
+            Job.objects.select_for_update(skip_locked=True).filter(
+                Q(status=Job.QUEUED, run_at__lte=now)
+                | Q(status=Job.RUNNING, lease_expires__lt=now)
+            ).order_by('run_at', 'pk').values(
+                'pk', 'status', 'lease_expires', 'attempts', 'max_attempts'
+            )[:limit]
+        )
+        for candidate in candidates:
+            if candidate['attempts'] >= candidate['max_attempts']:
+                Job.objects.filter(**candidate).update(
+                    status=Job.FAILED, lease_expires=None, finished_at=now,
+                    last_error='Аренда истекла на последней попытке',
+                )
+                continue
+            updated = Job.objects.filter(**candidate).update(
+                status=Job.RUNNING, locked_by=worker_id,
+                lease_expires=now + timedelta(seconds=lease),
+                attempts=F('attempts') + 1,
+            )
+            if updated:
+                claimed.append(candidate['pk'])
+    return list(Job.objects.filter(pk__in=claimed).order_by('run_at', 'pk'))
+
+
+def extend_leases(worker_id, job_ids, lease=None):
+    lease = lease or settings.JOBS_LEASE_SECONDS
+    return Job.objects.filter(
+        pk__in=job_ids, status=Job.RUNNING, locked_by=worker_id
+    ).update(lease_expires=timezone.now() + timedelta(seconds=lease))
+
+
+def run_job(job, worker_id):
+    """Выполняет забранную задачу и фиксирует результат."""
+    owned = Job.objects.filter(
+        pk=job.pk, status=Job.RUNNING, locked_by=worker_id
+    )
+    try:
+        TASKS[job.name](**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        logger.exception('Задача %s #%s завершилась ошибкой', job.name, job.pk)
+        if job.attempts >= job.max_attempts:
+            owned.update(
+                status=Job.FAILED, last_error=error, lease_expires=None,
+                finished_at=timezone.now()
+            )
+        else:
+            owned.update(
+                status=Job.QUEUED, last_error=error, lease_expires=None,
+                locked_by='', run_at=timezone.now() + backoff(job.attempts)
+            )
+        return False
+    owned.update(
+        status=Job.DONE, lease_expires=None, finished_at=timezone.now()
+    )
+    return True
+
+
+def execute(job_pk, worker_id, location):
+    """Точка входа пула: загружает задачу и выполняет её в БД кафе."""
+    try:
+        with use_location(location):
+            return run_job(Job.objects.get(pk=job_pk), worker_id)
+    finally:
+        close_old_connections()
+
+
+class Worker:
+    """Исполнитель задач на пуле потоков или процессов."""
+
+    def __init__(self, locations, concurrency=4, use_processes=False,
+                 poll_interval=1.0, periodic=None, worker_id=None):
+        self.locations = locations
+        self.periodic = {
+            name: interval
+            for name, interval in (periodic or {}).items() if interval
+        }
+        self._scheduled = {}
+        self.concurrency = concurrency
+        self.use_processes = use_processes
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or (
+            f'{socket.gethostname()}:{os.getpid()}'
+        )
+        self._running = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def make_pool(self):
+        if self.use_processes:
+            # fork копировал бы процесс вместе с потоками и открытыми
+            # соединениями, поэтому процессы запускаются заново и сами
+            # настраивают Django.
+            return ProcessPoolExecutor(
+                self.concurrency, mp_context=get_context('spawn'),
+                initializer=django.setup
+            )
+        return ThreadPoolExecutor(self.concurrency, 'orders-job')
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self, once=False):
+        """
+        Выполняет задачи до остановки; с once — пока в очереди есть
+        готовые задачи. Возвращает число забранных задач.
+        """
+        claimed = 0
+        with self.make_pool() as pool:
+            threading.Thread(
+                target=self.heartbeat, name='orders-job-lease', daemon=True
+            ).start()
+            while not self._stopped.is_set():
+                if not once:
+                    self.schedule_periodic()
+                submitted = self.submit(pool)
+                claimed += submitted
+                if once and not submitted and not self._running:
+                    break
+                if not submitted:
+                    time.sleep(self.poll_interval)
+        self.stop()
+        return claimed
+
+    def schedule_periodic(self):
+        """Ставит периодические задачи, если их нет в очереди."""
+        now = time.monotonic()
+        for name, interval in self.periodic.items():
+            if now - self._scheduled.get(name, now - interval) < interval:
+                continue
+            self._scheduled[name] = now
+            for location in self.locations:
+                with use_location(location):
+                    if not Job.objects.filter(
+                        name=name, status__in=(Job.QUEUED, Job.RUNNING)
+                    ).exists():
+                        enqueue(name)
+
+    def submit(self, pool):
+        submitted = 0
+        for location in self.locations:
+            free = self.concurrency - len(self._running)
+            if free <= 0:
+                break
+            with use_location(location):
+                jobs = claim(self.worker_id, free)
+            for job in jobs:
+                future = pool.submit(
+                    execute, job.pk, self.worker_id, location
+                )
+                with self._lock:
+                    self._running[future] = (location, job.pk)
+                future.add_done_callback(self.finished)
+                submitted += 1
+        close_old_connections()
+        return submitted
+
+    def finished(self, future):
+        with self._lock:
+            self._running.pop(future, None)
+
+    def heartbeat(self):
+        interval = settings.JOBS_LEASE_SECONDS / 3
+        while not self._stopped.wait(interval):
+            with self._lock:
+                running = list(self._running.values())
+            by_location = {}
+            for location, job_pk in running:
+                by_location.setdefault(location, []).append(job_pk)
+            try:
+                for location, job_ids in by_location.items():
+                    with use_location(location):
+                        extend_leases(self.worker_id, job_ids)
+            except Exception:
+                logger.exception('Не удалось продлить аренду задач')
+            finally:
+                close_old_connections()
@@ -0,0 +1,111 @@
+"""
+Работа нескольких кафе в одном развёртывании.
+
+Заказы, меню и связанные с ними таблицы каждого кафе хранятся в
+отдельной БД (псевдоним cafe_<кафе>). Текущее кафе задаётся на время
+запроса или команды через use_location и хранится в contextvar, поэтому
+доступно и в асинхронных представлениях, и в потоках sync_to_async.
+Без выбранного кафе используется БД default.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+_current_location = ContextVar('orders_location', default=None)
+
+# Модели приложения orders, общие для всех кафе.
+SHARED_MODELS = {
+    'customuser', 'customuser_groups', 'customuser_user_permissions'
+}
+# Модели других приложений, которые хранятся в БД кафе рядом с заказами.
+ROUTED_MODELS = {('api', 'idempotencykey')}
+
+
+class UnknownLocation(Exception):
+    """Кафе не входит в CAFE_LOCATIONS."""
+
+
+def database_for(location):
+    """Возвращает псевдоним БД кафе."""
+    if location is None:
+        return DEFAULT_DB_ALIAS
+    if location not in settings.CAFE_LOCATIONS:
+        raise UnknownLocation(location)
+    return f'cafe_{location}'
+
+
+def location_for(database):
+    """Кафе по псевдониму его БД (или реплики); None для default."""
+    database = database.removesuffix('_replica')
+    if database.startswith('cafe_'):
+        return database.removeprefix('cafe_')
+    return None
+
+
+def get_location():
+    return _current_location.get()
+
+
+def current_database():
+    return database_for(_current_location.get())
+
+
+@contextmanager
+def use_location(location):
+    """Выполняет блок с запросами к БД указанного кафе."""
+    database_for(location)
+    token = _current_location.set(location)
+    try:
+        yield location
+    finally:
+        _current_location.reset(token)
+
+
+def all_locations():
+    """Все БД с заказами: default и базы кафе."""
+    return [None, *settings.CAFE_LOCATIONS]
+
+
+class LocationRouter:
+    """Направляет модели заказов в БД текущего кафе."""
+
+    @staticmethod
+    def is_routed(app_label, model_name):
+        if (app_label, model_name) in ROUTED_MODELS:
+            return True
+        return app_label == 'orders' and model_name not in SHARED_MODELS
+
+    def db_for_read(self, model, **hints):
+        if self.is_routed(model._meta.app_label, model._meta.model_name):
+            return current_database()
+        return None
+
+    db_for_write = db_for_read
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == DEFAULT_DB_ALIAS:
+            return None
+        return self.is_routed(app_label, model_name)
+
+
+class LocationCommand(BaseCommand):
+    """Команда управления с параметром --location."""
+
+    def create_parser(self, prog_name, subcommand, **kwargs):
+        parser = super().create_parser(prog_name, subcommand, **kwargs)
+        parser.add_argument(
+            '--location',
+            help='Кафе, с БД которого работает команда (по умолчанию '
+                 'default).'
+        )
+        return parser
+
+    def execute(self, *args, **options):
+        location = options.get('location')
+        if location is not None and location not in settings.CAFE_LOCATIONS:
+            raise CommandError(f'Неизвестное кафе: {location}')
+        with use_location(location):
+            return super().execute(*args, **options)
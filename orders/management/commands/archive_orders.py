@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.conf import settings
+
+from orders.archive import archive_paid_orders
+from orders.locations import LocationCommand
+
+
+class Command(LocationCommand):
+    help = 'Переносит старые оплаченные заказы в архивные таблицы.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.ORDERS_ARCHIVE_AFTER_DAYS,
+            help='Архивировать заказы старше указанного числа дней.'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int,
+            default=settings.ORDERS_ARCHIVE_CHUNK_SIZE
+        )
+
+    def handle(self, *args, **options):
+        archived = archive_paid_orders(
+            timedelta(days=options['days']), options['chunk_size']
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f'В архив перенесено заказов: {archived}')
+        )
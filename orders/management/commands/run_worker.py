@@ -0,0 +1,48 @@
+from django.conf import settings
+
+from orders.jobs import Worker
+from orders.locations import LocationCommand, all_locations, get_location
+
+
+class Command(LocationCommand):
+    help = (
+        'Выполняет фоновые задачи из очереди. Без --location обслуживает '
+        'все кафе.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=settings.JOBS_CONCURRENCY,
+            help='Сколько задач выполнять одновременно.'
+        )
+        parser.add_argument(
+            '--processes', action='store_true',
+            help='Выполнять задачи в пуле процессов вместо потоков.'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float,
+            default=settings.JOBS_POLL_INTERVAL,
+            help='Пауза между проверками пустой очереди, секунд.'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить готовые задачи и завершиться.'
+        )
+
+    def handle(self, *args, **options):
+        location = get_location()
+        worker = Worker(
+            [location] if location is not None else all_locations(),
+            concurrency=options['concurrency'],
+            use_processes=options['processes'],
+            poll_interval=options['poll_interval'],
+            periodic={'archive_paid_orders': settings.ORDERS_ARCHIVE_INTERVAL},
+        )
+        try:
+            claimed = worker.run(once=options['once'])
+        except KeyboardInterrupt:
+            worker.stop()
+            return
+        self.stdout.write(
+            self.style.SUCCESS(f'Выполнено задач: {claimed}')
+        )
@@ -0,0 +1,154 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import CommandError
+from django.db import router, transaction
+from django.utils import timezone
+
+from orders import signals
+from orders.locations import LocationCommand
+from orders.models import Dish, Order, OrderChange, OrderItem, TableState
+
+
+def parse_distribution(value):
+    """Разбирает строку вида 'pending=20,ready=10,paid=70'."""
+    statuses = dict(Order.ORDER_STATUS_CHOICES)
+    weights = {}
+    for part in value.split(','):
+        status, _, weight = part.partition('=')
+        if status not in statuses:
+            raise CommandError(f'Неизвестный статус: {status}')
+        try:
+            weights[status] = float(weight)
+        except ValueError:
+            raise CommandError(f'Неверный вес статуса: {part}')
+    return list(weights), list(weights.values())
+
+
+class Command(LocationCommand):
+    help = (
+        'Заполняет базу детерминированными синтетическими заказами для '
+        'нагрузочного тестирования.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=10000)
+        parser.add_argument('--dishes', type=int, default=60)
+        parser.add_argument('--lines-min', type=int, default=1)
+        parser.add_argument('--lines-max', type=int, default=5)
+        parser.add_argument('--tables', type=int, default=50)
+        parser.add_argument(
+            '--statuses', default='pending=15,ready=10,paid=75',
+            help='Распределение статусов: status=вес через запятую.'
+        )
+        parser.add_argument(
+            '--days', type=int, default=0,
+            help='Распределить время создания заказов по последним N дням.'
+        )
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument(
+            '--flush', action='store_true',
+            help='Удалить существующие заказы перед загрузкой.'
+        )
+
+    def handle(self, *args, **options):
+        if not 1 <= options['lines_min'] <= options['lines_max']:
+            raise CommandError('Неверный диапазон числа позиций')
+        if not 1 <= options['tables'] <= 50:
+            raise CommandError('Число столов должно быть от 1 до 50')
+        if options['lines_max'] > options['dishes']:
+            raise CommandError('Позиций в заказе больше, чем блюд в меню')
+        statuses, weights = parse_distribution(options['statuses'])
+        rng = random.Random(options['seed'])
+        started = time.monotonic()
+
+        with signals.disabled():
+            if options['flush']:
+                self.flush_orders(options['chunk_size'])
+            menu = self.create_menu(rng, options['dishes'])
+            first_id = None
+            for offset in range(0, options['orders'], options['chunk_size']):
+                size = min(options['chunk_size'], options['orders'] - offset)
+                orders = self.create_chunk(
+                    rng, size, menu, statuses, weights, options
+                )
+                first_id = first_id or orders[0].pk
+                self.stdout.write(
+                    f'Заказов: {offset + size}/{options["orders"]}',
+                    ending='\r'
+                )
+            if first_id is not None:
+                Order.objects.filter(pk__gte=first_id).recalc_totals()
+            TableState.rebuild()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'\nЗагружено заказов: {options["orders"]} '
+            f'за {time.monotonic() - started:.1f} с'
+        ))
+
+    @staticmethod
+    def flush_orders(chunk_size):
+        """
+        Удаляет заказы порциями и фиксирует удаления в журнале изменений,
+        чтобы клиенты синхронизации убрали их у себя.
+        """
+        while order_ids := list(
+            Order.objects.values_list('pk', flat=True)[:chunk_size]
+        ):
+            with transaction.atomic(using=router.db_for_write(Order)):
+                Order.objects.filter(pk__in=order_ids).delete()
+                OrderChange.record_many(order_ids, deleted=True)
+
+    @staticmethod
+    def create_menu(rng, count):
+        prices = [
+            Decimal(rng.randrange(100, 150000)) / 100 for _ in range(count)
+        ]
+        existing = Dish.objects.count()
+        Dish.objects.bulk_create([
+            Dish(name=f'Блюдо {number}', price=price)
+            for number, price in enumerate(prices[existing:], existing + 1)
+        ])
+        return dict(
+            Dish.objects.order_by('pk').values_list('pk', 'price')[:count]
+        )
+
+    @staticmethod
+    def create_item(order, dish_id, price, quantity):
+        return OrderItem(
+            order_id=order.pk, dish_id=dish_id, quantity=quantity,
+            unit_price=price, line_total=price * quantity,
+        )
+
+    @classmethod
+    def create_chunk(cls, rng, size, menu, statuses, weights, options):
+        now = timezone.now()
+        dish_ids = list(menu)
+        orders = [
+            Order(
+                table_number=rng.randint(1, options['tables']),
+                status=status,
+                created_at=now - timedelta(
+                    seconds=rng.uniform(0, options['days'] * 86400)
+                ),
+            )
+            for status in rng.choices(statuses, weights, k=size)
+        ]
+        with transaction.atomic(using=router.db_for_write(Order)):
+            Order.objects.bulk_create(orders)
+            OrderItem.objects.bulk_create([
+                cls.create_item(
+                    order, dish_id, menu[dish_id], rng.randint(1, 4)
+                )
+                for order in orders
+                for dish_id in rng.sample(dish_ids, rng.randint(
+                    options['lines_min'], options['lines_max']
+                ))
+            ], batch_size=options['chunk_size'])
+            # Сигналы отключены, поэтому номера изменений выдаются здесь:
+            # иначе заказы останутся с change_seq=0 и не попадут в changes.
+            OrderChange.record_many([order.pk for order in orders])
+        return orders
@@ -0,0 +1,50 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from orders.replicas import copy_sqlite
+
+
+class Command(BaseCommand):
+    help = (
+        'Копирует основные SQLite-базы в их реплики из DATABASE_REPLICAS. '
+        'Для локальной проверки чтения с реплики.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', action='append', dest='databases',
+            help='Основная БД (по умолчанию все, у которых есть реплика).'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Повторять копирование каждые N секунд.'
+        )
+
+    def handle(self, *args, **options):
+        databases = options['databases'] or list(settings.DATABASE_REPLICAS)
+        for alias in databases:
+            if alias not in settings.DATABASE_REPLICAS:
+                raise CommandError(f'У БД {alias} нет реплики')
+            if connections[alias].vendor != 'sqlite':
+                raise CommandError(
+                    f'БД {alias} не SQLite: используйте репликацию СУБД'
+                )
+        while True:
+            for alias in databases:
+                replica = settings.DATABASE_REPLICAS[alias]
+                started = time.monotonic()
+                copy_sqlite(
+                    settings.DATABASES[alias]['NAME'],
+                    settings.DATABASES[replica]['NAME'],
+                )
+                connections[replica].close()
+                self.stdout.write(
+                    f'{alias} -> {replica}: '
+                    f'{(time.monotonic() - started) * 1000:.0f} мс'
+                )
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
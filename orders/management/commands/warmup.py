@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from orders.warmup import warmup
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогревает URLconf, сериализаторы, шаблоны и переводы и выводит '
+        'время каждого шага.'
+    )
+
+    def handle(self, *args, **options):
+        for name, (count, elapsed) in warmup().items():
+            self.stdout.write(f'{name:<16}{count:>6}{elapsed:>10.1f} мс')
@@ -0,0 +1,243 @@
+"""
+Метрики приложения в формате Prometheus без внешних зависимостей.
+
+Каждый процесс копит приращения в памяти и периодически сбрасывает их в
+общий SQLite-файл METRICS_DB, поэтому /metrics показывает сумму по всем
+воркерам.
+"""
+import atexit
+import hmac
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+
+COUNTER = 'counter'
+HISTOGRAM = 'histogram'
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+METRICS = {
+    'http_request_duration_seconds': (
+        HISTOGRAM, 'Время обработки запроса по маршрутам.', LATENCY_BUCKETS
+    ),
+    'http_responses_total': (
+        COUNTER, 'Ответы по маршрутам и кодам статуса.', None
+    ),
+    'db_queries_per_request': (
+        HISTOGRAM, 'Число SQL-запросов на HTTP-запрос.', QUERY_BUCKETS
+    ),
+    'orders_created_total': (COUNTER, 'Созданные заказы.', None),
+    'order_status_transitions_total': (
+        COUNTER, 'Переходы заказов между статусами.', None
+    ),
+    'order_recalc_total': (
+        COUNTER, 'Пересчёты итоговой суммы заказов.', None
+    ),
+    'orders_archived_total': (
+        COUNTER, 'Заказы, перенесённые в архив.', None
+    ),
+    'admission_queue_seconds': (
+        HISTOGRAM, 'Ожидание места в очереди по классам запросов.',
+        LATENCY_BUCKETS
+    ),
+    'admission_rejected_total': (
+        COUNTER, 'Запросы, отклонённые из-за перегрузки.', None
+    ),
+}
+
+
+def format_labels(labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace(
+            '"', '\\"').replace('\n', '\\n')
+
+    return ','.join(
+        f'{name}="{escape(value)}"' for name, value in sorted(labels.items())
+    )
+
+
+def format_value(value):
+    """Значение без потери точности: целые — без дробной части."""
+    value = float(value)
+    if value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Registry:
+    """Счётчики и гистограммы с агрегацией через SQLite."""
+
+    def __init__(self, path, flush_interval=1.0):
+        self.path = str(path)
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        # Запись в SQLite идёт под отдельной блокировкой, чтобы inc() и
+        # observe() на пути запроса не ждали дискового ввода-вывода.
+        self._io_lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+        self._last_flush = time.monotonic()
+
+    def inc(self, name, labels=None, value=1):
+        key = (name, format_labels(labels or {}))
+        with self._lock:
+            self._pending[key] = self._pending.get(key, 0) + value
+
+    def observe(self, name, value, labels=None):
+        labels = labels or {}
+        buckets = METRICS[name][2]
+        with self._lock:
+            for bound in (*buckets, '+Inf'):
+                if bound == '+Inf' or value <= bound:
+                    key = (
+                        f'{name}_bucket',
+                        format_labels({**labels, 'le': bound})
+                    )
+                    self._pending[key] = self._pending.get(key, 0) + 1
+            for suffix, delta in (('_sum', value), ('_count', 1)):
+                key = (f'{name}{suffix}', format_labels(labels))
+                self._pending[key] = self._pending.get(key, 0) + delta
+
+    def flush_due(self):
+        return time.monotonic() - self._last_flush >= self.flush_interval
+
+    def maybe_flush(self):
+        """Сбрасывает накопленное, если пора; ошибки только логируются."""
+        if not self.flush_due():
+            return
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Не удалось сбросить метрики в %s', self.path)
+
+    def _connect(self):
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(
+                self.path, timeout=10, check_same_thread=False,
+                isolation_level=None
+            )
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS metrics ('
+                'name TEXT NOT NULL, labels TEXT NOT NULL, '
+                'value REAL NOT NULL, PRIMARY KEY (name, labels))'
+            )
+            self._pid = os.getpid()
+        return self._connection
+
+    def flush(self):
+        """
+        Записывает накопленные приращения. Если запись не удалась, они
+        возвращаются в очередь и уйдут со следующим сбросом.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+        try:
+            with self._io_lock:
+                connection = self._connect()
+                with connection:
+                    connection.executemany(
+                        'INSERT INTO metrics (name, labels, value) '
+                        'VALUES (?, ?, ?) ON CONFLICT (name, labels) '
+                        'DO UPDATE SET value = value + excluded.value',
+                        [(name, labels, value)
+                         for (name, labels), value in pending.items()]
+                    )
+        except Exception:
+            with self._lock:
+                for key, value in pending.items():
+                    self._pending[key] = self._pending.get(key, 0) + value
+            raise
+
+    def collect(self):
+        """Возвращает метрики всех процессов в текстовом формате."""
+        self.flush()
+        with self._io_lock:
+            rows = self._connect().execute(
+                'SELECT name, labels, value FROM metrics ORDER BY name'
+            ).fetchall()
+        samples = {}
+        for name, labels, value in rows:
+            family = next(
+                (metric for metric in METRICS if name.startswith(metric)),
+                name
+            )
+            samples.setdefault(family, []).append((name, labels, value))
+        lines = []
+        for family, (kind, description, _) in METRICS.items():
+            lines.append(f'# HELP {family} {description}')
+            lines.append(f'# TYPE {family} {kind}')
+            for name, labels, value in samples.get(family, []):
+                labels = f'{{{labels}}}' if labels else ''
+                lines.append(f'{name}{labels} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = Registry(
+                    settings.METRICS_DB, settings.METRICS_FLUSH_INTERVAL
+                )
+                atexit.register(_registry.flush)
+    return _registry
+
+
+@receiver(setting_changed)
+def reset_registry(setting, **kwargs):
+    global _registry
+    if setting in ('METRICS_DB', 'METRICS_FLUSH_INTERVAL'):
+        _registry = None
+
+
+def inc(name, labels=None, value=1):
+    get_registry().inc(name, labels, value)
+
+
+def observe(name, value, labels=None):
+    get_registry().observe(name, value, labels)
+
+
+def has_metrics_token(request):
+    """Проверяет заголовок Authorization: Bearer <METRICS_TOKEN>."""
+    if not settings.METRICS_TOKEN:
+        return False
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    return scheme.lower() == 'bearer' and hmac.compare_digest(
+        token.encode(), settings.METRICS_TOKEN.encode()
+    )
+
+
+def metrics_view(request):
+    """Метрики в формате Prometheus: для сборщика с токеном и админов."""
+    allowed = has_metrics_token(request) or (
+        request.user.is_authenticated and request.user.is_admin
+    )
+    if not allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(
+        get_registry().collect(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -0,0 +1,421 @@
+import cProfile
+import hashlib
+import io
+import pstats
+import random
+import threading
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.db import connections
+from django.http import JsonResponse
+from django.utils.text import slugify
+from rest_framework.authtoken.models import Token
+
+from . import admission, metrics
+from .locations import UnknownLocation, database_for, use_location
+from .replicas import replica_reads
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_PARAM = '_profile'
+LOCATION_HEADER = 'X-Location'
+
+
+def request_user(request):
+    """
+    Пользователь запроса по сессии или по токену DRF, который в middleware
+    ещё не проверен. Возвращает None для анонимного запроса.
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user
+    keyword, _, key = request.headers.get(
+        'Authorization', ''
+    ).partition(' ')
+    if keyword != 'Token' or not key:
+        return None
+    token = Token.objects.select_related('user').filter(
+        key=key.strip()
+    ).first()
+    if token is None or not token.user.is_active:
+        return None
+    return token.user
+
+
+class AdmissionMiddleware:
+    """
+    Ограничивает одновременные запросы по классам (orders.admission).
+
+    Запрос, которому не хватило места, получает 503 с Retry-After, не
+    дожидаясь освобождения потоков. Без ADMISSION_CONTROL_ENABLED
+    middleware ничего не делает.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        gate = settings.ADMISSION_CONTROL_ENABLED and (
+            admission.gate_for(request)
+        )
+        if not gate:
+            return self.get_response(request)
+        admitted, waited = gate.enter()
+        admission.observe(gate, admitted, waited)
+        if not admitted:
+            return self.reject(gate, waited)
+        started = time.perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            gate.leave(time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        gate = settings.ADMISSION_CONTROL_ENABLED and (
+            admission.gate_for(request)
+        )
+        if not gate:
+            return await self.get_response(request)
+        admitted, waited = await gate.aenter()
+        admission.observe(gate, admitted, waited)
+        if not admitted:
+            return self.reject(gate, waited)
+        started = time.perf_counter()
+        try:
+            return await self.get_response(request)
+        finally:
+            gate.aleave(time.perf_counter() - started)
+
+    @staticmethod
+    def reject(gate, retry_after):
+        return JsonResponse(
+            {'error': 'Сервер перегружен, повторите запрос позже'},
+            status=503, headers={'Retry-After': gate.retry_after(retry_after)}
+        )
+
+
+class LocationMiddleware:
+    """
+    Выбирает БД кафе, с которой работает запрос.
+
+    Кафе берётся из заголовка X-Location, затем из LOCATION_HOSTS по хосту,
+    затем из профиля пользователя. Пользователь, привязанный к кафе, не
+    может обращаться к другому, если он не администратор; пользователь без
+    кафе не ограничен, поэтому кафе нужно назначить всем сотрудникам до
+    включения CAFE_LOCATIONS (см. README). Без настроенных CAFE_LOCATIONS
+    middleware ничего не делает.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.CAFE_LOCATIONS:
+            return self.get_response(request)
+        try:
+            location = self.resolve(request)
+        except (PermissionDenied, UnknownLocation) as error:
+            return self.reject(error)
+        request.location = location
+        with use_location(location):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        if not settings.CAFE_LOCATIONS:
+            return await self.get_response(request)
+        try:
+            location = await sync_to_async(self.resolve)(request)
+        except (PermissionDenied, UnknownLocation) as error:
+            return self.reject(error)
+        request.location = location
+        with use_location(location):
+            return await self.get_response(request)
+
+    @staticmethod
+    def resolve(request):
+        requested = request.headers.get(LOCATION_HEADER) or (
+            settings.LOCATION_HOSTS.get(request.get_host().partition(':')[0])
+        )
+        user = request_user(request)
+        home = getattr(user, 'location', '') or None
+        if requested is None:
+            requested = home
+        elif home and requested != home and not user.is_admin:
+            raise PermissionDenied
+        database_for(requested)
+        return requested
+
+    @staticmethod
+    def reject(error):
+        if isinstance(error, UnknownLocation):
+            return JsonResponse(
+                {'error': f'Неизвестное кафе: {error}'}, status=404
+            )
+        return JsonResponse(
+            {'error': 'Нет доступа к данным этого кафе'}, status=403
+        )
+
+
+class ReplicaMiddleware:
+    """
+    Разрешает безопасным запросам читать заказы с реплики.
+
+    После небезопасного запроса клиент REPLICA_READ_YOUR_WRITES_SECONDS
+    секунд читает из основной БД и видит свои изменения. Отметки о записи
+    хранятся в кеше Django, поэтому при нескольких процессах нужен общий
+    кеш. Без настроенных DATABASE_REPLICAS middleware ничего не делает.
+    """
+
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        if request.method not in self.SAFE_METHODS:
+            response = self.get_response(request)
+            # Ключ берётся после ответа: вход в систему меняет сессию.
+            self.remember_write(self.cache_key(request))
+            return response
+        with replica_reads(not cache.get(self.cache_key(request))):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+        if request.method not in self.SAFE_METHODS:
+            response = await self.get_response(request)
+            await sync_to_async(self.remember_write)(self.cache_key(request))
+            return response
+        with replica_reads(not await cache.aget(self.cache_key(request))):
+            return await self.get_response(request)
+
+    @staticmethod
+    def cache_key(request):
+        """Клиент определяется по токену, сессии или адресу."""
+        session = getattr(request, 'session', None)
+        client = (
+            request.headers.get('Authorization')
+            or (session and session.session_key)
+            or request.META.get('REMOTE_ADDR', '')
+        )
+        digest = hashlib.sha256(client.encode()).hexdigest()[:32]
+        return f'replica-write:{getattr(request, "location", None)}:{digest}'
+
+    @staticmethod
+    def remember_write(key):
+        cache.set(key, True, settings.REPLICA_READ_YOUR_WRITES_SECONDS)
+
+
+class ProfilingMiddleware:
+    """
+    Профилирование отдельных запросов через cProfile.
+
+    Запрос профилируется, если администратор передал заголовок X-Profile: 1
+    или параметр ?_profile=1, либо он попал в выборку с долей
+    PROFILING_SAMPLE_RATE. В PROFILING_DIR сохраняются .prof-файл и
+    текстовая сводка из PROFILING_TOP самых затратных функций; хранится
+    не более PROFILING_KEEP профилей. Заголовок X-Profile-Id с именем
+    профиля получает только администратор, запросивший профилирование.
+
+    В асинхронном режиме профилировщик работает в потоке цикла событий и
+    учитывает все задачи, выполняемые во время await, а два одновременных
+    профиля мешают друг другу. Поэтому асинхронно профилируется не больше
+    одного запроса за раз, остальные выполняются без профилирования.
+    """
+
+    sync_capable = True
+    async_capable = True
+    async_profile_lock = threading.Lock()
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        triggered = self.requested(request) and self.is_admin(request)
+        if not triggered and not self.sampled():
+            return self.get_response(request)
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        response = profiler.runcall(self.get_response, request)
+        elapsed = time.perf_counter() - started
+        name = self.save(profiler, request, response, elapsed)
+        if triggered:
+            # Случайная выборка не раскрывает клиенту id профилей.
+            response['X-Profile-Id'] = name
+        return response
+
+    async def __acall__(self, request):
+        triggered = self.requested(request) and (
+            await sync_to_async(self.is_admin)(request)
+        )
+        if not triggered and not self.sampled():
+            return await self.get_response(request)
+        if not self.async_profile_lock.acquire(blocking=False):
+            return await self.get_response(request)
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            profiler.enable()
+            try:
+                response = await self.get_response(request)
+            finally:
+                profiler.disable()
+        finally:
+            self.async_profile_lock.release()
+        elapsed = time.perf_counter() - started
+        name = await sync_to_async(self.save)(
+            profiler, request, response, elapsed
+        )
+        if triggered:
+            response['X-Profile-Id'] = name
+        return response
+
+    @staticmethod
+    def sampled():
+        return (
+            settings.PROFILING_SAMPLE_RATE > 0
+            and random.random() < settings.PROFILING_SAMPLE_RATE
+        )
+
+    @staticmethod
+    def requested(request):
+        return (
+            request.headers.get(PROFILE_HEADER) == '1'
+            or request.GET.get(PROFILE_PARAM) == '1'
+        )
+
+    @staticmethod
+    def is_admin(request):
+        user = request_user(request)
+        return bool(user and user.is_admin)
+
+    def save(self, profiler, request, response, elapsed):
+        directory = settings.PROFILING_DIR
+        directory.mkdir(parents=True, exist_ok=True)
+        seconds, nanoseconds = divmod(time.time_ns(), 10**9)
+        name = (
+            f'{time.strftime("%Y%m%d-%H%M%S", time.localtime(seconds))}'
+            f'-{nanoseconds:09d}'
+            f'-{request.method.lower()}-{slugify(request.path)[:60]}'
+        )
+        profiler.dump_stats(directory / f'{name}.prof')
+        summary = io.StringIO()
+        summary.write(
+            f'{request.method} {request.get_full_path()} -> '
+            f'{response.status_code} за {elapsed * 1000:.1f} мс\n\n'
+        )
+        pstats.Stats(profiler, stream=summary).sort_stats(
+            'cumulative'
+        ).print_stats(settings.PROFILING_TOP)
+        (directory / f'{name}.txt').write_text(summary.getvalue())
+        self.prune(directory)
+        return name
+
+    @staticmethod
+    def prune(directory):
+        profiles = sorted(directory.glob('*.prof'))
+        for path in profiles[:-settings.PROFILING_KEEP or None]:
+            path.unlink(missing_ok=True)
+            path.with_suffix('.txt').unlink(missing_ok=True)
+
+
+class MetricsMiddleware:
+    """
+    Собирает время ответа, коды статуса и число SQL-запросов по маршрутам.
+
+    В асинхронном режиме запросы к БД выполняются в других потоках,
+    поэтому число SQL-запросов не учитывается. Ошибка сброса метрик
+    логируется и не влияет на ответ.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        queries = 0
+
+        def count_queries(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(count_queries)
+                )
+            response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - started)
+        metrics.observe(
+            'db_queries_per_request', queries, self.labels(request)
+        )
+        metrics.get_registry().maybe_flush()
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.record(request, response, time.perf_counter() - started)
+        registry = metrics.get_registry()
+        if registry.flush_due():
+            # Запись в SQLite не должна блокировать цикл событий.
+            await sync_to_async(
+                registry.maybe_flush, thread_sensitive=False
+            )()
+        return response
+
+    @staticmethod
+    def labels(request):
+        match = request.resolver_match
+        return {'route': match.view_name if match else 'unresolved'}
+
+    def record(self, request, response, elapsed):
+        labels = self.labels(request)
+        metrics.observe(
+            'http_request_duration_seconds', elapsed,
+            {**labels, 'method': request.method}
+        )
+        metrics.inc(
+            'http_responses_total', {**labels, 'status': response.status_code}
+        )
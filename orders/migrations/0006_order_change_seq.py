@@ -0,0 +1,62 @@
+# Generated by Django 5.0.9 on 2026-10-19 11:31
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+CHUNK_SIZE = 1000
+
+
+def backfill_change_seq(apps, schema_editor):
+    """
+    Выдаёт заказам без номера изменения (change_seq=0) собственный номер и
+    запись журнала, иначе дельта-синхронизация не сможет их пролистать.
+    """
+    db_alias = schema_editor.connection.alias
+    Order = apps.get_model('orders', 'Order')
+    OrderChange = apps.get_model('orders', 'OrderChange')
+    orders = Order.objects.using(db_alias).filter(change_seq=0)
+    order_ids = list(orders.exclude(
+        pk__in=OrderChange.objects.using(db_alias).filter(
+            deleted=False
+        ).values('order_id')
+    ).order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(order_ids), CHUNK_SIZE):
+        OrderChange.objects.using(db_alias).bulk_create([
+            OrderChange(order_id=order_id)
+            for order_id in order_ids[start:start + CHUNK_SIZE]
+        ])
+    orders.update(change_seq=Subquery(
+        OrderChange.objects.using(db_alias).filter(
+            order_id=OuterRef('pk'), deleted=False
+        ).order_by('-pk').values('pk')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0005_alter_order_table_number'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_id', models.PositiveBigIntegerField(db_index=True)),
+                ('deleted', models.BooleanField(default=False)),
+            ],
+            options={
+                'verbose_name': 'изменение заказа',
+                'verbose_name_plural': 'Изменения заказов',
+            },
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='change_seq',
+            field=models.PositiveBigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunPython(
+            backfill_change_seq, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.0.9 on 2026-10-19 11:51
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def build_table_state(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    TableState = apps.get_model('orders', 'TableState')
+    db_alias = schema_editor.connection.alias
+    TableState.objects.using(db_alias).bulk_create([
+        TableState(
+            table_number=row['table_number'], open_orders=row['count'],
+            bill=row['total'] or Decimal('0.00')
+        )
+        for row in Order.objects.using(db_alias).exclude(
+            status='paid'
+        ).order_by().values('table_number').annotate(
+            count=Count('pk'), total=Sum('total_price')
+        )
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_order_created_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TableState',
+            fields=[
+                ('table_number', models.PositiveSmallIntegerField(primary_key=True, serialize=False)),
+                ('open_orders', models.PositiveIntegerField(default=0)),
+                ('bill', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'состояние стола',
+                'verbose_name_plural': 'Состояние столов',
+                'ordering': ['table_number'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['table_number', 'status'], name='order_table_status_idx'),
+        ),
+        migrations.RunPython(build_table_state, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.0.9 on 2026-10-19 12:40
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+
+
+def backfill_prices(apps, schema_editor):
+    Dish = apps.get_model('orders', 'Dish')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    db_alias = schema_editor.connection.alias
+    price = Subquery(
+        Dish.objects.filter(pk=OuterRef('dish_id')).values('price')[:1]
+    )
+    OrderItem.objects.using(db_alias).update(
+        unit_price=price,
+        line_total=models.ExpressionWrapper(
+            price * F('quantity'),
+            output_field=models.DecimalField(max_digits=10, decimal_places=2)
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=8),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='line_total',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=10),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_prices, migrations.RunPython.noop),
+    ]
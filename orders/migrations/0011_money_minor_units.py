@@ -0,0 +1,121 @@
+# Generated by Django 5.0.9 on 2026-10-19 13:20
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+import orders.fields
+
+# (модель, поле, max_digits, значение по умолчанию)
+MONEY_FIELDS = [
+    ('dish', 'price', 8, None),
+    ('order', 'total_price', 10, Decimal('0.00')),
+    ('orderitem', 'unit_price', 8, None),
+    ('orderitem', 'line_total', 10, None),
+    ('tablestate', 'bill', 12, Decimal('0.00')),
+    ('archivedorder', 'total_price', 10, None),
+    ('archivedorderitem', 'price', 8, None),
+]
+
+EDITABLE = {('orderitem', 'unit_price'), ('orderitem', 'line_total')}
+
+CHUNK_SIZE = 1000
+
+
+def copy_values(model, source, target, using):
+    """
+    Копирует значения поля порциями через Python. Значения проходят через
+    Decimal, а перевод в копейки при MONEY_MINOR_UNITS выполняет сам
+    MoneyField, поэтому суммы не проходят через float.
+    """
+    queryset = model.objects.using(using).only('pk', source).order_by('pk')
+    last_pk = None
+    while True:
+        page = queryset if last_pk is None else queryset.filter(
+            pk__gt=last_pk
+        )
+        rows = list(page[:CHUNK_SIZE])
+        if not rows:
+            return
+        for row in rows:
+            setattr(row, target, getattr(row, source))
+        model.objects.using(using).bulk_update(rows, [target])
+        last_pk = rows[-1].pk
+
+
+def copy_to_minor(apps, schema_editor):
+    for model_name, name, _, _ in MONEY_FIELDS:
+        copy_values(
+            apps.get_model('orders', model_name), name, f'{name}_minor',
+            schema_editor.connection.alias
+        )
+
+
+def copy_from_minor(apps, schema_editor):
+    for model_name, name, _, _ in MONEY_FIELDS:
+        copy_values(
+            apps.get_model('orders', model_name), f'{name}_minor', name,
+            schema_editor.connection.alias
+        )
+
+
+def decimal_field(max_digits, model_name, name):
+    # Старое поле с значением по умолчанию: при откате миграции оно
+    # добавляется заново в непустую таблицу и заполняется copy_from_minor.
+    return models.DecimalField(
+        max_digits=max_digits, decimal_places=2, default=Decimal('0.00'),
+        editable=(model_name, name) not in EDITABLE,
+    )
+
+
+def money_field(max_digits, default, **kwargs):
+    if default is not None:
+        kwargs['default'] = default
+    return orders.fields.MoneyField(max_digits=max_digits, **kwargs)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0010_orderitem_prices'),
+    ]
+
+    operations = [
+        *[
+            migrations.AddField(
+                model_name=model_name,
+                name=f'{name}_minor',
+                field=orders.fields.MoneyField(
+                    max_digits=max_digits, default=0
+                ),
+                preserve_default=False,
+            )
+            for model_name, name, max_digits, _ in MONEY_FIELDS
+        ],
+        migrations.RunPython(copy_to_minor, copy_from_minor),
+        *[
+            operation
+            for model_name, name, max_digits, default in MONEY_FIELDS
+            for operation in (
+                *([migrations.AlterField(
+                    model_name=model_name,
+                    name=name,
+                    field=decimal_field(max_digits, model_name, name),
+                )] if default is None else []),
+                migrations.RemoveField(model_name=model_name, name=name),
+                migrations.RenameField(
+                    model_name=model_name,
+                    old_name=f'{name}_minor',
+                    new_name=name,
+                ),
+                migrations.AlterField(
+                    model_name=model_name,
+                    name=name,
+                    field=money_field(
+                        max_digits, default,
+                        editable=(model_name, name) not in EDITABLE,
+                    ),
+                ),
+            )
+        ],
+    ]
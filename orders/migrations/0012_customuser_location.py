@@ -0,0 +1,18 @@
+# Generated by Django 5.0.9 on 2026-10-19 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0011_money_minor_units'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='location',
+            field=models.CharField(blank=True, help_text='Пустое значение — доступ без привязки к кафе.', max_length=50, verbose_name='кафе'),
+        ),
+    ]
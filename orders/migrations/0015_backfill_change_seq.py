@@ -0,0 +1,22 @@
+from importlib import import_module
+
+from django.db import migrations
+
+# Базы, где 0006 уже применена без заполнения, и заказы, загруженные
+# массово без журнала изменений.
+backfill_change_seq = import_module(
+    'orders.migrations.0006_order_change_seq'
+).backfill_change_seq
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0014_orderchange_created_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            backfill_change_seq, migrations.RunPython.noop
+        ),
+    ]
@@ -1,8 +1,25 @@
+from datetime import timedelta
 from decimal import Decimal
 
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.conf import settings
+from django.db import connections, models, router, transaction
+from django.db.models import (
+    Case,
+    ExpressionWrapper,
+    Max,
+    OuterRef,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import invalidation, metrics
+from .fields import MoneyField
 
 
 class CustomUser(AbstractUser):
@@ -19,6 +36,10 @@ class CustomUser(AbstractUser):
     role = models.CharField(
         max_length=10, choices=ROLE_CHOICES, default=WAITER
     )
+    location = models.CharField(
+        'кафе', max_length=50, blank=True,
+        help_text='Пустое значение — доступ без привязки к кафе.'
+    )
 
     class Meta:
         verbose_name = 'пользователь'
@@ -43,7 +64,7 @@ class CustomUser(AbstractUser):
 
 class Dish(models.Model):
     name = models.CharField(max_length=100)
-    price = models.DecimalField(max_digits=8, decimal_places=2)
+    price = MoneyField(max_digits=8)
 
     class Meta:
         verbose_name = 'блюдо'
@@ -53,6 +74,65 @@ class Dish(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_price = instance.__dict__.get('price')
+        return instance
+
+    @property
+    def price_changed(self):
+        """Изменилась ли цена с момента загрузки из БД."""
+        return self.price != getattr(self, '_loaded_price', self.price)
+
+
+class OrderQuerySet(models.QuerySet):
+    def recalc_totals(self, **fields):
+        """
+        Пересчитывает total_price всех заказов выборки одним UPDATE.
+
+        В том же UPDATE можно изменить и другие поля (fields). Сигналы при
+        этом не отправляются.
+        """
+        totals = OrderItem.objects.filter(
+            order=OuterRef('pk')
+        ).order_by().values('order').annotate(
+            total=Sum('line_total')
+        ).values('total')
+        updated = self.update(
+            total_price=Coalesce(
+                Subquery(totals), Value(0), output_field=MoneyField()
+            ),
+            **fields
+        )
+        metrics.inc('order_recalc_total', {'mode': 'bulk'}, updated)
+        return updated
+
+    def _revenue(self):
+        # Архив учитывается в том же запросе: заказ, перенесённый в архив
+        # между двумя запросами, не попадёт в сумму дважды.
+        archived = ArchivedOrder.objects.filter(
+            status=Order.PAID
+        ).order_by().values('status').annotate(
+            total=Sum('total_price')
+        ).values('total')
+        return {'total': ExpressionWrapper(
+            Coalesce(Sum('total_price'), Value(0))
+            + Coalesce(Subquery(archived), Value(0)),
+            output_field=MoneyField()
+        )}
+
+    def revenue(self):
+        """Выручка по оплаченным заказам, включая архив."""
+        return self.filter(status=Order.PAID).aggregate(
+            **self._revenue()
+        )['total']
+
+    async def arevenue(self):
+        return (await self.filter(status=Order.PAID).aaggregate(
+            **self._revenue()
+        ))['total']
+
 
 class Order(models.Model):
     PENDING = 'pending'
@@ -75,29 +155,52 @@ class Order(models.Model):
         choices=ORDER_STATUS_CHOICES,
         default=PENDING
     )
-    total_price = models.DecimalField(
-        max_digits=10,
-        decimal_places=2,
-        default=Decimal('0.00')
-    )
+    total_price = MoneyField(max_digits=10, default=Decimal('0.00'))
 
     dishes = models.ManyToManyField(
         Dish,
         through='OrderItem'
     )
+    change_seq = models.PositiveBigIntegerField(
+        default=0, db_index=True, editable=False
+    )
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    objects = OrderQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.__dict__.get('status')
+        instance._loaded_table_number = instance.__dict__.get('table_number')
+        return instance
+
+    @property
+    def status_changed(self):
+        """Изменился ли статус с момента загрузки из БД."""
+        return self.status != getattr(self, '_loaded_status', self.status)
 
     def recalc_total(self):
-        total = Decimal('0.00')
-        for item in self.order_items.all():
-            total += item.dish.price * item.quantity
-        self.total_price = total
+        total = self.order_items.aggregate(total=Sum('line_total'))['total']
+        self.total_price = total or Decimal('0.00')
         self.save(update_fields=['total_price'])
+        metrics.inc('order_recalc_total', {'mode': 'single'})
 
     class Meta:
         verbose_name = 'заказ'
         verbose_name_plural = 'Заказы'
         ordering = ['table_number']
         default_related_name = 'orders'
+        indexes = [
+            models.Index(
+                fields=('status', 'created_at'),
+                name='order_status_created_idx',
+            ),
+            models.Index(
+                fields=('table_number', 'status'),
+                name='order_table_status_idx',
+            ),
+        ]
 
     def __str__(self):
         return f'Заказ {self.id} (Стол {self.table_number})'
@@ -111,6 +214,8 @@ class OrderItem(models.Model):
         Dish, on_delete=models.CASCADE
     )
     quantity = models.PositiveIntegerField(default=1)
+    unit_price = MoneyField(max_digits=8, editable=False)
+    line_total = MoneyField(max_digits=10, editable=False)
 
     class Meta:
         verbose_name = 'позиция заказа'
@@ -125,3 +230,287 @@ class OrderItem(models.Model):
 
     def __str__(self):
         return f'{self.dish.name} x {self.quantity}'
+
+    def save(self, *args, **kwargs):
+        """
+        Фиксирует цену блюда на момент добавления позиции и сумму строки.
+
+        Цена берётся заново только для новой позиции или при смене блюда.
+        """
+        if self.unit_price is None or (
+            self.dish_id != getattr(self, '_loaded_dish_id', self.dish_id)
+        ):
+            self.unit_price = self.dish.price
+        self.line_total = self.unit_price * self.quantity
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {
+                *update_fields, 'unit_price', 'line_total'
+            }
+        super().save(*args, **kwargs)
+        self._loaded_dish_id = self.dish_id
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_dish_id = instance.__dict__.get('dish_id')
+        return instance
+
+
+class TableState(models.Model):
+    """
+    Сводка открытых (неоплаченных) заказов по столу.
+
+    Обновляется при записи заказов, поэтому план зала читается без
+    обращения к таблице заказов.
+    """
+
+    TABLE_COUNT = 50
+
+    table_number = models.PositiveSmallIntegerField(primary_key=True)
+    open_orders = models.PositiveIntegerField(default=0)
+    bill = MoneyField(max_digits=12, default=Decimal('0.00'))
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'состояние стола'
+        verbose_name_plural = 'Состояние столов'
+        ordering = ['table_number']
+
+    def __str__(self):
+        return f'Стол {self.table_number}'
+
+    @classmethod
+    def open_orders_by_table(cls, table_numbers=None, using=None):
+        queryset = Order.objects.db_manager(using).exclude(status=Order.PAID)
+        if table_numbers is not None:
+            queryset = queryset.filter(table_number__in=table_numbers)
+        return {
+            row['table_number']: row
+            for row in queryset.order_by().values('table_number').annotate(
+                count=models.Count('pk'), total=Sum('total_price')
+            )
+        }
+
+    @classmethod
+    def refresh(cls, *table_numbers):
+        """
+        Пересчитывает сводку по указанным столам.
+
+        Строки сводки блокируются до чтения заказов, поэтому параллельные
+        пересчёты одного стола выполняются по очереди и последний видит
+        все зафиксированные заказы.
+        """
+        numbers = sorted(set(table_numbers))
+        if not numbers:
+            return
+        using = router.db_for_write(cls)
+        with transaction.atomic(using=using):
+            cls.objects.using(using).bulk_create(
+                [cls(table_number=number) for number in numbers],
+                ignore_conflicts=True
+            )
+            states = list(
+                cls.objects.using(using).select_for_update().filter(
+                    table_number__in=numbers
+                ).order_by('table_number')
+            )
+            rows = cls.open_orders_by_table(numbers, using)
+            now = timezone.now()
+            for state in states:
+                row = rows.get(state.table_number, {})
+                state.open_orders = row.get('count', 0)
+                state.bill = row.get('total') or Decimal('0.00')
+                state.updated_at = now
+            cls.objects.using(using).bulk_update(
+                states, ['open_orders', 'bill', 'updated_at']
+            )
+        invalidation.publish_on_commit('tables', using, using)
+
+    @classmethod
+    def rebuild(cls):
+        """Полностью пересобирает сводку, например после массовой загрузки."""
+        rows = cls.open_orders_by_table()
+        cls.objects.all().delete()
+        cls.objects.bulk_create([
+            cls(
+                table_number=number, open_orders=row['count'],
+                bill=row['total'] or Decimal('0.00')
+            )
+            for number, row in rows.items()
+        ])
+        using = router.db_for_write(cls)
+        invalidation.publish_on_commit('tables', using, using)
+
+
+class OrderChange(models.Model):
+    """
+    Журнал изменений заказов для дельта-синхронизации.
+
+    Первичный ключ служит монотонно растущим номером изменения. Для каждого
+    живого заказа хранится только последняя запись, для удалённых —
+    отметка об удалении.
+
+    Номер выдаётся при вставке, а не при фиксации транзакции, поэтому
+    читатель может увидеть номер N раньше, чем зафиксируется транзакция с
+    меньшим номером. Курсор, который отдаётся клиентам, ограничивается
+    safe_cursor.
+    """
+
+    order_id = models.PositiveBigIntegerField(db_index=True)
+    deleted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        verbose_name = 'изменение заказа'
+        verbose_name_plural = 'Изменения заказов'
+
+    def __str__(self):
+        return f'#{self.pk}: заказ {self.order_id}'
+
+    @classmethod
+    def last_seq(cls):
+        """Номер последнего видимого изменения."""
+        return cls.objects.aggregate(last=Max('pk'))['last'] or 0
+
+    @classmethod
+    def safe_cursor(cls):
+        """
+        Номер, ниже которого журнал уже не пополнится. SQLite выполняет
+        записывающие транзакции по одной, и последний видимый номер
+        безопасен. В остальных СУБД берётся последнее изменение старше
+        ORDERS_CHANGES_SAFETY_WINDOW секунд: окно должно быть больше самой
+        долгой транзакции, меняющей заказы.
+        """
+        if connections[router.db_for_read(cls)].vendor == 'sqlite':
+            return cls.last_seq()
+        threshold = timezone.now() - timedelta(
+            seconds=settings.ORDERS_CHANGES_SAFETY_WINDOW
+        )
+        return cls.objects.filter(created_at__lte=threshold).aggregate(
+            last=Max('pk'))['last'] or 0
+
+    @classmethod
+    def record(cls, order_id, deleted=False):
+        """Фиксирует изменение заказа и возвращает его номер."""
+        change = cls.objects.create(order_id=order_id, deleted=deleted)
+        cls.objects.filter(
+            order_id=order_id, deleted=False, pk__lt=change.pk
+        ).delete()
+        if not deleted:
+            Order.objects.filter(pk=order_id).update(change_seq=change.pk)
+        return change.pk
+
+    @classmethod
+    def record_many(cls, order_ids, deleted=False):
+        """
+        Фиксирует изменение множества заказов за постоянное число запросов.
+        """
+        changes = cls.objects.bulk_create([
+            cls(order_id=order_id, deleted=deleted) for order_id in order_ids
+        ])
+        if not changes:
+            return {}
+        cls.objects.filter(
+            order_id__in=order_ids, deleted=False, pk__lt=changes[0].pk
+        ).delete()
+        if deleted:
+            return {change.order_id: change.pk for change in changes}
+        sequences = {change.order_id: change.pk for change in changes}
+        Order.objects.filter(pk__in=order_ids).update(change_seq=Case(
+            *[When(pk=order_id, then=Value(seq))
+              for order_id, seq in sequences.items()],
+            output_field=models.PositiveBigIntegerField()
+        ))
+        return sequences
+
+
+class ArchivedOrder(models.Model):
+    """Оплаченный заказ, перенесённый из рабочей таблицы в архив."""
+
+    id = models.BigIntegerField(primary_key=True)
+    table_number = models.PositiveIntegerField()
+    status = models.CharField(
+        max_length=10, choices=Order.ORDER_STATUS_CHOICES
+    )
+    total_price = MoneyField(max_digits=10)
+    created_at = models.DateTimeField(db_index=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'архивный заказ'
+        verbose_name_plural = 'Архив заказов'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f'Архивный заказ {self.id} (Стол {self.table_number})'
+
+
+class ArchivedOrderItem(models.Model):
+    """Позиция архивного заказа с названием и ценой блюда на момент
+    архивации."""
+
+    order = models.ForeignKey(
+        ArchivedOrder, on_delete=models.CASCADE, related_name='items'
+    )
+    dish = models.ForeignKey(
+        Dish, on_delete=models.SET_NULL, null=True, related_name='+'
+    )
+    dish_name = models.CharField(max_length=100)
+    price = MoneyField(max_digits=8)
+    quantity = models.PositiveIntegerField()
+
+    class Meta:
+        verbose_name = 'позиция архивного заказа'
+        verbose_name_plural = 'Позиции архивных заказов'
+
+    def __str__(self):
+        return f'{self.dish_name} x {self.quantity}'
+
+
+class Job(models.Model):
+    """
+    Фоновая задача в очереди на таблице БД.
+
+    Исполнитель забирает задачу с арендой до lease_expires; задача,
+    аренда которой истекла, снова доступна другим исполнителям.
+    """
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=QUEUED
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    lease_expires = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        ordering = ['-pk']
+        indexes = [
+            models.Index(
+                fields=('status', 'run_at'), name='job_status_run_at_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.pk} ({self.get_status_display()})'
@@ -0,0 +1,70 @@
+"""
+Распространение изменения цены блюда на открытые заказы.
+
+Цена и сумма строк этих заказов обновляются, затем итоговые суммы
+пересчитываются set-based UPDATE с коррелированным
+подзапросом (OrderQuerySet.recalc_totals), порциями по CHUNK_SIZE
+заказов. Оплаченные заказы не меняются.
+"""
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import ExpressionWrapper, F, Value
+
+from .fields import MoneyField
+from .jobs import enqueue, task
+from .models import Dish, Order, OrderItem
+from .signals import orders_bulk_updated
+
+CHUNK_SIZE = 1000
+
+
+def affected_orders(dish_id):
+    return Order.objects.exclude(status=Order.PAID).filter(
+        order_items__dish_id=dish_id
+    )
+
+
+def propagate_dish_price(dish_id):
+    """Пересчитывает открытые заказы с блюдом; возвращает их количество."""
+    price = Dish.objects.values_list('price', flat=True).get(pk=dish_id)
+    order_ids = list(
+        affected_orders(dish_id).order_by('pk').values_list('pk', flat=True)
+    )
+    for start in range(0, len(order_ids), CHUNK_SIZE):
+        chunk = order_ids[start:start + CHUNK_SIZE]
+        with transaction.atomic(using=router.db_for_write(Order)):
+            orders = list(
+                Order.objects.select_for_update().filter(
+                    pk__in=chunk
+                ).exclude(status=Order.PAID).only(
+                    'pk', 'table_number', 'status', 'change_seq'
+                )
+            )
+            locked_ids = [order.pk for order in orders]
+            OrderItem.objects.filter(
+                order_id__in=locked_ids, dish_id=dish_id
+            ).update(unit_price=price, line_total=ExpressionWrapper(
+                F('quantity') * Value(price, output_field=MoneyField()),
+                output_field=MoneyField()
+            ))
+            Order.objects.filter(pk__in=locked_ids).recalc_totals()
+            orders_bulk_updated.send(sender=Order, orders=orders)
+    return len(order_ids)
+
+
+@task('propagate_dish_price')
+def propagate_dish_price_task(dish_id):
+    propagate_dish_price(dish_id)
+
+
+def schedule_dish_price_propagation(dish_id):
+    """
+    Пересчитывает заказы сразу или, если их больше
+    ORDERS_PRICE_PROPAGATION_BACKGROUND_THRESHOLD, ставит пересчёт в
+    очередь фоновых задач.
+    """
+    threshold = settings.ORDERS_PRICE_PROPAGATION_BACKGROUND_THRESHOLD
+    if affected_orders(dish_id).count() <= threshold:
+        return propagate_dish_price(dish_id)
+    enqueue('propagate_dish_price', {'dish_id': dish_id})
+    return None
@@ -0,0 +1,125 @@
+"""
+Чтение с реплики БД.
+
+Для основной БД (default или БД кафе) в DATABASE_REPLICAS можно указать
+реплику. Чтения моделей заказов идут на неё только внутри replica_reads,
+который ReplicaMiddleware включает для безопасных запросов клиента, не
+делавшего записей последние REPLICA_READ_YOUR_WRITES_SECONDS секунд.
+Недоступная реплика проверяется не чаще раза в
+REPLICA_HEALTH_CHECK_INTERVAL секунд, а чтения в это время идут в
+основную БД.
+"""
+import logging
+import sqlite3
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+from .locations import LocationRouter
+
+logger = logging.getLogger(__name__)
+
+_replica_reads = ContextVar('orders_replica_reads', default=False)
+_health = {}
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Разрешает читать с реплики до первой записи в блоке."""
+    token = _replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def replica_for(alias):
+    return settings.DATABASE_REPLICAS.get(alias)
+
+
+def is_available(alias):
+    """Доступна ли реплика; результат проверки кешируется."""
+    checked_at, available = _health.get(alias, (None, False))
+    now = time.monotonic()
+    if checked_at is not None and (
+        now - checked_at < settings.REPLICA_HEALTH_CHECK_INTERVAL
+    ):
+        return available
+    available = _check(alias)
+    if not available:
+        logger.warning('Реплика %s недоступна, чтение из основной БД', alias)
+    _health[alias] = (now, available)
+    return available
+
+
+def _check(alias):
+    connection = connections[alias]
+    # SQLite создаёт пустой файл при подключении к несуществующей БД.
+    if connection.vendor == 'sqlite' and not Path(
+        connection.settings_dict['NAME']
+    ).exists():
+        return False
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+    except DatabaseError:
+        return False
+    return True
+
+
+class ReplicaRouter(LocationRouter):
+    """Маршрутизатор кафе, читающий с реплики, когда это разрешено."""
+
+    def db_for_read(self, model, **hints):
+        primary = super().db_for_read(model, **hints)
+        if primary is None or not _replica_reads.get():
+            return primary
+        replica = replica_for(primary)
+        if replica and is_available(replica):
+            return replica
+        return primary
+
+    def db_for_write(self, model, **hints):
+        # После записи блок читает свои же изменения из основной БД.
+        _replica_reads.set(False)
+        return super().db_for_write(model, **hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        primaries = {
+            self.primary_of(obj._state.db) for obj in (obj1, obj2)
+        }
+        return True if len(primaries) == 1 else None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS.values():
+            return False
+        return super().allow_migrate(db, app_label, model_name, **hints)
+
+    @staticmethod
+    def primary_of(alias):
+        for primary, replica in settings.DATABASE_REPLICAS.items():
+            if alias == replica:
+                return primary
+        return alias
+
+
+def copy_sqlite(source, target):
+    """
+    Копирует SQLite-базу через backup API во временный файл и атомарно
+    подменяет им реплику: открытые соединения дочитывают старую копию.
+    """
+    target = Path(target)
+    temporary = target.with_name(f'{target.name}.tmp')
+    temporary.unlink(missing_ok=True)
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(temporary)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+    temporary.replace(target)
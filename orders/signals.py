@@ -1,14 +1,226 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import router, transaction
 from django.db.models.signals import post_delete, post_save
-from django.dispatch import receiver
+from django.dispatch import Signal, receiver
+
+from . import events, invalidation, metrics
+from .models import Dish, Order, OrderChange, OrderItem, TableState
+
+# Отправляется после массового UPDATE заказов (queryset.update не вызывает
+# post_save). Аргумент orders — загруженные до обновления экземпляры Order
+# с уже выставленными новыми значениями полей.
+orders_bulk_updated = Signal()
+
+_batch = ContextVar('orders_signal_batch', default=None)
+
+
+class Batch:
+    """Изменения заказов, отложенные до конца блока batched()."""
+
+    def __init__(self):
+        self.recalc = {}
+        self.saved = {}
+        self.deleted = set()
+        self.tables = set()
+
+    def flush(self):
+        while self.recalc:
+            orders, self.recalc = self.recalc, {}
+            for pk, order in orders.items():
+                if pk not in self.deleted:
+                    order.recalc_total()
+                    events.publish_order_event(events.LINES_CHANGED, order)
+        sequences = OrderChange.record_many(list(self.saved))
+        for pk, instances in self.saved.items():
+            for instance in instances:
+                instance.change_seq = sequences[pk]
+        OrderChange.record_many(sorted(self.deleted), deleted=True)
+        TableState.refresh(*self.tables - {None})
+
+
+@contextmanager
+def batched():
+    """
+    Выполняет блок в одной транзакции и пересчитывает сумму заказа,
+    номер изменения и сводку по столам один раз на заказ в конце блока,
+    а не при каждом сохранении заказа и его позиций.
+    """
+    if _batch.get() is not None:
+        yield
+        return
+    batch = Batch()
+    token = _batch.set(batch)
+    try:
+        with transaction.atomic(using=router.db_for_write(Order)):
+            yield
+            batch.flush()
+    finally:
+        _batch.reset(token)
 
-from .models import OrderItem
+
+def recalc_order_total(order):
+    batch = _batch.get()
+    if batch is not None:
+        batch.recalc[order.pk] = order
+        return
+    order.recalc_total()
+    events.publish_order_event(events.LINES_CHANGED, order)
 
 
 @receiver(post_save, sender=OrderItem)
 def update_order_total_on_save(sender, instance, **kwargs):
-    instance.order.recalc_total()
+    recalc_order_total(instance.order)
 
 
 @receiver(post_delete, sender=OrderItem)
 def update_order_total_on_delete(sender, instance, **kwargs):
-    instance.order.recalc_total()
+    recalc_order_total(instance.order)
+
+
+@receiver(post_save, sender=Order)
+def record_order_change_on_save(sender, instance, **kwargs):
+    batch = _batch.get()
+    if batch is not None:
+        batch.saved.setdefault(instance.pk, []).append(instance)
+        return
+    instance.change_seq = OrderChange.record(instance.pk)
+
+
+@receiver(post_save, sender=Order)
+def refresh_table_state_on_save(sender, instance, update_fields, **kwargs):
+    if update_fields is not None and not {
+        'table_number', 'status', 'total_price'
+    } & set(update_fields):
+        return
+    tables = {instance.table_number}
+    previous = getattr(instance, '_loaded_table_number', None)
+    if previous is not None:
+        tables.add(previous)
+    batch = _batch.get()
+    if batch is not None:
+        batch.tables.update(tables)
+    else:
+        TableState.refresh(*tables)
+    instance._loaded_table_number = instance.table_number
+
+
+@receiver(post_delete, sender=Order)
+def refresh_table_state_on_delete(sender, instance, **kwargs):
+    batch = _batch.get()
+    if batch is not None:
+        batch.tables.add(instance.table_number)
+        return
+    TableState.refresh(instance.table_number)
+
+
+@receiver(post_delete, sender=Order)
+def record_order_change_on_delete(sender, instance, **kwargs):
+    batch = _batch.get()
+    if batch is not None:
+        batch.saved.pop(instance.pk, None)
+        batch.deleted.add(instance.pk)
+        return
+    OrderChange.record(instance.pk, deleted=True)
+
+
+# Должен выполняться до publish_order_event_on_save, который запоминает
+# сохранённый статус.
+@receiver(post_save, sender=Order)
+def count_order_metrics_on_save(
+    sender, instance, created, update_fields, **kwargs
+):
+    if created:
+        metrics.inc('orders_created_total')
+    elif update_fields is not None and 'status' not in update_fields:
+        return
+    elif instance.status_changed:
+        metrics.inc('order_status_transitions_total', {
+            'from': instance._loaded_status, 'to': instance.status
+        })
+
+
+@receiver(post_save, sender=Order)
+def publish_order_event_on_save(
+    sender, instance, created, update_fields, **kwargs
+):
+    if created:
+        events.publish_order_event(events.ORDER_CREATED, instance)
+    elif update_fields is not None and 'status' not in update_fields:
+        return
+    elif instance.status_changed:
+        events.publish_order_event(events.STATUS_CHANGED, instance)
+    instance._loaded_status = instance.status
+
+
+@receiver(post_delete, sender=Order)
+def publish_order_event_on_delete(sender, instance, **kwargs):
+    events.publish_order_event(events.ORDER_DELETED, instance)
+
+
+@receiver(orders_bulk_updated, sender=Order)
+def handle_orders_bulk_updated(sender, orders, **kwargs):
+    sequences = OrderChange.record_many([order.pk for order in orders])
+    tables = set()
+    for order in orders:
+        order.change_seq = sequences.get(order.pk, order.change_seq)
+        tables.update({order.table_number, order._loaded_table_number})
+        if order.status_changed:
+            metrics.inc('order_status_transitions_total', {
+                'from': order._loaded_status, 'to': order.status
+            })
+            events.publish_order_event(events.STATUS_CHANGED, order)
+        order._loaded_status = order.status
+        order._loaded_table_number = order.table_number
+    TableState.refresh(*tables - {None})
+
+
+@receiver(post_save, sender=Dish)
+def propagate_dish_price_on_save(sender, instance, created, **kwargs):
+    if not created and instance.price_changed:
+        from .pricing import schedule_dish_price_propagation
+
+        schedule_dish_price_propagation(instance.pk)
+    instance._loaded_price = instance.price
+
+
+@receiver(post_save, sender=Dish)
+@receiver(post_delete, sender=Dish)
+def invalidate_menu(sender, instance, **kwargs):
+    using = instance._state.db
+    invalidation.publish_on_commit('menu', using, using)
+
+
+RECEIVERS = (
+    (post_save, update_order_total_on_save, OrderItem),
+    (post_delete, update_order_total_on_delete, OrderItem),
+    (post_save, record_order_change_on_save, Order),
+    (post_save, refresh_table_state_on_save, Order),
+    (post_delete, refresh_table_state_on_delete, Order),
+    (post_delete, record_order_change_on_delete, Order),
+    (post_save, count_order_metrics_on_save, Order),
+    (post_save, publish_order_event_on_save, Order),
+    (post_delete, publish_order_event_on_delete, Order),
+    (orders_bulk_updated, handle_orders_bulk_updated, Order),
+    (post_save, propagate_dish_price_on_save, Dish),
+    (post_save, invalidate_menu, Dish),
+    (post_delete, invalidate_menu, Dish),
+)
+
+
+@contextmanager
+def disabled():
+    """
+    Временно отключает обработчики заказов, например для массовой загрузки.
+
+    Без подключённых обработчиков Django удаляет записи без загрузки
+    объектов в память.
+    """
+    for signal, handler, sender in RECEIVERS:
+        signal.disconnect(handler, sender=sender)
+    try:
+        yield
+    finally:
+        for signal, handler, sender in RECEIVERS:
+            signal.connect(handler, sender=sender)
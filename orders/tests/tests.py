@@ -1,11 +1,42 @@
+import asyncio
+import multiprocessing
+import sqlite3
+import sys
+import time
+from contextlib import closing
+from datetime import timedelta
 from decimal import Decimal
+from io import StringIO
 
 import pytest
+from django.contrib.auth.models import AnonymousUser
 from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Sum
+from django.http import HttpResponse
+from django.test import RequestFactory
 from django.urls import reverse
+from django.utils import timezone
 from pytest_django.asserts import assertRedirects
 
-from orders.models import CustomUser, Dish, Order, OrderItem
+from api.models import IdempotencyKey
+from orders import admission, fragments, invalidation, jobs, replicas
+from orders.admin import EstimatedCountPaginator
+from orders.events import hub
+from orders.invalidation import InvalidationBus, LocalCache, SQLiteTransport
+from orders.jobs import enqueue, task
+from orders.locations import LocationRouter, use_location
+from orders.metrics import Registry
+from orders.middleware import LocationMiddleware, ReplicaMiddleware
+from orders.models import (
+    CustomUser, Dish, Job, Order, OrderChange, OrderItem,
+    TableState
+)
+from orders.replicas import ReplicaRouter
 
 
 # Фикстуры для пользователей
@@ -192,3 +223,631 @@ def test_order_search_filter(
     assert response.status_code == 200
     orders = response.context['orders']
     assert len(orders) == expected_count
+
+
+# Тест бюджета запросов для списков в админке
+@pytest.mark.parametrize('model_name', [
+    'customuser', 'dish', 'order', 'orderitem'
+])
+def test_admin_changelist_query_budget(
+    db, client, admin_user, django_assert_max_num_queries, model_name
+):
+    admin_user.is_staff = True
+    admin_user.is_superuser = True
+    admin_user.save()
+    dishes = [
+        Dish.objects.create(name=f'Блюдо {i}', price=Decimal('10.00'))
+        for i in range(5)
+    ]
+    for table_number in range(1, 6):
+        order = Order.objects.create(table_number=table_number)
+        for dish in dishes:
+            OrderItem.objects.create(order=order, dish=dish)
+    client.force_login(admin_user)
+    url = reverse(f'admin:orders_{model_name}_changelist')
+    # Ошибка: число запросов растёт вместе с количеством строк.
+    with django_assert_max_num_queries(10):
+        response = client.get(url)
+    assert response.status_code == 200
+
+
+# Тест подсчёта строк без фильтров после удалений
+def test_estimated_count_paginator(db):
+    orders = [Order.objects.create(table_number=n) for n in range(1, 6)]
+    Order.objects.filter(pk__in=[orders[1].pk, orders[3].pk]).delete()
+    paginator = EstimatedCountPaginator(Order.objects.order_by('-pk'), 2)
+    # Ошибка: после удалений не должно быть пустых страниц в конце.
+    assert paginator.count == 3
+    assert paginator.num_pages == 2
+    paginator = EstimatedCountPaginator(Order.objects.order_by('-pk'), 2)
+    paginator.count_limit = 2
+    assert paginator.count == 2
+
+
+# Тест рассылки событий заказов подписчикам шины
+def test_order_events_published(db, order, dish,
+                                django_capture_on_commit_callbacks):
+    async def subscribe(location=None):
+        return hub.subscribe(location)
+
+    loop = asyncio.new_event_loop()
+    subscription = loop.run_until_complete(subscribe())
+    other_cafe = loop.run_until_complete(subscribe('north'))
+    with django_capture_on_commit_callbacks(execute=True):
+        OrderItem.objects.create(order=order, dish=dish)
+        order = Order.objects.get(pk=order.pk)
+        order.status = Order.READY
+        order.save()
+    loop.run_until_complete(asyncio.sleep(0))
+    hub.unsubscribe(subscription)
+    hub.unsubscribe(other_cafe)
+    loop.close()
+    # Ошибка: события заказа ушли подписчику другого кафе.
+    assert other_cafe.queue.empty()
+    received = []
+    while not subscription.queue.empty():
+        received.append(subscription.queue.get_nowait())
+    # Ошибка: подписчик не получил события об изменении заказа.
+    assert [event['event'] for event in received] == [
+        'lines_changed', 'status_changed'
+    ]
+    assert all(event['order_id'] == order.id for event in received)
+
+
+# Тест генератора синтетических данных
+def test_seed_load_data(db):
+    call_command(
+        'seed_load_data', orders=30, dishes=8, lines_max=3,
+        chunk_size=7, statuses='pending=1,paid=1', stdout=StringIO()
+    )
+    assert Order.objects.count() == 30
+    assert not Order.objects.filter(status=Order.READY).exists()
+    for order in Order.objects.prefetch_related('order_items__dish'):
+        # Ошибка: итоговая сумма не пересчитана после загрузки.
+        assert order.total_price == sum(
+            item.dish.price * item.quantity
+            for item in order.order_items.all()
+        )
+    # Ошибка: загруженные заказы не получили номер изменения.
+    assert not Order.objects.filter(change_seq=0).exists()
+    assert OrderChange.objects.filter(deleted=False).count() == 30
+    old_ids = set(Order.objects.values_list('pk', flat=True))
+    snapshot = list(OrderItem.objects.order_by('pk').values_list(
+        'dish__name', 'quantity'))
+    call_command(
+        'seed_load_data', orders=30, dishes=8, lines_max=3,
+        chunk_size=7, statuses='pending=1,paid=1', flush=True,
+        stdout=StringIO()
+    )
+    # Ошибка: при том же seed данные должны совпадать.
+    assert list(OrderItem.objects.order_by('pk').values_list(
+        'dish__name', 'quantity')) == snapshot
+    # Ошибка: удаление старых заказов не попало в журнал изменений.
+    assert set(OrderChange.objects.filter(deleted=True).values_list(
+        'order_id', flat=True)) == old_ids
+
+
+def _increment_metrics(path):
+    registry = Registry(path)
+    for _ in range(100):
+        registry.inc('orders_created_total')
+        registry.observe('db_queries_per_request', 3, {'route': 'x'})
+    registry.flush()
+
+
+# Тест агрегации метрик из нескольких процессов
+def test_metrics_aggregated_across_processes(tmp_path):
+    path = tmp_path / 'metrics.sqlite3'
+    context = multiprocessing.get_context('fork')
+    processes = [
+        context.Process(target=_increment_metrics, args=(path,))
+        for _ in range(3)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    text = Registry(path).collect()
+    # Ошибка: счётчики процессов не сложились.
+    assert 'orders_created_total 300\n' in text
+    assert 'db_queries_per_request_bucket{le="5",route="x"} 300' in text
+    assert 'db_queries_per_request_bucket{le="2",route="x"}' not in text
+
+
+# Тест точности значений и сбоя записи метрик
+def test_metrics_precision_and_flush_errors(tmp_path):
+    registry = Registry(tmp_path / 'metrics.sqlite3')
+    registry.inc('orders_created_total', value=123456789)
+    registry.observe('db_queries_per_request', 0.1234567, {'route': 'x'})
+    text = registry.collect()
+    # Ошибка: значения округлились при выводе.
+    assert 'orders_created_total 123456789\n' in text
+    assert 'db_queries_per_request_sum{route="x"} 0.1234567\n' in text
+
+    broken = Registry(tmp_path / 'missing' / 'metrics.sqlite3', 0)
+    broken.inc('orders_created_total')
+    # Ошибка: сбой записи метрик не должен ломать запрос.
+    broken.maybe_flush()
+    # Ошибка: несохранённые приращения потерялись.
+    assert broken._pending == {('orders_created_total', ''): 1}
+
+
+def _wait_for_invalidation(path, ready):
+    bus = InvalidationBus(SQLiteTransport(path))
+    cache = LocalCache('test-menu')
+    cache.get_or_set('default', lambda: 'меню')
+    cache.get_or_set('cafe_north', lambda: 'меню')
+    bus.poll()
+    ready.set()
+    deadline = time.monotonic() + 5
+    while cache.get_or_set('default', lambda: None) is not None:
+        if time.monotonic() > deadline:
+            sys.exit(1)
+        bus.poll()
+        time.sleep(0.05)
+    # Ошибка: сброшен ключ, которого не было в сообщении.
+    sys.exit(0 if cache.get_or_set('cafe_north', lambda: None) else 2)
+
+
+# Тест доставки сообщений инвалидации нескольким процессам
+def test_invalidation_across_processes(tmp_path):
+    path = tmp_path / 'invalidation.sqlite3'
+    context = multiprocessing.get_context('fork')
+    events = [context.Event() for _ in range(3)]
+    processes = [
+        context.Process(target=_wait_for_invalidation, args=(path, ready))
+        for ready in events
+    ]
+    for process in processes:
+        process.start()
+    for ready in events:
+        assert ready.wait(5)
+    InvalidationBus(SQLiteTransport(path)).publish('test-menu', 'default')
+    for process in processes:
+        process.join(10)
+    assert [process.exitcode for process in processes] == [0, 0, 0]
+
+
+# Тест чтения шины из кеша, когда фоновый поток не запущен
+def test_local_cache_polls_without_poller(settings, monkeypatch):
+    settings.INVALIDATION_POLL_INTERVAL = 0
+    monkeypatch.setattr(invalidation, '_poller', None)
+    invalidation.start_poller()
+    assert invalidation._poller is None
+    cache = LocalCache('test-lazy')
+    assert cache.get_or_set('default', lambda: 'старое') == 'старое'
+    # Сообщение другого воркера.
+    with invalidation.get_bus().transport._connect() as connection:
+        connection.execute(
+            'INSERT INTO invalidations (origin, topic, key) '
+            "VALUES (0, 'test-lazy', 'default')"
+        )
+    # Ошибка: без фонового потока кеш не видит сообщений других воркеров.
+    assert cache.get_or_set('default', lambda: 'новое') == 'новое'
+
+
+# Тест сброса локального кеша во время вычисления значения
+def test_local_cache_invalidated_during_compute():
+    cache = LocalCache('test-race')
+
+    def compute(key=None):
+        cache.invalidate(key)
+        return 'устаревшее'
+
+    # Ошибка: значение, вычисленное до сброса, попало в кеш.
+    assert cache.get_or_set('default', lambda: compute('default')) == (
+        'устаревшее'
+    )
+    assert cache.get_or_set('default', lambda: 'свежее') == 'свежее'
+    cache.get_or_set('cafe_north', compute)
+    assert cache.get_or_set('cafe_north', lambda: 'свежее') == 'свежее'
+    # Ошибка: сброс другого ключа не должен мешать кешированию.
+    cache.get_or_set('cafe_south', lambda: cache.invalidate('default'))
+    assert cache.get_or_set('cafe_south', lambda: 'новое') is None
+
+
+# Тест эндпоинта /metrics
+def test_metrics_endpoint(db, client, settings, order, dish, admin_user):
+    OrderItem.objects.create(order=order, dish=dish)
+    order = Order.objects.get(pk=order.pk)
+    order.status = Order.READY
+    order.save()
+    client.get(reverse('orders:list'))
+    # Ошибка: без токена метрики закрыты даже для запросов с localhost.
+    assert client.get('/metrics').status_code == 403
+    settings.METRICS_TOKEN = 'secret'
+    response = client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong')
+    assert response.status_code == 403
+    response = client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+    assert response.status_code == 200
+    text = response.content.decode()
+    settings.METRICS_TOKEN = ''
+    client.force_login(admin_user)
+    assert client.get('/metrics').status_code == 200
+    assert 'order_recalc_total{mode="single"} 1' in text
+    assert (
+        'order_status_transitions_total{from="pending",to="ready"} 1'
+        in text
+    )
+    assert 'http_responses_total{route="orders:list",status="302"} 1' \
+        in text
+
+
+# Тест пересчёта открытых заказов при изменении цены блюда
+def test_dish_price_propagation(db, order, dish):
+    OrderItem.objects.create(order=order, dish=dish, quantity=2)
+    paid = Order.objects.create(table_number=2)
+    OrderItem.objects.create(order=paid, dish=dish, quantity=1)
+    paid.status = Order.PAID
+    paid.save()
+    dish = Dish.objects.get(pk=dish.pk)
+    dish.price = Decimal('150.00')
+    dish.save()
+    order.refresh_from_db()
+    paid.refresh_from_db()
+    assert order.total_price == Decimal('300.00')
+    # Ошибка: сумма оплаченного заказа не должна меняться.
+    assert paid.total_price == Decimal('100.00')
+    assert TableState.objects.get(table_number=1).bill == Decimal('300.00')
+
+
+# Тест фиксации цены блюда в позиции заказа
+def test_order_item_keeps_unit_price(db, order, dish):
+    item = OrderItem.objects.create(order=order, dish=dish, quantity=3)
+    assert item.unit_price == Decimal('100.00')
+    assert item.line_total == Decimal('300.00')
+    order.status = Order.PAID
+    order.save()
+    Dish.objects.filter(pk=dish.pk).update(price=Decimal('500.00'))
+    order.recalc_total()
+    item.refresh_from_db()
+    # Ошибка: новая цена блюда не должна менять историю заказа.
+    assert item.unit_price == Decimal('100.00')
+    assert order.total_price == Decimal('300.00')
+
+
+# Тест денежных сумм: по умолчанию десятичные, в копейках по настройке
+def test_money_field_storage(db, settings, order, dish):
+    OrderItem.objects.create(order=order, dish=dish, quantity=3)
+    dish.price = Decimal('0.15')
+    dish.save()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT price FROM orders_dish WHERE id = %s', [dish.pk]
+        )
+        # Ошибка: без MONEY_MINOR_UNITS суммы хранятся как раньше.
+        assert Decimal(str(cursor.fetchone()[0])) == (
+            15 if settings.MONEY_MINOR_UNITS else Decimal('0.15')
+        )
+    order.refresh_from_db()
+    assert order.total_price == Decimal('0.45')
+    assert Order.objects.aggregate(total=Sum('total_price'))['total'] == \
+        Decimal('0.45')
+    field = Dish._meta.get_field('price')
+    assert field.formfield().clean('12.34') == Decimal('12.34')
+
+    settings.MONEY_MINOR_UNITS = True
+    assert field.get_internal_type() == 'BigIntegerField'
+    assert field.get_db_prep_save(Decimal('0.15'), connection) == 15
+    assert field.from_db_value(15, None, connection) == Decimal('0.15')
+
+
+# Тест перевода сумм в копейки миграцией и обратно
+@pytest.mark.django_db(transaction=True)
+def test_money_minor_units_migration(settings):
+    before = [('orders', '0010_orderitem_prices')]
+    after = [('orders', '0011_money_minor_units')]
+    executor = MigrationExecutor(connection)
+    latest = executor.loader.graph.leaf_nodes('orders')
+    prices = [Decimal('0.15'), Decimal('123456.78'), Decimal('0.10')]
+    minor_units = settings.MONEY_MINOR_UNITS
+
+    def raw_prices():
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT price FROM orders_dish ORDER BY id')
+            return [row[0] for row in cursor.fetchall()]
+
+    try:
+        executor.migrate(before)
+        Dish = executor.loader.project_state(before).apps.get_model(
+            'orders', 'Dish'
+        )
+        for number, price in enumerate(prices):
+            Dish.objects.create(name=f'Блюдо {number}', price=price)
+        settings.MONEY_MINOR_UNITS = True
+        MigrationExecutor(connection).migrate(after)
+        assert raw_prices() == [15, 12345678, 10]
+        MigrationExecutor(connection).migrate(before)
+        # Ошибка: при откате суммы должны вернуться без потерь.
+        assert list(
+            Dish.objects.order_by('pk').values_list('price', flat=True)
+        ) == prices
+    finally:
+        settings.MONEY_MINOR_UNITS = minor_units
+        MigrationExecutor(connection).migrate(latest)
+
+
+# Тест выбора БД кафе по заголовку, хосту и пользователю
+def test_location_routing(db, client, settings, waiter_user):
+    settings.CAFE_LOCATIONS = ['north', 'south']
+    settings.LOCATION_HOSTS = {'south.example.com': 'south'}
+    settings.ALLOWED_HOSTS = ['*']
+    router = LocationRouter()
+    with use_location('north'):
+        assert router.db_for_write(Order) == 'cafe_north'
+        assert router.db_for_read(CustomUser) is None
+        # Ошибка: ключи идемпотентности хранятся рядом с заказами кафе.
+        assert router.db_for_write(IdempotencyKey) == 'cafe_north'
+    assert router.db_for_read(Order) == 'default'
+    assert router.allow_migrate('cafe_north', 'orders', 'order')
+    # Ошибка: пользователи и системные таблицы хранятся только в default.
+    assert not router.allow_migrate('cafe_north', 'orders', 'customuser')
+    assert not router.allow_migrate('cafe_north', 'auth', 'group')
+
+    factory = RequestFactory()
+    request = factory.get('/', HTTP_X_LOCATION='north')
+    request.user = AnonymousUser()
+    assert LocationMiddleware.resolve(request) == 'north'
+    request = factory.get('/', HTTP_HOST='south.example.com')
+    request.user = AnonymousUser()
+    assert LocationMiddleware.resolve(request) == 'south'
+    waiter_user.location = 'south'
+    request = factory.get('/')
+    request.user = waiter_user
+    assert LocationMiddleware.resolve(request) == 'south'
+    request = factory.get('/', HTTP_X_LOCATION='north')
+    request.user = waiter_user
+    with pytest.raises(PermissionDenied):
+        LocationMiddleware.resolve(request)
+
+    response = client.get('/api/v1/orders/', HTTP_X_LOCATION='west')
+    assert response.status_code == 404
+
+
+# Тест чтения с реплики, чтения своих записей и возврата к основной БД
+def test_replica_routing(db, settings, tmp_path, monkeypatch):
+    settings.DATABASE_REPLICAS = {'default': 'default_replica'}
+    replicas._health.clear()
+    monkeypatch.setattr(replicas, '_check', lambda alias: True)
+    router = ReplicaRouter()
+    assert router.db_for_read(Order) == 'default'
+    with replicas.replica_reads():
+        assert router.db_for_read(Order) == 'default_replica'
+        assert router.db_for_read(CustomUser) is None
+        router.db_for_write(Order)
+        # Ошибка: после записи чтение должно идти из основной БД.
+        assert router.db_for_read(Order) == 'default'
+    assert not router.allow_migrate('default_replica', 'orders', 'order')
+
+    seen = []
+
+    def get_response(request):
+        seen.append(router.db_for_read(Order))
+        return HttpResponse()
+
+    cache.clear()
+    middleware = ReplicaMiddleware(get_response)
+    factory = RequestFactory()
+    middleware(factory.get('/'))
+    middleware(factory.post('/'))
+    middleware(factory.get('/'))
+    middleware(factory.get('/', REMOTE_ADDR='10.0.0.2'))
+    assert seen == [
+        'default_replica', 'default', 'default', 'default_replica'
+    ]
+
+    replicas._health.clear()
+    monkeypatch.setattr(replicas, '_check', lambda alias: False)
+    with replicas.replica_reads():
+        # Ошибка: недоступная реплика должна заменяться основной БД.
+        assert router.db_for_read(Order) == 'default'
+    replicas._health.clear()
+
+    source = tmp_path / 'primary.sqlite3'
+    with closing(sqlite3.connect(source)) as primary, primary:
+        primary.execute('CREATE TABLE t (x INTEGER)')
+        primary.execute('INSERT INTO t VALUES (1)')
+    replicas.copy_sqlite(source, tmp_path / 'replica.sqlite3')
+    with closing(sqlite3.connect(tmp_path / 'replica.sqlite3')) as replica:
+        assert replica.execute('SELECT x FROM t').fetchall() == [(1,)]
+
+
+# Тест очереди фоновых задач: повторы, отказ и аренда
+def test_job_queue_retry_and_lease(db, settings):
+    settings.JOBS_RETRY_BASE_DELAY = 0
+    calls = []
+
+    @task('test_flaky')
+    def flaky(fail):
+        calls.append(fail)
+        if fail:
+            raise RuntimeError('сбой')
+
+    try:
+        job = enqueue('test_flaky', {'fail': True}, max_attempts=2)
+        [claimed] = jobs.claim('w1')
+        assert claimed.pk == job.pk and claimed.attempts == 1
+        # Ошибка: захваченную задачу не должен получить второй исполнитель.
+        assert jobs.claim('w2') == []
+        assert not jobs.run_job(claimed, 'w1')
+        job.refresh_from_db()
+        assert job.status == Job.QUEUED and 'сбой' in job.last_error
+        [claimed] = jobs.claim('w1')
+        jobs.run_job(claimed, 'w1')
+        job.refresh_from_db()
+        # Ошибка: после max_attempts задача не должна повторяться.
+        assert job.status == Job.FAILED and job.attempts == 2
+
+        job = enqueue('test_flaky', {'fail': False})
+        jobs.claim('w1', lease=60)
+        Job.objects.filter(pk=job.pk).update(
+            lease_expires=timezone.now() - timedelta(seconds=1)
+        )
+        # Задачу упавшего исполнителя забирает другой после конца аренды.
+        [claimed] = jobs.claim('w2')
+        assert jobs.run_job(claimed, 'w2')
+        # Ошибка: опоздавший исполнитель не должен менять чужую задачу.
+        assert not jobs.extend_leases('w1', [job.pk])
+        job.refresh_from_db()
+        assert job.status == Job.DONE and job.locked_by == 'w2'
+
+        # Исполнитель остановился на последней попытке.
+        job = enqueue('test_flaky', {'fail': False}, max_attempts=1)
+        jobs.claim('w1', lease=60)
+        Job.objects.filter(pk=job.pk).update(
+            lease_expires=timezone.now() - timedelta(seconds=1)
+        )
+        assert jobs.claim('w2') == []
+        job.refresh_from_db()
+        # Ошибка: задача с исчерпанными попытками снова выдана исполнителю.
+        assert job.status == Job.FAILED and job.attempts == 1
+        assert calls == [True, True, False]
+        with pytest.raises(KeyError):
+            enqueue('missing')
+    finally:
+        jobs.TASKS.pop('test_flaky')
+
+
+def _apps_ready():
+    from django.apps import apps
+
+    return apps.ready
+
+
+# Тест пула процессов исполнителя задач
+def test_worker_process_pool():
+    worker = jobs.Worker(['default'], concurrency=1, use_processes=True)
+    with worker.make_pool() as pool:
+        # Ошибка: fork копирует процесс вместе с потоками исполнителя.
+        assert pool._mp_context.get_start_method() == 'spawn'
+        # Ошибка: в дочернем процессе не настроен Django.
+        assert pool.submit(_apps_ready).result(timeout=60)
+
+
+# Тест фонового пересчёта цен через команду run_worker
+def test_run_worker_propagates_price(transactional_db, settings, dish):
+    settings.ORDERS_PRICE_PROPAGATION_BACKGROUND_THRESHOLD = 1
+    orders = [Order.objects.create(table_number=n) for n in (1, 2)]
+    for order in orders:
+        OrderItem.objects.create(order=order, dish=dish, quantity=2)
+    dish = Dish.objects.get(pk=dish.pk)
+    dish.price = Decimal('150.00')
+    dish.save()
+    assert Job.objects.get().name == 'propagate_dish_price'
+    # Ошибка: заказы сверх порога не должны пересчитываться в запросе.
+    assert Order.objects.get(pk=orders[0].pk).total_price == Decimal('200.00')
+    out = StringIO()
+    call_command('run_worker', '--once', stdout=out)
+    assert 'Выполнено задач: 1' in out.getvalue()
+    assert Job.objects.get().status == Job.DONE
+    assert set(
+        Order.objects.values_list('total_price', flat=True)
+    ) == {Decimal('300.00')}
+
+
+# Тест отсечения нагрузки по классам запросов
+def test_admission_control(db, client, settings, admin_user, dish):
+    settings.ADMISSION_CONTROL = {
+        'writes': {'limit': 1, 'max_wait': 1},
+        'reads': {'limit': 1, 'max_wait': 0},
+        'reports': {'limit': 1, 'max_wait': 0},
+    }
+    client.force_login(admin_user)
+    gates = admission.get_gates()
+    assert gates['reports'].enter() == (True, 0.0)
+    gates['reports'].service_time = 2.5
+    response = client.get(reverse('orders:revenue'))
+    assert response.status_code == 503
+    assert response['Retry-After'] == '3'
+    # Ошибка: занятый отчёт не должен мешать созданию заказа.
+    response = client.post(reverse('orders:create'), {
+        'table_number': 5, 'order_items-TOTAL_FORMS': 1,
+        'order_items-INITIAL_FORMS': 0, 'order_items-0-dish': dish.pk,
+        'order_items-0-quantity': 1,
+    })
+    assert response.status_code == 302
+    assert client.get(reverse('orders:list')).status_code == 200
+    gates['reports'].leave(0.1)
+    assert client.get(reverse('orders:revenue')).status_code == 200
+    # Поток событий не ограничивается.
+    assert admission.classify(
+        RequestFactory().get(reverse('order_events'))
+    ) is None
+
+    # Под ASGI запрос ждёт места в цикле событий, а не в потоке пула.
+    async def wait_in_loop():
+        gate = admission.Gate('test', 1, 0.05)
+        assert await gate.aenter() == (True, 0.0)
+        admitted, _ = await gate.aenter()
+        # Ошибка: место занято дольше max_wait, запрос должен получить 503.
+        assert not admitted
+        waiter = asyncio.ensure_future(gate.aenter())
+        await asyncio.sleep(0)
+        gate.aleave(0.01)
+        assert (await waiter)[0]
+        gate.aleave(0.01)
+        assert gate.waiting == 0
+
+    asyncio.run(wait_in_loop())
+
+
+# Тест фрагментов строк списка заказов
+def test_order_row_fragments(
+    db, client, admin_user, order, dish, django_assert_num_queries,
+    django_capture_on_commit_callbacks
+):
+    cache.clear()
+    OrderItem.objects.create(order=order, dish=dish, quantity=2)
+    client.force_login(admin_user)
+    response = client.get(reverse('orders:rows'))
+    assert response.status_code == 200
+    html = response.content.decode()
+    assert f'id="order-row-{order.pk}"' in html
+    assert '<html' not in html
+    # Ошибка: в закешированную строку не должен попадать чужой CSRF-токен.
+    assert fragments.CSRF_PLACEHOLDER not in html
+    assert 'csrfmiddlewaretoken' in html
+    assert response['X-Has-Next'] == 'false'
+    version = int(response['X-Orders-Version'])
+    assert version == Order.objects.get(pk=order.pk).change_seq
+
+    # Строка из кеша: без запросов позиций и блюд.
+    with django_assert_num_queries(4):
+        client.get(reverse('orders:rows'))
+    url = reverse('orders:row_changes')
+    assert client.get(url, {'since': version}).json() == {
+        'version': version, 'rows': [], 'deleted': []
+    }
+
+    order.status = Order.READY
+    order.save()
+    paid = Order.objects.create(table_number=3, status=Order.PAID)
+    data = client.get(url, {'since': version, 'status': Order.READY}).json()
+    assert [row['id'] for row in data['rows']] == [order.pk]
+    assert 'Готов' in data['rows'][0]['html']
+    # Ошибка: заказ, не подходящий под фильтр, нужно убрать со страницы.
+    assert data['deleted'] == [paid.pk]
+    assert data['version'] > version
+
+    with django_capture_on_commit_callbacks(execute=True):
+        Dish.objects.filter(pk=dish.pk).update(name='Борщ')
+        Dish.objects.get(pk=dish.pk).save()
+    assert 'Борщ' in client.get(reverse('orders:rows')).content.decode()
+    assert client.get(url, {'since': 'x'}).status_code == 400
+    assert client.get(reverse('orders:rows'), {'page': 0}).status_code == 404
+
+
+# Тест кеша строк для суперпользователя с ролью официанта
+def test_order_row_fragments_superuser(db, client, waiter_user, order):
+    cache.clear()
+    superuser = CustomUser.objects.create_superuser(
+        username='root', password='password'
+    )
+    assert superuser.role == CustomUser.WAITER
+    client.force_login(superuser)
+    assert 'Удалить' in client.get(reverse('orders:rows')).content.decode()
+    client.force_login(waiter_user)
+    # Ошибка: официант получил из кеша строку с кнопками администратора.
+    assert 'Удалить' not in client.get(
+        reverse('orders:rows')
+    ).content.decode()
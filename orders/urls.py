@@ -5,6 +5,8 @@ from .views import (
     OrderCreateView,
     OrderDeleteView,
     OrderListView,
+    OrderRowChangesView,
+    OrderRowsView,
     OrderStatusUpdateView,
     OrderUpdateView,
     RevenueReportView
@@ -15,6 +17,11 @@ app_name = 'orders'
 
 urlpatterns = [
     path('', OrderListView.as_view(), name='list'),
+    path('rows/', OrderRowsView.as_view(), name='rows'),
+    path(
+        'rows/changes/', OrderRowChangesView.as_view(),
+        name='row_changes'
+    ),
     path('create/', OrderCreateView.as_view(), name='create'),
     path('revenue/', RevenueReportView.as_view(), name='revenue'),
     path('<int:pk>/delete/', OrderDeleteView.as_view(), name='delete'),
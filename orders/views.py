@@ -1,6 +1,6 @@
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db.models import Sum
+from django.http import Http404, JsonResponse
 from django.shortcuts import render
 from django.urls import reverse_lazy
 from django.views.generic import (
@@ -12,6 +12,7 @@ from django.views.generic import (
 )
 from django.views.generic.edit import FormView
 
+from . import signals
 from .forms import (
     AdminUserCreationForm,
     OrderCreateForm,
@@ -19,12 +20,13 @@ from .forms import (
     OrderSearchForm,
     OrderStatusForm,
 )
+from .fragments import current_version, render_rows
 from .mixins import (
     AdminRequiredMixin,
     ChefOrAdminRequiredMixin,
     WaiterOrAdminRequiredMixin,
 )
-from .models import CustomUser, Order
+from .models import CustomUser, Order, OrderChange
 
 
 class OrderListView(
@@ -43,7 +45,8 @@ class OrderListView(
             Возвращает набор запросов заказов, отфильтрованных по
                 критериям формы поиска, если они предоставлены.
         get_context_data(**kwargs):
-            Добавляет форму поиска в данные контекста.
+            Добавляет форму поиска, строки заказов из кеша фрагментов и
+                версию списка для обновления страницы по частям.
     """
 
     model = Order
@@ -51,13 +54,23 @@ class OrderListView(
     context_object_name = 'orders'
     ordering = ['-id']
 
+    def get(self, request, *args, **kwargs):
+        # Версия читается до выборки: изменения, сделанные во время
+        # запроса, страница получит при следующем обновлении.
+        self.version = current_version()
+        return super().get(request, *args, **kwargs)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['status_choices'] = Order.ORDER_STATUS_CHOICES
+        context['order_rows'] = render_rows(
+            self.request, list(context['object_list'])
+        )
+        context['orders_version'] = self.version
         return context
 
     def get_queryset(self):
-        qs = super().get_queryset().prefetch_related('order_items__dish')
+        qs = super().get_queryset()
         form = OrderSearchForm(self.request.GET)
 
         if form.is_valid():
@@ -69,6 +82,76 @@ class OrderListView(
         return qs
 
 
+class OrderRowsView(OrderListView):
+    """
+    OrderRowsView возвращает только строки таблицы заказов для фильтра и
+    страницы, без макета, сообщений и подсчёта страниц.
+
+    Версия списка передаётся в заголовке X-Orders-Version, наличие
+    следующей страницы — в X-Has-Next.
+    """
+
+    template_name = 'includes/order_rows.html'
+
+    def get(self, request, *args, **kwargs):
+        version = current_version()
+        try:
+            page = int(request.GET.get('page', 1))
+        except ValueError:
+            page = 0
+        if page < 1:
+            raise Http404('Некорректный номер страницы')
+        offset = (page - 1) * self.paginate_by
+        orders = list(
+            self.get_queryset()[offset:offset + self.paginate_by + 1]
+        )
+        has_next = len(orders) > self.paginate_by
+        response = render(request, self.template_name, {
+            'order_rows': render_rows(request, orders[:self.paginate_by])
+        })
+        response['X-Orders-Version'] = version
+        response['X-Has-Next'] = 'true' if has_next else 'false'
+        return response
+
+
+class OrderRowChangesView(OrderListView):
+    """
+    OrderRowChangesView возвращает строки заказов, изменённых после версии
+    since, и id заказов, которые нужно убрать со страницы: удалённых и
+    переставших подходить под фильтр. Если изменений больше
+    changes_limit, вместо строк возвращается reload — страница должна
+    запросить строки целиком.
+    """
+
+    changes_limit = 100
+
+    def get(self, request, *args, **kwargs):
+        try:
+            since = int(request.GET.get('since', ''))
+        except ValueError:
+            since = -1
+        if since < 0:
+            return JsonResponse(
+                {'error': 'Параметр since должен быть целым числом >= 0'},
+                status=400
+            )
+        version = max(since, current_version())
+        changed = set(OrderChange.objects.filter(
+            pk__gt=since, pk__lte=OrderChange.last_seq()
+        ).values_list('order_id', flat=True)[:self.changes_limit + 1])
+        if len(changed) > self.changes_limit:
+            return JsonResponse({'version': version, 'reload': True})
+        orders = list(self.get_queryset().filter(pk__in=changed))
+        return JsonResponse({
+            'version': version,
+            'rows': [
+                {'id': order.pk, 'html': row}
+                for order, row in zip(orders, render_rows(request, orders))
+            ],
+            'deleted': sorted(changed - {order.pk for order in orders}),
+        })
+
+
 class OrderCreateView(
     LoginRequiredMixin,
     WaiterOrAdminRequiredMixin,
@@ -111,10 +194,10 @@ class OrderCreateView(
         context = self.get_context_data()
         formset = context['formset']
         if formset.is_valid():
-            self.object = form.save()
-            formset.instance = self.object
-            formset.save()
-            self.object.recalc_total()
+            with signals.batched():
+                self.object = form.save()
+                formset.instance = self.object
+                formset.save()
             messages.success(self.request, 'Заказ успешно создан')
             return super().form_valid(form)
         else:
@@ -230,10 +313,11 @@ class OrderUpdateView(
         context = self.get_context_data()
         formset = context['formset']
         if formset.is_valid():
-            self.object = form.save()
-            formset.instance = self.object
-            formset.save()
-            self.object.recalc_total()  # пересчёт итоговой суммы
+            # Сумма заказа и сводка по столу пересчитываются один раз.
+            with signals.batched():
+                self.object = form.save()
+                formset.instance = self.object
+                formset.save()
             messages.success(self.request, 'Заказ успешно обновлен')
             return super().form_valid(form)
         else:
@@ -263,9 +347,7 @@ class RevenueReportView(
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        total = Order.objects.filter(
-            status=Order.PAID).aggregate(total=Sum('total_price'))
-        context['total_revenue'] = total['total'] or 0
+        context['total_revenue'] = Order.objects.revenue()
         return context
 
 
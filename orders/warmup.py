@@ -0,0 +1,117 @@
+"""
+Прогрев процесса до приёма запросов.
+
+Первый запрос нового воркера платит за разбор URLconf, импорт
+представлений и сериализаторов, компиляцию шаблонов, загрузку переводов и
+построение кешей связей моделей. warmup выполняет это заранее: его
+вызывают config.wsgi и config.asgi при WARMUP_ON_STARTUP и команда warmup.
+"""
+import logging
+import time
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.template import engines
+from django.urls import get_resolver
+from django.utils import translation
+from rest_framework.settings import api_settings
+
+logger = logging.getLogger(__name__)
+
+API_SETTINGS = (
+    'DEFAULT_AUTHENTICATION_CLASSES', 'DEFAULT_PERMISSION_CLASSES',
+    'DEFAULT_FILTER_BACKENDS', 'DEFAULT_PAGINATION_CLASS',
+    'DEFAULT_RENDERER_CLASSES', 'DEFAULT_PARSER_CLASSES',
+)
+
+
+def load_urls():
+    """Разбирает URLconf и импортирует все представления."""
+    resolver = get_resolver()
+    resolver._populate()
+    return len(resolver.reverse_dict)
+
+
+def load_api():
+    """Загружает классы из REST_FRAMEWORK и поля сериализаторов."""
+    for name in API_SETTINGS:
+        getattr(api_settings, name)
+    serializers = set()
+    for callback in _callbacks(get_resolver()):
+        view = getattr(callback, 'cls', None)
+        serializer_class = getattr(view, 'serializer_class', None)
+        if serializer_class is not None:
+            serializers.add(serializer_class)
+    for serializer_class in serializers:
+        serializer_class().fields
+    return len(serializers)
+
+
+def _callbacks(resolver):
+    for pattern in resolver.url_patterns:
+        if hasattr(pattern, 'url_patterns'):
+            yield from _callbacks(pattern)
+        else:
+            yield pattern.callback
+
+
+def load_templates():
+    """Компилирует шаблоны проекта в кеш загрузчика."""
+    count = 0
+    for engine in engines.all():
+        for directory in engine.template_dirs:
+            directory = Path(directory)
+            if not directory.is_relative_to(settings.BASE_DIR):
+                continue
+            for path in directory.rglob('*.html'):
+                engine.get_template(path.relative_to(directory).as_posix())
+                count += 1
+    return count
+
+
+def load_translations():
+    translation.activate(settings.LANGUAGE_CODE)
+    translation.deactivate()
+    return 1
+
+
+def load_models():
+    """Строит кеши связей моделей, нужные запросам и удалению."""
+    models = apps.get_models()
+    for model in models:
+        model._meta.get_fields()
+    return len(models)
+
+
+STEPS = (
+    ('urls', load_urls),
+    ('api', load_api),
+    ('templates', load_templates),
+    ('translations', load_translations),
+    ('models', load_models),
+)
+
+
+def warmup():
+    """Выполняет шаги прогрева; возвращает {шаг: (количество, мс)}."""
+    report = {}
+    for name, step in STEPS:
+        started = time.perf_counter()
+        count = step()
+        report[name] = count, (time.perf_counter() - started) * 1000
+    return report
+
+
+def warmup_on_startup():
+    if not settings.WARMUP_ON_STARTUP:
+        return
+    try:
+        report = warmup()
+    except Exception:
+        # Прогрев только ускоряет первые запросы и не должен мешать запуску.
+        logger.exception('Ошибка прогрева')
+        return
+    logger.info('Прогрев: %s', ', '.join(
+        f'{name} {elapsed:.0f} мс' for name, (_, elapsed) in report.items()
+    ))